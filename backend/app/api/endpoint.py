@@ -1,5 +1,9 @@
+import os
+import uuid
 import logging
 import json
+import hashlib
+from functools import partial
 from fastapi import APIRouter, UploadFile, File as FastAPIFile, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
@@ -8,7 +12,10 @@ from core.config import settings
 from models import File, FileAnalysis, MemoryAnalysis, NetworkAnalysis, Report, Task, AnalysisTask
 from services.memory_analysis import analyze_memory_task
 from services.network_analysis import analyze_network_task
-from services.file_analysis import analyze_file, analyze_directory_task
+from services.file_analysis import analyze_file, analyze_directory_task, analyze_file_task
+from utils.security import FileSecurityValidator
+from utils.storage import save_evidence, delete_evidence
+from celery import group
 import cloudinary.uploader
 import magic
 from pydantic import BaseModel, Field
@@ -62,6 +69,32 @@ class ErrorResponse(BaseModel):
     detail: str = Field(..., description="Error message")
     code: str = Field(..., description="Error code")
 
+class BatchUploadItem(BaseModel):
+    """Per-file result of a batch upload."""
+    filename: str = Field(..., description="Original filename")
+    status: str = Field(..., description="accepted, rejected or failed")
+    file_id: Optional[int] = Field(None, description="ID of the stored file")
+    analysis_type: Optional[str] = Field(None, description="Analysis queued for the file")
+    task_id: Optional[str] = Field(None, description="ID of the queued analysis task")
+    detail: Optional[str] = Field(None, description="Reason the file was not accepted")
+
+class BatchUploadResponse(BaseModel):
+    """Response model for batch upload endpoint."""
+    message: str = Field(..., description="Status message")
+    group_id: Optional[str] = Field(None, description="ID of the grouped analysis job")
+    accepted: int = Field(..., description="Number of files accepted")
+    rejected: int = Field(..., description="Number of files rejected or failed")
+    items: List[BatchUploadItem] = Field(..., description="Status of each uploaded file")
+
+# Analysis task queued for each analysis type
+ANALYSIS_TASKS = {
+    "network_capture": analyze_network_task,
+    "memory_dump": analyze_memory_task,
+    "document": analyze_file_task,
+}
+
+security_validator = FileSecurityValidator()
+
 async def validate_file_size(file_content: bytes) -> None:
     """Validate file size before upload."""
     file_size = len(file_content)
@@ -213,6 +246,176 @@ async def upload_file(
             detail="An unexpected error occurred during file upload"
         )
 
+def resolve_analysis_type(file_type: str) -> Optional[str]:
+    """Map a MIME type to the analysis type that accepts it."""
+    for analysis_type, mime_types in settings.ALLOWED_FILE_TYPES.items():
+        if file_type in mime_types:
+            return analysis_type
+    return None
+
+def inspect_content(content: bytes) -> tuple:
+    """Detect MIME type and MD5 hash of file content."""
+    file_type = magic.from_buffer(content[:2048], mime=True)
+    return file_type, hashlib.md5(content).hexdigest()
+
+async def validate_batch_item(file: UploadFile, semaphore: asyncio.Semaphore, stored: List[str]) -> dict:
+    """Read, validate and store a single file of a batch upload, adding its path to stored."""
+    item = {"filename": file.filename, "status": "rejected"}
+    async with semaphore:
+        try:
+            # Validate file size before reading
+            if file.size is not None and file.size > settings.MAX_UPLOAD_SIZE:
+                raise ValueError(f"File size {file.size} exceeds limit of {settings.MAX_UPLOAD_SIZE}")
+            content = await file.read()
+            loop = asyncio.get_running_loop()
+            file_type, md5_hash = await loop.run_in_executor(None, inspect_content, content)
+            analysis_type = resolve_analysis_type(file_type)
+            if analysis_type is None:
+                raise ValueError(f"File type {file_type} is not allowed")
+            security_validator.validate_file_type(file_type, len(content), analysis_type)
+            safe_filename = security_validator.sanitize_filename(file.filename)
+            path = await loop.run_in_executor(None, partial(save_evidence, content, safe_filename))
+            stored.append(path)
+        except ValueError as e:
+            item["detail"] = str(e)
+            return item
+        except OSError as e:
+            logger.error(f"Failed to store {file.filename}: {str(e)}")
+            item.update(status="failed", detail="Failed to store file")
+            return item
+        except Exception as e:
+            logger.error(f"Failed to process {file.filename}: {str(e)}")
+            item.update(status="failed", detail="Failed to process file")
+            return item
+        finally:
+            await file.close()
+
+    item.update(
+        status="accepted",
+        safe_filename=safe_filename,
+        path=path,
+        file_type=file_type,
+        size=len(content),
+        md5_hash=md5_hash,
+        analysis_type=analysis_type
+    )
+    return item
+
+@router.post(
+    "/upload/batch",
+    response_model=BatchUploadResponse,
+    dependencies=[Depends(RateLimiter(times=settings.UPLOAD_RATE_LIMIT_TIMES,
+                                    seconds=settings.UPLOAD_RATE_LIMIT_SECONDS))],
+    responses={
+        400: {"model": ErrorResponse, "description": "Bad request"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        429: {"model": ErrorResponse, "description": "Too many requests"},
+        500: {"model": ErrorResponse, "description": "Internal server error"}
+    }
+)
+async def upload_batch(
+    files: List[UploadFile] = FastAPIFile(...),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> BatchUploadResponse:
+    """
+    Upload many files for forensic analysis in a single request.
+
+    Files are validated and stored concurrently, all accepted files are
+    recorded in one transaction and their analyses are queued as a single
+    Celery group. Invalid files are reported per item and do not fail
+    the batch.
+
+    Args:
+        files: The files to upload
+        current_user: Current authenticated user
+        db: Database session
+
+    Returns:
+        BatchUploadResponse with the status of every file
+
+    Raises:
+        FileValidationError: If the batch exceeds MAX_BATCH_UPLOAD_FILES
+        FileAnalysisError: If the file records cannot be saved
+    """
+    if len(files) > settings.MAX_BATCH_UPLOAD_FILES:
+        raise FileValidationError(
+            f"Batch of {len(files)} files exceeds limit of {settings.MAX_BATCH_UPLOAD_FILES}"
+        )
+
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_UPLOADS)
+    stored: List[str] = []
+    try:
+        items = await asyncio.gather(*(validate_batch_item(f, semaphore, stored) for f in files))
+    except (Exception, asyncio.CancelledError):
+        # No file of the batch gets recorded, so none may stay in storage
+        for path in stored:
+            delete_evidence(path)
+        raise
+    accepted = [item for item in items if item["status"] == "accepted"]
+
+    group_id = None
+    if accepted:
+        signatures = []
+        try:
+            db_files = [
+                File(
+                    filename=item["safe_filename"],
+                    filepath=item["path"],
+                    file_type=item["file_type"],
+                    size=item["size"],
+                    md5_hash=item["md5_hash"],
+                    analysis_status=AnalysisStatus.PENDING,
+                    user_id=current_user.id
+                )
+                for item in accepted
+            ]
+            db.add_all(db_files)
+            db.flush()
+
+            for item, db_file in zip(accepted, db_files):
+                task_id = str(uuid.uuid4())
+                task = ANALYSIS_TASKS[item["analysis_type"]]
+                signatures.append(task.s(db_file.filepath, db_file.id).set(task_id=task_id))
+                db.add(Task(
+                    file_id=db_file.id,
+                    task_type=item["analysis_type"],
+                    status=AnalysisStatus.PENDING,
+                    parameters={"celery_task_id": task_id}
+                ))
+                item.update(file_id=db_file.id, task_id=task_id)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for item in accepted:
+                delete_evidence(item["path"])
+            logger.error(f"Database operation failed: {str(e)}")
+            raise FileAnalysisError(f"Failed to save file records: {str(e)}")
+
+        try:
+            group_id = group(signatures).apply_async().id
+        except Exception as e:
+            logger.error(f"Failed to queue batch analysis: {str(e)}")
+            db.query(File).filter(
+                File.id.in_([item["file_id"] for item in accepted])
+            ).update({File.analysis_status: AnalysisStatus.FAILED}, synchronize_session=False)
+            db.commit()
+            for item in accepted:
+                item.update(status="failed", detail="Failed to queue analysis")
+
+    results = [
+        BatchUploadItem(**{k: v for k, v in item.items() if k in BatchUploadItem.model_fields})
+        for item in items
+    ]
+    accepted_count = sum(1 for r in results if r.status == "accepted")
+    return BatchUploadResponse(
+        message=f"{accepted_count} of {len(results)} files uploaded and queued for analysis",
+        group_id=group_id,
+        accepted=accepted_count,
+        rejected=len(results) - accepted_count,
+        items=results
+    )
+
 # Directory analysis endpoint
 @router.post("/analyze-directory")
 async def analyze_directory(directory_path: str, db: Session = Depends(get_db)):
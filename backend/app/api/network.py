@@ -1,16 +1,51 @@
-from fastapi import APIRouter, Depends, WebSocket, HTTPException
+import os
+import math
+import logging
+from fastapi import APIRouter, Depends, WebSocket, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from core.db import get_db
-from core.auth import get_current_user
+from core.config import settings
+from core.auth import get_current_user, TokenData
+from models.network_analysis import NetworkAnalysis
+from models.file import File
+from models.network_flow import NetworkFlow
+from models.network_artifact import NetworkArtifact
 from services.network_topology import NetworkTopologyService
+from services.graph_analytics import TopologyGraph, CENTRALITY_METRICS, NEIGHBORHOOD_DIRECTIONS
+from services.graph_queries import GraphIndex
+from services.topology_levels import HIERARCHIES
+from services.packet_store import PacketStore, PacketStoreError, COLUMNS, packet_store_path
+from services.sketches import SKETCHES_FILENAME, load_sketches, merge_sketches
+from services.network_analysis import describe_sketches, follow_network_task
+from services.enrichment import enrich_ips
+from services.artifacts import ARTIFACT_TYPES, MATCH_MODES, artifact_match
+from services.capture_index import CaptureIndex, capture_index_path
+from services.pcap_reader import PcapReader, CaptureFormatError, pack_ip
+from services.pcap_export import MEDIA_TYPES, iter_capture_slice
+from utils.analysis_storage import get_analysis_dir
 from schemas.network import (
     NetworkTopologyResponse,
     NetworkMetrics,
-    NetworkNodeResponse,
-    NetworkConnectionResponse
+    NetworkFlowPage,
+    PacketPage,
+    HeavyHittersResponse,
+    ArtifactSearchPage,
+    RawPacketWindow,
+    FollowCaptureRequest,
+    FollowCaptureResponse,
+    TopologyLevelResponse,
+    GraphCentralityResponse,
+    GraphGroupsResponse,
+    GraphNeighborhoodResponse,
+    GraphPathResponse,
+    GraphReachableResponse,
+    GraphSharedPeersResponse
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1/network", tags=["network"])
 
 network_service = NetworkTopologyService()
@@ -32,18 +67,7 @@ async def get_network_topology(
             raise HTTPException(status_code=404, detail="Analysis not found")
             
         # Get topology
-        nodes = db.query(NetworkNode).filter(
-            NetworkNode.analysis_id == analysis_id
-        ).all()
-        
-        connections = db.query(NetworkConnection).filter(
-            NetworkConnection.source_node.has(analysis_id=analysis_id)
-        ).all()
-        
-        return NetworkTopologyResponse(
-            nodes=[NetworkNodeResponse.from_orm(node) for node in nodes],
-            connections=[NetworkConnectionResponse.from_orm(conn) for conn in connections]
-        )
+        return network_service.get_topology(db, analysis_id)
         
     except HTTPException:
         raise
@@ -54,6 +78,42 @@ async def get_network_topology(
             detail="Failed to retrieve network topology"
         )
 
+@router.get("/topology/{analysis_id}/levels", response_model=TopologyLevelResponse)
+def get_topology_level(
+    analysis_id: int,
+    hierarchy: str = Query("subnet", enum=list(HIERARCHIES)),
+    group: Optional[str] = Query(None, description="Super-node to expand, e.g. 10.1.0.0/16; omit for the top level"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Level-of-detail topology: super-nodes grouped by subnet or community
+    with aggregated edges, expanded one group at a time.
+    """
+    try:
+        analysis = db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        levels = network_service.get_topology_levels(analysis_id)
+        return levels.expand(hierarchy, group) if group else levels.top(hierarchy)
+
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No topology levels stored for this analysis")
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Group not found")
+    except Exception as e:
+        logger.error(f"Failed to get topology level: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to retrieve topology level"
+        )
+
 @router.websocket("/ws/{analysis_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -67,7 +127,7 @@ async def websocket_endpoint(
         user = await get_current_user(token)
         
         # Start streaming
-        await network_service.stream_network_data(websocket, analysis_id)
+        await network_service.stream_network_data(websocket, analysis_id, db)
         
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
@@ -79,13 +139,640 @@ async def get_network_metrics(
     current_user: TokenData = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get aggregated network metrics."""
+    """Get aggregated network metrics, live while a capture is being followed."""
     try:
-        metrics = await network_service._get_network_metrics(analysis_id)
+        metrics = await network_service._get_network_metrics(analysis_id, db)
+        if metrics is None:
+            raise HTTPException(status_code=404, detail="No metrics recorded for this analysis")
         return metrics
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to get network metrics: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail="Failed to retrieve network metrics"
-        ) 
\ No newline at end of file
+        )
+
+def _analysis_graph(db: Session, analysis_id: int) -> TopologyGraph:
+    analysis = db.query(NetworkAnalysis).filter(
+        NetworkAnalysis.id == analysis_id
+    ).first()
+
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return network_service.get_graph(db, analysis_id)
+
+@router.get("/graph/{analysis_id}/centrality", response_model=GraphCentralityResponse)
+def get_graph_centrality(
+    analysis_id: int,
+    metric: str = Query("degree", enum=list(CENTRALITY_METRICS)),
+    limit: int = Query(25, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Most central hosts of the topology. Betweenness is sampled on large graphs."""
+    try:
+        graph = _analysis_graph(db, analysis_id)
+        return {
+            "metric": metric,
+            "approximate": metric == "betweenness" and graph.approximate,
+            "nodes": graph.top(metric, limit)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to compute graph centrality: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute graph centrality"
+        )
+
+@router.get("/graph/{analysis_id}/components", response_model=GraphGroupsResponse)
+def get_graph_components(
+    analysis_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Weakly connected components of the topology, largest first."""
+    try:
+        components = _analysis_graph(db, analysis_id).components()
+        return {"total": len(components), "groups": components[:limit]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to compute graph components: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute graph components"
+        )
+
+@router.get("/graph/{analysis_id}/communities", response_model=GraphGroupsResponse)
+def get_graph_communities(
+    analysis_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Communities of hosts that mostly talk among themselves, largest first."""
+    try:
+        graph = _analysis_graph(db, analysis_id)
+        communities = graph.communities()
+        return {"total": len(communities), "approximate": graph.approximate, "groups": communities[:limit]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to compute graph communities: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute graph communities"
+        )
+
+@router.get("/graph/{analysis_id}/neighborhood/{node_id}", response_model=GraphNeighborhoodResponse)
+def get_graph_neighborhood(
+    analysis_id: int,
+    node_id: str,
+    hops: int = Query(1, ge=1, le=5),
+    direction: str = Query("both", enum=list(NEIGHBORHOOD_DIRECTIONS),
+                           description="out: hosts node_id reaches, in: hosts reaching node_id"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Hosts within a number of hops of a node and the edges between them."""
+    try:
+        neighborhood = _analysis_graph(db, analysis_id).neighborhood(node_id, hops, direction)
+        return {"node": node_id, "hops": hops, "direction": direction, **neighborhood}
+
+    except HTTPException:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    except Exception as e:
+        logger.error(f"Failed to compute graph neighborhood: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute graph neighborhood"
+        )
+
+def _graph_index(db: Session, analysis_id: int) -> GraphIndex:
+    analysis = db.query(NetworkAnalysis).filter(
+        NetworkAnalysis.id == analysis_id
+    ).first()
+
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    try:
+        return network_service.get_graph_index(analysis_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No graph index stored for this analysis")
+
+@router.get("/graph/{analysis_id}/path", response_model=GraphPathResponse)
+def get_graph_path(
+    analysis_id: int,
+    source: str = Query(..., description="Node id the path starts at"),
+    target: str = Query(..., description="Node id the path ends at"),
+    direction: str = Query("out", enum=list(NEIGHBORHOOD_DIRECTIONS),
+                           description="out: follow connections as initiated, both: ignore direction"),
+    max_hops: Optional[int] = Query(None, ge=1),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Fewest-hop path between two hosts: how could source reach target."""
+    try:
+        path = _graph_index(db, analysis_id).shortest_path(source, target, direction, max_hops)
+        return {"source": source, "target": target, "found": path is not None, **(path or {})}
+
+    except HTTPException:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    except Exception as e:
+        logger.error(f"Failed to compute graph path: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute graph path"
+        )
+
+@router.get("/graph/{analysis_id}/temporal-path", response_model=GraphPathResponse)
+def get_graph_temporal_path(
+    analysis_id: int,
+    source: str = Query(..., description="Node id the path starts at"),
+    target: str = Query(..., description="Node id the path ends at"),
+    start: Optional[float] = Query(None, description="Earliest time of the first hop (epoch seconds)"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Earliest-arriving path whose connections happen in order, e.g. how a
+    compromise of source could have spread to target.
+    """
+    try:
+        path = _graph_index(db, analysis_id).temporal_path(source, target, start)
+        return {"source": source, "target": target, "found": path is not None, **(path or {})}
+
+    except HTTPException:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    except Exception as e:
+        logger.error(f"Failed to compute temporal path: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute temporal path"
+        )
+
+@router.get("/graph/{analysis_id}/reachable/{node_id}", response_model=GraphReachableResponse)
+def get_graph_reachable(
+    analysis_id: int,
+    node_id: str,
+    hops: int = Query(3, ge=1, le=10),
+    direction: str = Query("out", enum=list(NEIGHBORHOOD_DIRECTIONS),
+                           description="out: hosts node_id reaches, in: hosts reaching node_id"),
+    limit: int = Query(1000, ge=1, le=100000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Hosts within a number of hops of a node, nearest first."""
+    try:
+        reached = _graph_index(db, analysis_id).reachable(node_id, hops, direction)
+        return {"node": node_id, "hops": hops, "direction": direction, "total": len(reached), "nodes": reached[:limit]}
+
+    except HTTPException:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    except Exception as e:
+        logger.error(f"Failed to compute reachable hosts: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute reachable hosts"
+        )
+
+@router.get("/graph/{analysis_id}/shared-peers/{node_id}", response_model=GraphSharedPeersResponse)
+def get_graph_shared_peers(
+    analysis_id: int,
+    node_id: str,
+    max_degree: int = Query(5, ge=1, description="Peers talking to at most this many hosts count as rare"),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Hosts that talk to the same rare peers as a node."""
+    try:
+        shared = _graph_index(db, analysis_id).shared_peers(node_id, max_degree, limit)
+        return {"node": node_id, "max_degree": max_degree, **shared}
+
+    except HTTPException:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    except Exception as e:
+        logger.error(f"Failed to compute shared peers: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to compute shared peers"
+        )
+
+FLOW_SORT_COLUMNS = {
+    "bytes": NetworkFlow.total_bytes,
+    "packets": NetworkFlow.total_packets,
+    "first_seen": NetworkFlow.first_seen,
+    "last_seen": NetworkFlow.last_seen,
+    "duration": NetworkFlow.duration
+}
+
+@router.get("/flows/{analysis_id}", response_model=NetworkFlowPage)
+async def get_network_flows(
+    analysis_id: int,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=1000),
+    sort_by: str = Query("bytes", enum=list(FLOW_SORT_COLUMNS)),
+    order: str = Query("desc", enum=["asc", "desc"]),
+    ip: Optional[str] = Query(None, description="Only flows where either endpoint has this address"),
+    port: Optional[int] = Query(None, ge=0, le=65535),
+    protocol: Optional[int] = Query(None, ge=0, le=255),
+    flagged: Optional[bool] = Query(None, description="Only flows that did (or did not) match a threat-intel indicator"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List aggregated sessions of an analysis with pagination and sorting."""
+    try:
+        analysis = db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        query = db.query(NetworkFlow).filter(NetworkFlow.analysis_id == analysis_id)
+        if ip:
+            query = query.filter((NetworkFlow.src_ip == ip) | (NetworkFlow.dst_ip == ip))
+        if port is not None:
+            query = query.filter((NetworkFlow.src_port == port) | (NetworkFlow.dst_port == port))
+        if protocol is not None:
+            query = query.filter(NetworkFlow.protocol == protocol)
+        if flagged is not None:
+            query = query.filter(NetworkFlow.indicator_count > 0 if flagged else NetworkFlow.indicator_count == 0)
+
+        column = FLOW_SORT_COLUMNS[sort_by]
+        query = query.order_by(column.desc() if order == "desc" else column, NetworkFlow.id)
+
+        total = query.count()
+        items = query.offset((page - 1) * limit).limit(limit).all()
+
+        return {
+            "items": items,
+            "total": total,
+            "page": page,
+            "pages": math.ceil(total / limit)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get network flows: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to retrieve network flows"
+        )
+
+PACKET_SORT_COLUMNS = [name for name in COLUMNS if name not in ("src_ip", "dst_ip")]
+
+@router.get("/packets/{analysis_id}", response_model=PacketPage)
+def get_packets(
+    analysis_id: int,
+    columns: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    sort_by: Optional[str] = Query(None, enum=PACKET_SORT_COLUMNS),
+    order: str = Query("asc", enum=["asc", "desc"]),
+    ip: Optional[str] = Query(None, description="Only packets where either endpoint has this address"),
+    port: Optional[int] = Query(None, ge=0, le=65535),
+    protocol: Optional[int] = Query(None, ge=0, le=255),
+    dns_query: Optional[str] = None,
+    http_method: Optional[str] = None,
+    start: Optional[float] = Query(None, description="Earliest timestamp (epoch seconds)"),
+    end: Optional[float] = Query(None, description="Latest timestamp (epoch seconds)"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Query the packet table of an analysis with projection, filters, sorting and pagination."""
+    try:
+        analysis = db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        if ip is not None:
+            try:
+                pack_ip(ip)
+            except OSError:
+                raise HTTPException(status_code=400, detail=f"Invalid IP address: {ip}")
+        projection = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+        filters = {
+            "ip": ip,
+            "port": port,
+            "protocol": protocol,
+            "dns_query": dns_query,
+            "http_method": http_method,
+            "start": start,
+            "end": end
+        }
+        path = packet_store_path(get_analysis_dir(analysis_id, create=False))
+        with PacketStore(path) as store:
+            result = store.query(
+                columns=projection,
+                filters=filters,
+                sort_by=sort_by,
+                descending=order == "desc",
+                offset=(page - 1) * limit,
+                limit=limit
+            )
+
+        return {
+            "items": result["items"],
+            "total": result["total"],
+            "page": page,
+            "pages": math.ceil(result["total"] / limit)
+        }
+
+    except HTTPException:
+        raise
+    except PacketStoreError:
+        raise HTTPException(status_code=404, detail="Packet data not available for this analysis")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to query packets: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to query packets"
+        )
+
+@router.get("/packets/{analysis_id}/raw", response_model=RawPacketWindow)
+def get_raw_packets(
+    analysis_id: int,
+    first: Optional[int] = Query(None, ge=0, description="Number of the first packet (0-based)"),
+    start: Optional[float] = Query(None, description="Earliest timestamp (epoch seconds)"),
+    end: Optional[float] = Query(None, description="Latest timestamp (epoch seconds)"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Read raw frames from the stored capture, either by packet number or
+    by time window. The capture index is used to seek to the right
+    region, so only the requested window is read.
+    """
+    if (first is None) == (start is None and end is None):
+        raise HTTPException(status_code=400, detail="Specify either first or a start/end window")
+    try:
+        analysis = db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+
+        if not analysis or not analysis.file or not analysis.file.filepath:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        path = capture_index_path(get_analysis_dir(analysis_id, create=False))
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="No capture index stored for this analysis")
+        index = CaptureIndex(path)
+
+        items = []
+        truncated = False
+        with PcapReader(analysis.file.filepath) as reader:
+            if first is not None:
+                windows = index.iter_packets(reader, first, limit)
+            else:
+                windows = index.iter_time_range(
+                    reader,
+                    float("-inf") if start is None else start,
+                    float("inf") if end is None else end
+                )
+            for numbers, packets in windows:
+                for number, pkt in zip(numbers.tolist(), packets):
+                    if len(items) == limit:
+                        truncated = True
+                        break
+                    data = reader.record_bytes(int(pkt["offset"]) + int(pkt["data_offset"]), int(pkt["caplen"]))
+                    items.append({
+                        "number": number,
+                        "timestamp": float(pkt["ts"]),
+                        "length": int(pkt["length"]),
+                        "caplen": int(pkt["caplen"]),
+                        "data": bytes(data).hex()
+                    })
+                if truncated:
+                    break
+
+        return {"items": items, "truncated": truncated}
+
+    except HTTPException:
+        raise
+    except (CaptureFormatError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Capture not available for this analysis")
+    except Exception as e:
+        logger.error(f"Failed to read raw packets: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to read raw packets"
+        )
+
+@router.get("/export/{analysis_id}")
+def export_capture_slice(
+    analysis_id: int,
+    start: Optional[float] = Query(None, description="Earliest timestamp (epoch seconds)"),
+    end: Optional[float] = Query(None, description="Latest timestamp (epoch seconds)"),
+    ip: Optional[str] = Query(None, description="Only packets where either endpoint has this address"),
+    port: Optional[int] = Query(None, ge=0, le=65535),
+    protocol: Optional[int] = Query(None, ge=0, le=255),
+    flow_id: Optional[int] = Query(None, description="Only packets of this flow, in both directions"),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Download the packets of a time window (optionally one flow or host)
+    as a new capture in the source format. Records are copied verbatim
+    and streamed as they are found.
+    """
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    try:
+        analysis = db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+
+        if not analysis or not analysis.file or not analysis.file.filepath:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        if ip is not None:
+            try:
+                pack_ip(ip)
+            except OSError:
+                raise HTTPException(status_code=400, detail=f"Invalid IP address: {ip}")
+        filters = {"ip": ip, "port": port, "protocol": protocol}
+        if flow_id is not None:
+            flow = db.query(NetworkFlow).filter(
+                NetworkFlow.id == flow_id,
+                NetworkFlow.analysis_id == analysis_id
+            ).first()
+            if not flow:
+                raise HTTPException(status_code=404, detail="Flow not found")
+            filters["flow"] = (flow.src_ip, flow.dst_ip, flow.src_port, flow.dst_port, flow.protocol)
+
+        pcap_file = analysis.file.filepath
+        with PcapReader(pcap_file) as reader:
+            capture_format = reader.format
+        path = capture_index_path(get_analysis_dir(analysis_id, create=False))
+        index = CaptureIndex(path) if os.path.exists(path) else None
+
+    except HTTPException:
+        raise
+    except (CaptureFormatError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Capture not available for this analysis")
+    except Exception as e:
+        logger.error(f"Failed to export capture slice: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to export capture slice"
+        )
+
+    filename = f"analysis_{analysis_id}_slice.{capture_format}"
+    return StreamingResponse(
+        iter_capture_slice(pcap_file, start=start, end=end, filters=filters, index=index),
+        media_type=MEDIA_TYPES[capture_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/follow", response_model=FollowCaptureResponse)
+def follow_capture(
+    request: FollowCaptureRequest,
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start analyzing a capture that a sensor is still writing to the shared
+    capture directory. Metric deltas are streamed on /ws/{analysis_id}
+    while the file grows.
+    """
+    root = os.path.realpath(settings.NETWORK_FOLLOW_DIR)
+    pcap_file = os.path.realpath(os.path.join(root, request.path))
+    if os.path.commonpath([root, pcap_file]) != root:
+        raise HTTPException(status_code=400, detail="Path must be inside the sensor capture directory")
+    if not os.path.isfile(pcap_file):
+        raise HTTPException(status_code=404, detail="Capture not found")
+    try:
+        db_file = File(
+            filename=os.path.basename(pcap_file),
+            filepath=pcap_file,
+            file_type="network_capture",
+            size=os.path.getsize(pcap_file),
+            user_id=current_user.id
+        )
+        db.add(db_file)
+        db.commit()
+        db.refresh(db_file)
+
+        task = follow_network_task.delay(pcap_file, db_file.id)
+        return {"file_id": db_file.id, "task_id": task.id}
+
+    except Exception as e:
+        logger.error(f"Failed to start following capture: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to start following capture"
+        )
+
+@router.get("/heavy-hitters", response_model=HeavyHittersResponse)
+def get_heavy_hitters(
+    analysis_ids: str = Query(..., description="Comma-separated analysis ids to combine"),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Top talkers, ports, conversations and DNS names plus distinct IPs across one or more captures."""
+    try:
+        ids = [int(value) for value in analysis_ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="analysis_ids must be integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="analysis_ids must name at least one analysis")
+
+    try:
+        found = db.query(NetworkAnalysis.id).filter(NetworkAnalysis.id.in_(ids)).all()
+        if len(found) != len(set(ids)):
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+        groups = []
+        for analysis_id in ids:
+            path = os.path.join(get_analysis_dir(analysis_id, create=False), SKETCHES_FILENAME)
+            if not os.path.exists(path):
+                raise HTTPException(status_code=404, detail=f"No sketches stored for analysis {analysis_id}")
+            groups.append(load_sketches(path))
+
+        described = describe_sketches(merge_sketches(groups), limit=limit)
+        addresses = {ip for pair in described["top_conversations"] for ip in (pair["src_ip"], pair["dst_ip"])}
+        addresses.update(talker["ip"] for talker in described["top_talkers"])
+        return {"analysis_ids": ids, **described, "enrichment": enrich_ips(sorted(addresses))}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get heavy hitters: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to retrieve heavy hitters"
+        )
+
+@router.get("/artifacts/search", response_model=ArtifactSearchPage)
+def search_artifacts(
+    q: str = Query(..., min_length=1, max_length=1024, description="Artifact value, e.g. a domain name"),
+    match: str = Query("exact", enum=list(MATCH_MODES), description="suffix matches a domain and its subdomains"),
+    artifact_type: Optional[str] = Query(None, enum=list(ARTIFACT_TYPES)),
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Find DNS names, HTTP hosts/URIs and TLS server names across all of the user's captures."""
+    try:
+        query = db.query(NetworkArtifact).join(
+            NetworkAnalysis, NetworkArtifact.analysis_id == NetworkAnalysis.id
+        ).join(
+            File, NetworkAnalysis.file_id == File.id
+        ).filter(
+            File.user_id == current_user.id,
+            artifact_match(q, match)
+        )
+        if artifact_type:
+            query = query.filter(NetworkArtifact.artifact_type == artifact_type)
+
+        total = query.count()
+        analysis_ids = [
+            row[0] for row in query.with_entities(NetworkArtifact.analysis_id).distinct().order_by(NetworkArtifact.analysis_id)
+        ]
+        items = query.order_by(NetworkArtifact.first_seen, NetworkArtifact.id).offset((page - 1) * limit).limit(limit).all()
+
+        return {
+            "items": items,
+            "analysis_ids": analysis_ids,
+            "total": total,
+            "page": page,
+            "pages": math.ceil(total / limit)
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to search artifacts: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to search artifacts"
+        )
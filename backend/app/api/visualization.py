@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -5,12 +6,15 @@ from datetime import datetime
 from core.db import get_db
 from core.auth import get_current_user, TokenData
 from services.visualization import VisualizationService
+from services.timeseries import TimeSeriesError
 from schemas.visualization import (
     GraphVisualizationResponse,
     TimeSeriesDataResponse,
     SearchResult
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1/visualization", tags=["visualization"])
 
 @router.get("/graph/{analysis_id}", response_model=GraphVisualizationResponse)
@@ -25,27 +29,37 @@ async def get_graph_data(
     return service.get_graph_data(analysis_id, graph_type)
 
 @router.get("/timeseries/{analysis_id}", response_model=TimeSeriesDataResponse)
-async def get_timeseries_data(
+def get_timeseries_data(
     analysis_id: int,
-    metric: str = Query(..., description="Metric to visualize"),
+    metric: str = Query(..., description="bytes, packets, flows, protocol:<number> or host:<ip>"),
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
+    max_points: int = Query(1000, ge=1, le=10000, description="Maximum number of points returned"),
     current_user: TokenData = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get time series data for visualizations."""
+    """Get time series data for visualizations at the finest resolution fitting max_points."""
     try:
-        data = await visualization_service.generate_timeseries_data(
+        service = VisualizationService(db)
+        data = service.generate_timeseries_data(
             analysis_id,
             metric,
             start_time,
             end_time,
-            db
+            max_points
         )
+        if data is None:
+            raise HTTPException(status_code=404, detail="Network analysis not found")
         return data
+    except HTTPException:
+        raise
+    except TimeSeriesError:
+        raise HTTPException(status_code=404, detail="No time series stored for this analysis")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to generate time series data: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail="Failed to generate time series data"
-        ) 
\ No newline at end of file
+        )
@@ -74,6 +74,60 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = Field(default="./uploads", env="UPLOAD_DIR")
     MAX_UPLOAD_SIZE: int = Field(default=10_485_760, env="MAX_UPLOAD_SIZE")
     
+    # Derived analysis data (packet tables, indexes, series)
+    ANALYSIS_DATA_DIR: str = Field(default="./analysis_data", env="ANALYSIS_DATA_DIR")
+    PACKET_BATCH_SIZE: int = Field(default=10_000, env="PACKET_BATCH_SIZE")
+    NETWORK_DEEP_DISSECTION: bool = Field(default=False, env="NETWORK_DEEP_DISSECTION")
+    NETWORK_ANALYSIS_WORKERS: int = Field(default=4, env="NETWORK_ANALYSIS_WORKERS")
+    NETWORK_SHARD_MIN_SIZE: int = Field(default=268_435_456, env="NETWORK_SHARD_MIN_SIZE")
+    SKETCH_CAPACITY: int = Field(default=1024, env="SKETCH_CAPACITY")
+    TIMESERIES_TOP_HOSTS: int = Field(default=16, env="TIMESERIES_TOP_HOSTS")
+    CAPTURE_INDEX_INTERVAL: int = Field(default=1024, env="CAPTURE_INDEX_INTERVAL")
+
+    # Follow mode: captures still being written by sensors on a shared volume
+    NETWORK_FOLLOW_DIR: str = Field(default="./sensor_captures", env="NETWORK_FOLLOW_DIR")
+    NETWORK_FOLLOW_POLL_INTERVAL: float = Field(default=1.0, env="NETWORK_FOLLOW_POLL_INTERVAL")
+    NETWORK_FOLLOW_IDLE_TIMEOUT: int = Field(default=300, env="NETWORK_FOLLOW_IDLE_TIMEOUT")
+
+    # Network metrics: connections are active if their flow saw a packet
+    # within NETWORK_ACTIVE_WINDOW seconds of the newest one. Metrics are
+    # kept in Redis for NETWORK_METRICS_REDIS_TTL seconds and in each API
+    # worker for NETWORK_METRICS_CACHE_TTL seconds
+    NETWORK_ACTIVE_WINDOW: int = Field(default=60, env="NETWORK_ACTIVE_WINDOW")
+    NETWORK_METRICS_REDIS_TTL: int = Field(default=86400, env="NETWORK_METRICS_REDIS_TTL")
+    NETWORK_METRICS_CACHE_TTL: float = Field(default=1.0, env="NETWORK_METRICS_CACHE_TTL")
+
+    # Threat-intel IP/CIDR lists flows are tagged against, one file per set
+    INDICATOR_DIR: str = Field(default="./indicators", env="INDICATOR_DIR")
+
+    # Local IP range dataset (ASN/owner/geo CSV); enrichment is off when unset
+    IP_ENRICHMENT_DB: str = Field(default="", env="IP_ENRICHMENT_DB")
+
+    # Channels need this many connections to be scored as beacon candidates
+    BEACON_MIN_CONNECTIONS: int = Field(default=6, env="BEACON_MIN_CONNECTIONS")
+
+    # Topology graph analytics: graphs above GRAPH_EXACT_NODES nodes get
+    # sampled betweenness; each worker keeps GRAPH_CACHE_SIZE graphs
+    GRAPH_EXACT_NODES: int = Field(default=2000, env="GRAPH_EXACT_NODES")
+    GRAPH_BETWEENNESS_SAMPLES: int = Field(default=256, env="GRAPH_BETWEENNESS_SAMPLES")
+    GRAPH_CACHE_SIZE: int = Field(default=8, env="GRAPH_CACHE_SIZE")
+
+    # Server-side topology layout: positions are stored and published
+    # every LAYOUT_PUBLISH_INTERVAL of LAYOUT_ITERATIONS iterations
+    LAYOUT_ITERATIONS: int = Field(default=100, env="LAYOUT_ITERATIONS")
+    LAYOUT_PUBLISH_INTERVAL: int = Field(default=25, env="LAYOUT_PUBLISH_INTERVAL")
+
+    # Passive DNS: hostnames seen by other analyses name a node when their
+    # validity window, widened by this many seconds, overlaps the capture
+    PASSIVE_DNS_VALIDITY: int = Field(default=86400, env="PASSIVE_DNS_VALIDITY")
+
+    # Evidence storage compression
+    EVIDENCE_COMPRESSION: bool = Field(default=True, env="EVIDENCE_COMPRESSION")
+    EVIDENCE_COMPRESSION_MIN_SIZE: int = Field(default=1_048_576, env="EVIDENCE_COMPRESSION_MIN_SIZE")
+    EVIDENCE_COMPRESSION_LEVEL: int = Field(default=6, env="EVIDENCE_COMPRESSION_LEVEL")
+    EVIDENCE_FRAME_SIZE: int = Field(default=1_048_576, env="EVIDENCE_FRAME_SIZE")
+    EVIDENCE_CACHE_FRAMES: int = Field(default=16, env="EVIDENCE_CACHE_FRAMES")
+
     # Redis
     REDIS_URL: str = Field(
         default="redis://localhost:6379/0",
@@ -178,6 +232,7 @@ class Settings(BaseSettings):
     # Security settings
     RATE_LIMIT_PER_MINUTE: int = Field(default=10, env="RATE_LIMIT_PER_MINUTE")
     MAX_CONCURRENT_UPLOADS: int = Field(default=5, env="MAX_CONCURRENT_UPLOADS")
+    MAX_BATCH_UPLOAD_FILES: int = Field(default=500, env="MAX_BATCH_UPLOAD_FILES")
 
     # Rate limiting settings
     UPLOAD_RATE_LIMIT_TIMES: int = Field(
@@ -25,7 +25,7 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from core.logging_config import setup_logging
 from api.filesystem import router as filesystem_router
-from api import visualization, search
+from api import visualization, search, network
 from core.websocket import websocket_manager
 from core.error_handler import global_exception_handler
 from api import realtime
@@ -141,6 +141,7 @@ app.include_router(filesystem_router)
 # Add new routers
 app.include_router(visualization.router)
 app.include_router(search.router)
+app.include_router(network.router)
 
 # WebSocket connection manager
 app.websocket_manager = websocket_manager
@@ -7,10 +7,16 @@ from .log import Log
 from .analysis import AnalysisTask
 from .memory_analysis import MemoryAnalysis
 from .network_analysis import NetworkAnalysis
+from .network_flow import NetworkFlow
+from .network_artifact import NetworkArtifact
+from .passive_dns import PassiveDnsRecord
+from .network import NetworkNode, NetworkConnection
 from .file_analysis import FileAnalysis
 from .report import Report
 from .task import Task
-from .user import User
+from .user import User, Role, Permission
+from .case import Case, Evidence, CaseNote, CaseTag
+from .audit import AuditLog
 
 __all__ = [
     "Base",
@@ -18,9 +24,21 @@ __all__ = [
     "Log",
     "MemoryAnalysis",
     "NetworkAnalysis",
+    "NetworkFlow",
+    "NetworkArtifact",
+    "PassiveDnsRecord",
+    "NetworkNode",
+    "NetworkConnection",
     "FileAnalysis",
     "Report",
     "Task",
     "AnalysisTask",
-    "User"
+    "User",
+    "Role",
+    "Permission",
+    "Case",
+    "Evidence",
+    "CaseNote",
+    "CaseTag",
+    "AuditLog"
 ]
\ No newline at end of file
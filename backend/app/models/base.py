@@ -1,5 +1,3 @@
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import MetaData
-
-# Create base class for SQLAlchemy models
-Base = declarative_base(metadata=MetaData()) 
\ No newline at end of file
+# All models share the declarative base of core.base, so relationships
+# and foreign keys between them resolve in one registry and metadata
+from core.base import Base 
\ No newline at end of file
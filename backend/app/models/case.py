@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table, Enum, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table, Enum, Text, JSON
 from sqlalchemy.orm import relationship
 from core.base import Base
 from datetime import datetime
@@ -27,4 +27,5 @@ class File(Base):
     network_analyses = relationship("NetworkAnalysis", back_populates="file", cascade="all, delete-orphan")
     file_analyses = relationship("FileAnalysis", back_populates="file", cascade="all, delete-orphan")
     reports = relationship("Report", back_populates="file", cascade="all, delete-orphan")
-    tasks = relationship("Task", back_populates="file", cascade="all, delete-orphan") 
\ No newline at end of file
+    tasks = relationship("Task", back_populates="file", cascade="all, delete-orphan")
+    logs = relationship("Log", back_populates="file") 
\ No newline at end of file
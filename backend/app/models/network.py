@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Float, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, Float, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
-from core.base import Base
+from .base import Base
 from datetime import datetime
 from enum import Enum as PyEnum
 
@@ -25,29 +25,44 @@ class NetworkNode(Base):
     __tablename__ = "network_nodes"
     
     id = Column(Integer, primary_key=True)
-    node_id = Column(String, unique=True, index=True)
+    node_id = Column(String, nullable=False)  # Address; unique per analysis
     label = Column(String, nullable=False)
     type = Column(Enum(NodeType))
     status = Column(Enum(NodeStatus))
     ip_address = Column(String)
     last_seen = Column(DateTime, default=datetime.utcnow)
-    metadata = Column(JSON)
-    analysis_id = Column(Integer, ForeignKey("network_analyses.id"))
+    node_metadata = Column("metadata", JSON)  # "metadata" is reserved on declarative models
+    coordinates = Column(JSON)  # [x, y] in the unit square, from the server-side layout
+    analysis_id = Column(Integer, ForeignKey("network_analyses.id"), nullable=False)
 
-    connections = relationship("NetworkConnection", back_populates="source_node")
+    analysis = relationship("NetworkAnalysis", back_populates="nodes")
+    connections = relationship("NetworkConnection", back_populates="source_node", foreign_keys="NetworkConnection.source_id")
+
+    __table_args__ = (
+        UniqueConstraint("analysis_id", "node_id", name="uq_network_nodes_analysis_node"),
+    )
 
 class NetworkConnection(Base):
     __tablename__ = "network_connections"
     
     id = Column(Integer, primary_key=True)
-    source_id = Column(Integer, ForeignKey("network_nodes.id"))
-    target_id = Column(Integer, ForeignKey("network_nodes.id"))
+    analysis_id = Column(Integer, ForeignKey("network_analyses.id"), nullable=False)
+    source_id = Column(Integer, ForeignKey("network_nodes.id"), nullable=False)
+    target_id = Column(Integer, ForeignKey("network_nodes.id"), nullable=False)
     connection_type = Column(Enum(ConnectionType))
     status = Column(Enum(NodeStatus))
     protocol = Column(String)
     port = Column(Integer)
-    bytes_transferred = Column(Integer, default=0)
-    packets_transferred = Column(Integer, default=0)
+    bytes_transferred = Column(BigInteger, default=0)
+    packets_transferred = Column(BigInteger, default=0)
+    flow_count = Column(Integer, default=0)  # Sessions aggregated into this edge
+    first_activity = Column(DateTime)
     last_activity = Column(DateTime, default=datetime.utcnow)
     
-    source_node = relationship("NetworkNode", back_populates="connections") 
\ No newline at end of file
+    analysis = relationship("NetworkAnalysis", back_populates="connections")
+    source_node = relationship("NetworkNode", back_populates="connections", foreign_keys=[source_id])
+    target_node = relationship("NetworkNode", foreign_keys=[target_id])
+
+    __table_args__ = (
+        Index("ix_network_connections_analysis_source", "analysis_id", "source_id"),
+    ) 
\ No newline at end of file
@@ -13,6 +13,8 @@ class NetworkAnalysis(Base):
     result_json = Column(JSON)  # Store analysis results
     analyzed_at = Column(DateTime, default=datetime.utcnow)
     packet_count = Column(Integer, default=0)
+    flow_count = Column(Integer, default=0)
+    artifact_count = Column(Integer, default=0)
     duration = Column(Integer)  # Duration in seconds
     error_message = Column(String, nullable=True)
 
@@ -20,6 +22,9 @@ class NetworkAnalysis(Base):
     file = relationship("File", back_populates="network_analyses")
     nodes = relationship("NetworkNode", back_populates="analysis", cascade="all, delete-orphan")
     connections = relationship("NetworkConnection", back_populates="analysis", cascade="all, delete-orphan")
+    flows = relationship("NetworkFlow", back_populates="analysis", cascade="all, delete-orphan")
+    artifacts = relationship("NetworkArtifact", back_populates="analysis", cascade="all, delete-orphan")
+    hostnames = relationship("PassiveDnsRecord", back_populates="analysis", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<NetworkAnalysis(id={self.id}, file_id={self.file_id}, status={self.status})>" 
\ No newline at end of file
@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from .base import Base
+
+class NetworkArtifact(Base):
+    """
+    Protocol artifact (DNS name, HTTP host or URI, TLS SNI) seen in a capture,
+    aggregated per flow. Together the rows form an inverted index from
+    artifact values to analyses, flows and packets.
+    """
+    __tablename__ = "network_artifacts"
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey("network_analyses.id"), nullable=False, index=True)
+    artifact_type = Column(String(16), nullable=False)  # dns_query, http_host, http_uri, tls_sni
+    value = Column(String(1024), nullable=False)
+    value_reversed = Column(String(1024), nullable=True)  # Domain types only, for suffix search
+    # Flow the artifact was seen in, oriented client -> server like NetworkFlow
+    src_ip = Column(String, nullable=False)
+    dst_ip = Column(String, nullable=False)
+    src_port = Column(Integer, default=0)
+    dst_port = Column(Integer, default=0)
+    protocol = Column(Integer, nullable=False)
+    packet_count = Column(BigInteger, default=0)
+    first_seen = Column(Float)  # Epoch seconds
+    last_seen = Column(Float)
+    first_packet = Column(BigInteger)  # Row of the first occurrence in the packet store
+
+    # Relationships
+    analysis = relationship("NetworkAnalysis", back_populates="artifacts")
+
+    __table_args__ = (
+        # Pattern ops let PostgreSQL use the indexes for LIKE 'prefix%'
+        Index("ix_network_artifacts_value", "value", "artifact_type",
+              postgresql_ops={"value": "varchar_pattern_ops"}),
+        Index("ix_network_artifacts_value_reversed", "value_reversed",
+              postgresql_ops={"value_reversed": "varchar_pattern_ops"}),
+        Index("ix_network_artifacts_analysis_type", "analysis_id", "artifact_type"),
+    )
+
+    def __repr__(self):
+        return f"<NetworkArtifact(id={self.id}, {self.artifact_type}={self.value!r}, analysis_id={self.analysis_id})>"
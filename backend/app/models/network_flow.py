@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, Index, JSON
+from sqlalchemy.orm import relationship
+from .base import Base
+
+class NetworkFlow(Base):
+    """Bidirectional session aggregated from a capture, oriented client -> server."""
+    __tablename__ = "network_flows"
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey("network_analyses.id"), nullable=False, index=True)
+    src_ip = Column(String, nullable=False)  # Initiator of the session
+    dst_ip = Column(String, nullable=False)
+    src_port = Column(Integer, default=0)
+    dst_port = Column(Integer, default=0)
+    protocol = Column(Integer, nullable=False)  # IP protocol number
+    first_seen = Column(Float)  # Epoch seconds
+    last_seen = Column(Float)
+    duration = Column(Float)
+    packets_sent = Column(BigInteger, default=0)
+    packets_received = Column(BigInteger, default=0)
+    bytes_sent = Column(BigInteger, default=0)
+    bytes_received = Column(BigInteger, default=0)
+    total_packets = Column(BigInteger, default=0)
+    total_bytes = Column(BigInteger, default=0)
+    tcp_flags = Column(Integer, default=0)  # OR of all TCP flags seen
+    indicator_count = Column(Integer, default=0)  # Threat-intel indicators matched by either endpoint
+    indicators = Column(JSON, nullable=True)  # [{set, indicator, label, endpoint}]
+
+    # Relationships
+    analysis = relationship("NetworkAnalysis", back_populates="flows")
+
+    __table_args__ = (
+        Index("ix_network_flows_analysis_bytes", "analysis_id", "total_bytes"),
+        Index("ix_network_flows_analysis_first_seen", "analysis_id", "first_seen"),
+        Index("ix_network_flows_analysis_src", "analysis_id", "src_ip"),
+        Index("ix_network_flows_analysis_indicators", "analysis_id", "indicator_count"),
+    )
+
+    def __repr__(self):
+        return f"<NetworkFlow(id={self.id}, {self.src_ip}:{self.src_port} -> {self.dst_ip}:{self.dst_port}/{self.protocol})>"
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from .base import Base
+
+class PassiveDnsRecord(Base):
+    """
+    Hostname seen for an address in a capture, aggregated per source.
+    Across analyses the rows form a passive DNS cache that names hosts in
+    captures which did not see the name themselves.
+    """
+    __tablename__ = "passive_dns"
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey("network_analyses.id"), nullable=False, index=True)
+    address = Column(String, nullable=False)
+    hostname = Column(String(255), nullable=False)
+    source = Column(String(16), nullable=False)  # dns, tls_sni, http_host
+    observations = Column(BigInteger, default=0)
+    first_seen = Column(Float)  # Epoch seconds
+    valid_until = Column(Float)  # Last sighting, plus the TTL for DNS answers
+
+    # Relationships
+    analysis = relationship("NetworkAnalysis", back_populates="hostnames")
+
+    __table_args__ = (
+        Index("ix_passive_dns_address", "address", "valid_until"),
+    )
+
+    def __repr__(self):
+        return f"<PassiveDnsRecord(id={self.id}, {self.address}={self.hostname!r}, source={self.source})>"
@@ -43,6 +43,7 @@ class User(Base):
     audit_logs = relationship("AuditLog", back_populates="user")
     files = relationship("File", back_populates="user", cascade="all, delete-orphan")
     reports = relationship("Report", back_populates="user")
+    logs = relationship("Log", back_populates="user")
 
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username}, email={self.email})>"
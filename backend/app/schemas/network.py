@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, List, Optional, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -10,15 +10,15 @@ class NodeType(str, Enum):
     ROUTER = "router"
 
 class NetworkNodeResponse(BaseModel):
-    id: str
+    id: str = Field(validation_alias="node_id")
     label: str
     type: NodeType
     status: str
     ip_address: Optional[str] = None
-    metadata: Optional[Dict] = None
+    metadata: Optional[Dict] = Field(None, validation_alias="node_metadata")
+    coordinates: Optional[List[float]] = None  # Unset until the layout has run
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class NetworkConnectionResponse(BaseModel):
     source: str
@@ -27,19 +27,145 @@ class NetworkConnectionResponse(BaseModel):
     status: str
     protocol: Optional[str] = None
     port: Optional[int] = None
+    bytes_transferred: int = 0
+    packets_transferred: int = 0
+    flow_count: int = 0
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class NetworkTopologyResponse(BaseModel):
     nodes: List[NetworkNodeResponse]
     connections: List[NetworkConnectionResponse]
 
+class TopologyLevelResponse(BaseModel):
+    hierarchy: str
+    group: Optional[str] = None  # Expanded group; None for the top level
+    level: str                   # Level of the returned nodes
+    nodes: List[Dict]            # id, level, size (hosts), bytes, expandable
+    edges: List[Dict]            # May end at groups outside the expanded one
+
+class GraphCentralityResponse(BaseModel):
+    metric: str
+    approximate: bool  # Sampled estimate on large graphs
+    nodes: List[Dict]  # node and score, highest score first
+
+class GraphGroupsResponse(BaseModel):
+    total: int
+    approximate: bool = False
+    groups: List[List[str]]  # Node ids per group, largest group first
+
+class GraphNeighborhoodResponse(BaseModel):
+    node: str
+    hops: int
+    direction: str
+    nodes: List[Dict]  # node and hop distance
+    edges: List[Dict]
+
+class GraphPathResponse(BaseModel):
+    source: str
+    target: str
+    found: bool
+    hops: Optional[int] = None
+    arrival: Optional[float] = None  # Time-respecting paths: when target is reached
+    nodes: List[str] = []           # source to target
+    edges: List[Dict] = []          # Along the path; "at" is when a time-respecting hop is taken
+
+class GraphReachableResponse(BaseModel):
+    node: str
+    hops: int
+    direction: str
+    total: int
+    nodes: List[Dict]  # node and hop distance, nearest first
+
+class GraphSharedPeersResponse(BaseModel):
+    node: str
+    max_degree: int
+    peers: List[str]   # Rare peers of node
+    nodes: List[Dict]  # node, shared (rare peer count) and peers, most shared first
+
 class NetworkMetrics(BaseModel):
     total_bytes: int
     packets_per_second: float
     active_connections: int
     unique_ips: int
     protocols: Dict[str, int]
-    top_talkers: List[Dict[str, any]]
-    timestamp: datetime 
\ No newline at end of file
+    top_talkers: List[Dict[str, Any]]
+    timestamp: datetime
+
+class NetworkFlowResponse(BaseModel):
+    id: int
+    src_ip: str
+    dst_ip: str
+    src_port: int
+    dst_port: int
+    protocol: int
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+    duration: Optional[float] = None
+    packets_sent: int
+    packets_received: int
+    bytes_sent: int
+    bytes_received: int
+    total_packets: int
+    total_bytes: int
+    tcp_flags: int
+    indicator_count: int = 0
+    indicators: Optional[List[Dict]] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class NetworkFlowPage(BaseModel):
+    items: List[NetworkFlowResponse]
+    total: int
+    page: int
+    pages: int
+
+class NetworkArtifactResponse(BaseModel):
+    id: int
+    analysis_id: int
+    artifact_type: str
+    value: str
+    src_ip: str
+    dst_ip: str
+    src_port: int
+    dst_port: int
+    protocol: int
+    packet_count: int
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+    first_packet: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ArtifactSearchPage(BaseModel):
+    items: List[NetworkArtifactResponse]
+    analysis_ids: List[int]  # Every capture with a match, not only this page
+    total: int
+    page: int
+    pages: int
+
+class PacketPage(BaseModel):
+    items: List[Dict]
+    total: int
+    page: int
+    pages: int
+
+class RawPacketWindow(BaseModel):
+    items: List[Dict]  # number, timestamp, length, caplen and hex-encoded frame data
+    truncated: bool    # More packets matched than were returned
+
+class FollowCaptureRequest(BaseModel):
+    path: str  # Capture file relative to the sensor capture directory
+
+class FollowCaptureResponse(BaseModel):
+    file_id: int
+    task_id: str
+
+class HeavyHittersResponse(BaseModel):
+    analysis_ids: List[int]
+    top_talkers: List[Dict]
+    top_destination_ports: List[Dict]
+    top_conversations: List[Dict]
+    top_dns_queries: List[Dict]
+    distinct_ips: int
+    enrichment: Dict[str, Dict] = {}  # Owner/ASN/geo attributes per talker and conversation address
@@ -0,0 +1,106 @@
+import time
+import logging
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from services.pcap_reader import PcapReader
+from services.artifacts import extract_payload_artifacts
+
+logger = logging.getLogger(__name__)
+
+# A packet plugin receives every decoded PACKET_DTYPE batch together with
+# the per-packet artifact strings (see extract_payload_artifacts). A flow
+# plugin receives the finished FLOW_DTYPE table once and returns a result.
+PacketPlugin = Callable[[np.ndarray, Dict[str, List[Optional[str]]]], None]
+FlowPlugin = Callable[[np.ndarray], Any]
+
+# Name under which the time spent decoding the capture is recorded
+DECODE_STAGE = "decode"
+
+class PluginTimings:
+    """Seconds spent per pipeline stage, mergeable across capture shards."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.batches = 0
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def merge(self, other: "PluginTimings") -> None:
+        for name, seconds in other.seconds.items():
+            self.add(name, seconds)
+        self.batches += other.batches
+
+    def to_dict(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "seconds": {name: round(seconds, 4) for name, seconds in self.seconds.items()}
+        }
+
+class AnalysisPipeline:
+    """
+    Fan one decoded packet stream out to analyzer plugins.
+
+    The capture is decoded once and every batch is handed to each packet
+    plugin in registration order; flow plugins run on the finished flow
+    table. Adding an analyzer means registering a plugin, never another
+    pass over the capture. Time spent decoding and in each plugin is
+    accumulated in timings.
+    """
+
+    def __init__(self, timings: Optional[PluginTimings] = None):
+        self.timings = PluginTimings() if timings is None else timings
+        self.packet_plugins: List[Tuple[str, PacketPlugin]] = []
+        self.flow_plugins: List[Tuple[str, FlowPlugin]] = []
+
+    def on_packets(self, name: str, plugin: PacketPlugin) -> None:
+        self.packet_plugins.append((name, plugin))
+
+    def on_flows(self, name: str, plugin: FlowPlugin) -> None:
+        self.flow_plugins.append((name, plugin))
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.add(name, time.perf_counter() - started)
+
+    def add_batch(self, packets: np.ndarray, found: Dict[str, List[Optional[str]]]) -> None:
+        for name, plugin in self.packet_plugins:
+            with self.timed(name):
+                plugin(packets, found)
+        self.timings.batches += 1
+
+    def run(self, batches: Iterable[Tuple[np.ndarray, Dict[str, List[Optional[str]]]]]) -> None:
+        """Feed (packets, found) batches to the packet plugins, timing the decoder that yields them."""
+        batches = iter(batches)
+        while True:
+            with self.timed(DECODE_STAGE):
+                item = next(batches, None)
+            if item is None:
+                return
+            self.add_batch(*item)
+
+    def finish(self, flows: np.ndarray) -> Dict[str, Any]:
+        """Run the flow plugins and return their results by name."""
+        results = {}
+        for name, plugin in self.flow_plugins:
+            with self.timed(name):
+                results[name] = plugin(flows)
+        return results
+
+def native_batches(reader: PcapReader, **options) -> Iterator[Tuple[np.ndarray, Dict[str, List[Optional[str]]]]]:
+    """
+    Decode a capture with the native reader into (packets, found) batches.
+
+    Options are passed to PcapReader.iter_batches (start, end,
+    allow_truncated).
+    """
+    for batch in reader.iter_batches(**options):
+        yield batch, extract_payload_artifacts(reader, batch)
@@ -0,0 +1,387 @@
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.orm import Session
+from models.network_artifact import NetworkArtifact
+from services.pcap_reader import PcapReader, IPV4_MAPPED_PREFIX, format_ip
+from services.passive_dns import HostnameIndex
+
+logger = logging.getLogger(__name__)
+
+# Artifact types; domain-like ones are normalized (lowercase, no trailing
+# dot) and can be searched by suffix, e.g. every name under evil.example.
+ARTIFACT_TYPES = ("dns_query", "http_host", "http_uri", "tls_sni")
+DOMAIN_TYPES = ("dns_query", "http_host", "tls_sni")
+MATCH_MODES = ("exact", "prefix", "suffix")
+
+# Per-packet string fields produced by extraction: the artifacts plus the
+# HTTP method, which only goes to the packet store
+EXTRACTED_FIELDS = ("http_method",) + ARTIFACT_TYPES
+
+MAX_VALUE_LENGTH = 1024
+ARTIFACT_INSERT_BATCH = 10_000
+
+DNS_PORTS = (53, 5353)
+HTTP_METHODS = (b"GET ", b"POST", b"HEAD", b"PUT ", b"DELE", b"OPTI", b"PATC", b"CONN", b"TRAC")
+PREFIX_WIDTH = 8
+
+def normalize_domain(name: str) -> str:
+    return name.strip().rstrip(".").lower()
+
+def parse_dns_query(payload: bytes) -> Optional[str]:
+    """Return the first question name of a DNS message, or None."""
+    if len(payload) < 17 or int.from_bytes(payload[4:6], "big") == 0:
+        return None
+    labels = []
+    pos = 12
+    while pos < len(payload):
+        length = payload[pos]
+        if length == 0:
+            break
+        if length & 0xC0 or pos + 1 + length > len(payload):
+            return None  # Compression pointers do not occur in a first question
+        labels.append(payload[pos + 1:pos + 1 + length])
+        pos += 1 + length
+        if pos > 12 + 255:
+            return None
+    else:
+        return None
+    if not labels:
+        return None
+    try:
+        return normalize_domain(b".".join(labels).decode("ascii"))
+    except UnicodeDecodeError:
+        return None
+
+def _skip_name(payload: bytes, pos: int) -> int:
+    """Offset just past a possibly compressed name starting at pos."""
+    while True:
+        length = payload[pos]
+        if length & 0xC0 == 0xC0:
+            return pos + 2
+        if length == 0:
+            return pos + 1
+        pos += 1 + length
+
+def parse_dns_answers(payload: bytes) -> List[Tuple[bytes, str, int]]:
+    """
+    Return (packed address, queried name, TTL) for the A and AAAA records
+    of a DNS response. Answers reached through CNAMEs are attributed to
+    the name the client asked for.
+    """
+    if len(payload) < 17 or not payload[2] & 0x80 or payload[3] & 0x0F:
+        return []
+    name = parse_dns_query(payload)
+    if name is None:
+        return []
+    questions = int.from_bytes(payload[4:6], "big")
+    answers = int.from_bytes(payload[6:8], "big")
+    found = []
+    try:
+        pos = 12
+        for _ in range(questions):
+            pos = _skip_name(payload, pos) + 4
+        for _ in range(answers):
+            pos = _skip_name(payload, pos)
+            record_type = int.from_bytes(payload[pos:pos + 2], "big")
+            ttl = int.from_bytes(payload[pos + 4:pos + 8], "big")
+            length = int.from_bytes(payload[pos + 8:pos + 10], "big")
+            data = payload[pos + 10:pos + 10 + length]
+            if len(data) != length:
+                break
+            if record_type == 1 and length == 4:
+                found.append((IPV4_MAPPED_PREFIX + data, name, ttl))
+            elif record_type == 28 and length == 16:
+                found.append((data, name, ttl))
+            pos += 10 + length
+    except IndexError:
+        pass
+    return found
+
+def parse_http_request(payload: bytes) -> Optional[Tuple[str, str, Optional[str]]]:
+    """Return (method, uri, host) of an HTTP/1.x request head, or None."""
+    head = payload.split(b"\r\n\r\n", 1)[0]
+    lines = head.split(b"\r\n")
+    parts = lines[0].split(b" ")
+    if len(parts) != 3 or not parts[2].startswith(b"HTTP/"):
+        return None
+    try:
+        method, uri = parts[0].decode("ascii"), parts[1].decode("latin-1")
+    except UnicodeDecodeError:
+        return None
+    host = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"host":
+            host = value.strip().decode("latin-1")
+            break
+    if host is None and "://" in uri:
+        host = uri.split("://", 1)[1].split("/", 1)[0]
+    if method == "CONNECT" and host is None:
+        host = uri
+    if host:
+        # Drop the port, keeping bracketed IPv6 literals intact
+        host = host.rsplit(":", 1)[0] if host.count(":") == 1 else host
+        host = normalize_domain(host.strip("[]"))
+    return method, uri[:MAX_VALUE_LENGTH], host or None
+
+def parse_tls_sni(payload: bytes) -> Optional[str]:
+    """Return the server name from a TLS ClientHello record, or None."""
+    try:
+        if payload[0] != 0x16 or payload[5] != 0x01:
+            return None
+        pos = 5 + 4 + 2 + 32          # record header, handshake header, version, random
+        pos += 1 + payload[pos]       # session id
+        pos += 2 + int.from_bytes(payload[pos:pos + 2], "big")  # cipher suites
+        pos += 1 + payload[pos]       # compression methods
+        end = min(pos + 2 + int.from_bytes(payload[pos:pos + 2], "big"), len(payload))
+        pos += 2
+        while pos + 4 <= end:
+            ext_type = int.from_bytes(payload[pos:pos + 2], "big")
+            ext_len = int.from_bytes(payload[pos + 2:pos + 4], "big")
+            pos += 4
+            if ext_type == 0:
+                # server_name_list length, name type, name length, name
+                if payload[pos + 2] != 0:
+                    return None
+                name_len = int.from_bytes(payload[pos + 3:pos + 5], "big")
+                name = payload[pos + 5:pos + 5 + name_len]
+                if len(name) != name_len:
+                    return None
+                return normalize_domain(name.decode("ascii"))
+            pos += ext_len
+    except (IndexError, UnicodeDecodeError):
+        return None
+    return None
+
+def extract_payload_artifacts(reader: PcapReader, packets: np.ndarray) -> Dict[str, List[Optional[str]]]:
+    """
+    Extract artifacts from the payloads of a decoded batch.
+
+    Candidates are picked with a vectorized look at the first payload
+    bytes (DNS ports, HTTP request methods, TLS ClientHello records), and
+    only those payloads are read and parsed.
+
+    Returns:
+        Per-packet values for every field in EXTRACTED_FIELDS (None if
+        absent), plus "dns_answers": the parse_dns_answers records of DNS
+        responses
+    """
+    found = {name: [None] * packets.size for name in EXTRACTED_FIELDS + ("dns_answers",)}
+    has_payload = (packets["payload_offset"] != 0) & (packets["caplen"] > packets["payload_offset"])
+    if not has_payload.any():
+        return found
+    prefixes = reader.payload_prefixes(packets, PREFIX_WIDTH)
+    protocol = packets["protocol"]
+    dns_port = np.isin(packets["src_port"], DNS_PORTS) | np.isin(packets["dst_port"], DNS_PORTS)
+    tcp = has_payload & (protocol == 6)
+
+    dns = has_payload & dns_port & ((protocol == 17) | (protocol == 6))
+    words = np.ascontiguousarray(prefixes[:, :4]).view("S4").ravel()
+    http = tcp & np.isin(words, HTTP_METHODS)
+    tls = tcp & (prefixes[:, 0] == 0x16) & (prefixes[:, 1] == 0x03) & (prefixes[:, 5] == 0x01)
+
+    candidates = np.flatnonzero(dns | http | tls)
+    kinds = np.where(dns[candidates], 0, np.where(http[candidates], 1, 2)).tolist()
+    over_tcp = (protocol[candidates] == 6).tolist()
+    payloads = reader.payloads(packets[candidates])
+    for i, kind, is_tcp, payload in zip(candidates.tolist(), kinds, over_tcp, payloads):
+        if kind == 0:
+            # DNS over TCP carries a two-byte length prefix
+            message = payload[2:] if is_tcp else payload
+            found["dns_query"][i] = parse_dns_query(message)
+            found["dns_answers"][i] = parse_dns_answers(message) or None
+        elif kind == 1:
+            request = parse_http_request(payload)
+            if request is not None:
+                found["http_method"][i], found["http_uri"][i], found["http_host"][i] = request
+        else:
+            found["tls_sni"][i] = parse_tls_sni(payload)
+    return found
+
+def tshark_artifacts(rows: List[Dict]) -> Dict[str, List[Optional[str]]]:
+    """Per-packet artifact values from TShark packet dicts, as extract_payload_artifacts."""
+    found = {}
+    for name in EXTRACTED_FIELDS:
+        values = [pkt.get(name) for pkt in rows]
+        values = [value if value and value != "N/A" else None for value in values]
+        if name in DOMAIN_TYPES:
+            values = [normalize_domain(value) if value else None for value in values]
+        found[name] = values
+    return found
+
+class ArtifactIndex:
+    """
+    Occurrences of protocol artifacts, aggregated per artifact and flow.
+
+    Each entry keeps the packet count, first and last timestamps and the
+    number of the first packet (its row in the packet store), so search
+    hits can link straight to the flow and the packet. The hostnames the
+    artifacts reveal for server addresses are collected in hostnames.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        # (type, value, src_ip, dst_ip, src_port, dst_port, protocol) ->
+        # [packet_count, first_seen, last_seen, first_packet]
+        self._entries: Dict[Tuple, List] = {}
+        self.packets = 0
+        self.hostnames = HostnameIndex()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add_batch(self, packets: np.ndarray, found: Dict[str, List[Optional[str]]]) -> None:
+        """Record the artifacts found in a batch; packets are numbered in arrival order."""
+        hits, types, values = [], [], []
+        for artifact_type in ARTIFACT_TYPES:
+            for i, value in enumerate(found.get(artifact_type) or ()):
+                if value:
+                    hits.append(i)
+                    types.append(artifact_type)
+                    values.append(value[:MAX_VALUE_LENGTH])
+        if hits:
+            self._add_occurrences(packets[np.array(hits)], np.array(hits), types, values)
+        self.hostnames.add_batch(packets, found)
+        self.packets += int(packets.size)
+
+    def _add_occurrences(self, hits: np.ndarray, positions: np.ndarray, types: List[str], values: List[str]) -> None:
+        # Pre-aggregate within the batch so the dict sees each key once
+        src, dst = hits["src_ip"].copy(), hits["dst_ip"].copy()
+        sport, dport = hits["src_port"].copy(), hits["dst_port"].copy()
+        # DNS responses are filed under the querying client
+        response = (np.array(types) == "dns_query") & np.isin(sport, DNS_PORTS) & ~np.isin(dport, DNS_PORTS)
+        src[response], dst[response] = hits["dst_ip"][response], hits["src_ip"][response]
+        sport[response], dport[response] = hits["dst_port"][response], hits["src_port"][response]
+
+        labels = {}
+        codes = np.array([labels.setdefault((t, v), len(labels)) for t, v in zip(types, values)], dtype=np.int64)
+        keys = np.empty(hits.size, dtype=[("code", "<i8"), ("src", "S16"), ("dst", "S16"),
+                                          ("sport", "<u2"), ("dport", "<u2"), ("protocol", "u1")])
+        keys["code"], keys["src"], keys["dst"] = codes, src, dst
+        keys["sport"], keys["dport"], keys["protocol"] = sport, dport, hits["protocol"]
+        unique, first, inverse, counts = np.unique(
+            keys.view(f"V{keys.dtype.itemsize}"), return_index=True, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.ravel()
+        ts = hits["ts"]
+        first_seen = np.full(unique.size, np.inf)
+        last_seen = np.full(unique.size, -np.inf)
+        np.minimum.at(first_seen, inverse, ts)
+        np.maximum.at(last_seen, inverse, ts)
+        order = np.lexsort((positions, ts, inverse))
+        earliest = order[np.searchsorted(inverse[order], np.arange(unique.size))]
+
+        by_code = list(labels)
+        grouped = keys[first]
+        for (code, s, d, sp, dp, proto), count, fs, ls, pos in zip(
+            grouped.tolist(), counts.tolist(), first_seen.tolist(), last_seen.tolist(),
+            (positions[earliest] + self.packets).tolist()
+        ):
+            artifact_type, value = by_code[code]
+            self._add((artifact_type, value, s, d, sp, dp, proto), count, fs, ls, pos)
+
+    def _add(self, key: Tuple, count: int, first_seen: float, last_seen: float, first_packet: int) -> None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [count, first_seen, last_seen, first_packet]
+            return
+        entry[0] += count
+        if first_seen < entry[1]:
+            entry[1] = first_seen
+            entry[3] = first_packet
+        entry[2] = max(entry[2], last_seen)
+
+    def merge(self, other: "ArtifactIndex") -> None:
+        """Append the index of the following capture shard."""
+        for key, (count, first_seen, last_seen, first_packet) in other._entries.items():
+            self._add(key, count, first_seen, last_seen, self.packets + first_packet)
+        self.packets += other.packets
+        self.hostnames.merge(other.hostnames)
+
+    def value_counts(self, artifact_type: str) -> Dict[str, int]:
+        """Number of packets carrying each value of artifact_type."""
+        counts: Dict[str, int] = {}
+        for (kind, value, *_), (count, *_) in self._entries.items():
+            if kind == artifact_type:
+                counts[value] = counts.get(value, 0) + count
+        return counts
+
+    def rows(self, analysis_id: int) -> List[Dict]:
+        """NetworkArtifact column dicts for all entries."""
+        ips = {}
+        def ip(packed: bytes) -> str:
+            if packed not in ips:
+                ips[packed] = format_ip(packed)
+            return ips[packed]
+
+        return [
+            {
+                "analysis_id": analysis_id,
+                "artifact_type": artifact_type,
+                "value": value,
+                "value_reversed": value[::-1] if artifact_type in DOMAIN_TYPES else None,
+                "src_ip": ip(src),
+                "dst_ip": ip(dst),
+                "src_port": sport,
+                "dst_port": dport,
+                "protocol": protocol,
+                "packet_count": count,
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+                "first_packet": first_packet
+            }
+            for (artifact_type, value, src, dst, sport, dport, protocol), (count, first_seen, last_seen, first_packet)
+            in sorted(self._entries.items(), key=lambda item: item[1][3])
+        ]
+
+def persist_artifacts(db: Session, analysis_id: int, index: ArtifactIndex) -> int:
+    """Bulk insert the artifact index of an analysis. Returns the number of rows written."""
+    rows = index.rows(analysis_id)
+    for start in range(0, len(rows), ARTIFACT_INSERT_BATCH):
+        db.execute(insert(NetworkArtifact), rows[start:start + ARTIFACT_INSERT_BATCH])
+    db.commit()
+    logger.info(f"Stored {len(rows)} artifacts for analysis {analysis_id}")
+    return len(rows)
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _match_types(value: str, domain: str, condition):
+    """condition on the raw value, and on its normalized form for domain artifact types."""
+    if domain == value:
+        return condition(value)
+    return or_(
+        and_(NetworkArtifact.artifact_type.in_(DOMAIN_TYPES), condition(domain)),
+        and_(NetworkArtifact.artifact_type.notin_(DOMAIN_TYPES), condition(value))
+    )
+
+def artifact_match(value: str, match: str = "exact"):
+    """
+    SQL condition matching artifacts against value.
+
+    prefix matches values starting with value; suffix matches domain
+    names equal to value or under it (label-aligned), via the reversed
+    value so both use an index range scan.
+
+    Domain names are stored normalized, so value is normalized the same
+    way for domain artifact types in every mode. A prefix keeps its
+    trailing dot, which anchors it to whole labels.
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"match must be one of: {', '.join(MATCH_MODES)}")
+    if match == "exact":
+        return _match_types(value, normalize_domain(value), lambda v: NetworkArtifact.value == v)
+    if match == "prefix":
+        return _match_types(
+            value, value.strip().lower(),
+            lambda v: NetworkArtifact.value.like(f"{_escape_like(v)}%", escape="\\")
+        )
+    domain = normalize_domain(value).lstrip(".")
+    return or_(
+        NetworkArtifact.value_reversed == domain[::-1],
+        NetworkArtifact.value_reversed.like(f"{_escape_like(domain[::-1])}.%", escape="\\")
+    )
@@ -0,0 +1,148 @@
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+from core.config import settings
+from services.pcap_reader import format_ip
+from services.flow_table import flow_channels
+
+logger = logging.getLogger(__name__)
+
+# A beacon candidate is a (client, server, server port, protocol) channel
+# whose connections open at regular intervals. Each flow is one event at
+# its first_seen time; the channel is scored on the inter-arrival times
+# of its events. Channels with a median interval below BEACON_MIN_INTERVAL
+# seconds are bursts, not beacons.
+BEACON_MIN_INTERVAL = 1.0
+BEACON_SUMMARY_LIMIT = 25
+
+def _group_quantile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Quantile of each group of values already sorted within contiguous groups."""
+    return values[starts + np.floor(q * (counts - 1)).astype(np.int64)]
+
+def _sorted_within_groups(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    return values[np.lexsort((values, groups))]
+
+def score_channels(
+    groups: np.ndarray,
+    intervals: np.ndarray,
+    sizes: np.ndarray,
+    size_groups: np.ndarray,
+    count: int
+) -> Dict[str, np.ndarray]:
+    """
+    Periodicity statistics for `count` channels in one batched pass.
+
+    Args:
+        groups: Channel of each inter-arrival interval, sorted ascending
+        intervals: Inter-arrival times in seconds
+        sizes: Bytes of each connection
+        size_groups: Channel of each connection
+
+    Returns:
+        Arrays indexed by channel: intervals, period (median interval),
+        jitter (median absolute deviation / period), skew (Bowley
+        skewness of the intervals), size_jitter (coefficient of variation
+        of connection sizes) and the partial scores, each in [0, 1].
+    """
+    counts = np.bincount(groups, minlength=count)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    safe = np.maximum(counts, 1)
+    present = counts > 0
+    starts = np.where(present, starts, 0)
+
+    ordered = _sorted_within_groups(intervals, groups)
+    q1 = _group_quantile(ordered, starts, safe, 0.25)
+    period = _group_quantile(ordered, starts, safe, 0.5)
+    q3 = _group_quantile(ordered, starts, safe, 0.75)
+    spread = q3 - q1
+    skew = np.divide(q3 + q1 - 2 * period, spread, out=np.zeros(count), where=spread > 0)
+
+    deviation = _sorted_within_groups(np.abs(intervals - period[groups]), groups)
+    mad = _group_quantile(deviation, starts, safe, 0.5)
+    jitter = np.divide(mad, period, out=np.ones(count), where=period > 0)
+
+    size_counts = np.maximum(np.bincount(size_groups, minlength=count), 1)
+    size_mean = np.bincount(size_groups, weights=sizes, minlength=count) / size_counts
+    size_var = np.bincount(size_groups, weights=sizes * sizes, minlength=count) / size_counts - size_mean ** 2
+    size_jitter = np.divide(np.sqrt(np.maximum(size_var, 0)), size_mean, out=np.zeros(count), where=size_mean > 0)
+
+    return {
+        "intervals": counts,
+        "period": period,
+        "jitter": jitter,
+        "skew": skew,
+        "size_jitter": size_jitter,
+        "interval_score": 1 - np.minimum(jitter, 1),
+        "skew_score": 1 - np.minimum(np.abs(skew), 1),
+        "size_score": 1 - np.minimum(size_jitter, 1)
+    }
+
+def detect_beacons(flows: np.ndarray, limit: int = BEACON_SUMMARY_LIMIT, min_connections: Optional[int] = None) -> List[Dict]:
+    """
+    Rank beacon candidates among FLOW_DTYPE rows.
+
+    Channels are factorized over the whole table at once, only flows of
+    channels with enough connections are sorted, and every statistic is a
+    grouped NumPy reduction rather than a per-channel loop. The score
+    averages interval regularity, interval symmetry, connection size
+    regularity and how much of the capture the channel spans.
+    """
+    min_connections = min_connections or settings.BEACON_MIN_CONNECTIONS
+    flows = flows[flows["protocol"] != 0]
+    if flows.size < min_connections:
+        return []
+
+    channels = flow_channels(flows)
+    addresses, client_id, server_id = channels["addresses"], channels["client"], channels["server"]
+    port, protocol, channel = channels["port"], channels["protocol"], channels["channel"]
+    connections = np.bincount(channel)
+    ts = flows["first_seen"]
+    sizes = (flows["bytes_ab"] + flows["bytes_ba"]).astype(np.float64)
+
+    # Only channels with enough connections are sorted and scored
+    candidates = connections >= min_connections
+    if not candidates.any():
+        return []
+    keep = np.flatnonzero(candidates[channel])
+    channel = (np.cumsum(candidates) - 1)[channel[keep]]
+    order = keep[np.lexsort((ts[keep], channel))]
+    channel = np.sort(channel)
+    client_id, server_id = client_id[order], server_id[order]
+    port, protocol, ts, sizes = port[order], protocol[order], ts[order], sizes[order]
+
+    same = channel[1:] == channel[:-1]
+    count = int(channel[-1]) + 1
+    stats = score_channels(channel[1:][same], np.diff(ts)[same], sizes, channel, count)
+
+    heads = np.flatnonzero(np.diff(channel, prepend=-1))
+    first_seen = ts[heads]
+    last_seen = ts[np.append(heads[1:] - 1, ts.size - 1)]
+    capture_span = max(float(flows["first_seen"].max() - flows["first_seen"].min()), 1e-9)
+    coverage = np.minimum((last_seen - first_seen) / capture_span, 1)
+    score = (stats["interval_score"] + stats["skew_score"] + stats["size_score"] + coverage) / 4
+    score[stats["period"] < BEACON_MIN_INTERVAL] = 0
+
+    rows = np.flatnonzero(score > 0)
+    rows = rows[np.argsort(-score[rows], kind="stable")][:limit]
+    heads = heads[rows]
+    total_bytes = np.bincount(channel, weights=sizes)
+
+    beacons = []
+    for row, head in zip(rows.tolist(), heads.tolist()):
+        beacons.append({
+            "src_ip": format_ip(addresses[client_id[head]]),
+            "dst_ip": format_ip(addresses[server_id[head]]),
+            "dst_port": int(port[head]),
+            "protocol": int(protocol[head]),
+            "connections": int(stats["intervals"][row]) + 1,
+            "period": round(float(stats["period"][row]), 3),
+            "jitter": round(float(stats["jitter"][row]), 4),
+            "skew": round(float(stats["skew"][row]), 4),
+            "size_jitter": round(float(stats["size_jitter"][row]), 4),
+            "bytes": int(total_bytes[row]),
+            "first_seen": float(first_seen[row]),
+            "last_seen": float(last_seen[row]),
+            "score": round(float(score[row]), 4)
+        })
+    logger.info(f"Scored {count} channels from {flows.size} flows; {len(beacons)} beacon candidates")
+    return beacons
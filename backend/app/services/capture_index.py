@@ -0,0 +1,138 @@
+import os
+import logging
+import numpy as np
+from typing import Iterator, Optional, Tuple
+from core.config import settings
+from services.pcap_reader import PcapReader
+
+logger = logging.getLogger(__name__)
+
+# Sparse sidecar index of a capture: a checkpoint every `interval` packets
+# with the packet number and byte offset of the record it starts at, plus
+# the earliest and latest timestamp of the block it opens. Timestamps are
+# not assumed to be monotonic, so time lookups use the block bounds.
+CAPTURE_INDEX_FILENAME = "capture_index.npz"
+
+class CaptureIndexBuilder:
+    """Collect checkpoints from decoded batches in capture order."""
+
+    def __init__(self, interval: Optional[int] = None):
+        self.interval = interval or settings.CAPTURE_INDEX_INTERVAL
+        self.clear()
+
+    def clear(self) -> None:
+        self.packets = 0
+        self._numbers = []
+        self._offsets = []
+        self._ts_min = []
+        self._ts_max = []
+
+    def add_batch(self, packets: np.ndarray) -> None:
+        if not packets.size:
+            return
+        numbers = self.packets + np.arange(packets.size)
+        blocks = numbers // self.interval
+        starts = np.flatnonzero(np.diff(blocks, prepend=-1))
+        ts = packets["ts"]
+        ts_min = np.minimum.reduceat(ts, starts)
+        ts_max = np.maximum.reduceat(ts, starts)
+        if numbers[0] % self.interval:
+            # The batch continues the block opened by an earlier batch
+            self._ts_min[-1][-1] = min(self._ts_min[-1][-1], ts_min[0])
+            self._ts_max[-1][-1] = max(self._ts_max[-1][-1], ts_max[0])
+            starts, ts_min, ts_max = starts[1:], ts_min[1:], ts_max[1:]
+        if starts.size:
+            self._numbers.append(numbers[starts])
+            self._offsets.append(packets["offset"][starts].astype(np.uint64))
+            self._ts_min.append(ts_min)
+            self._ts_max.append(ts_max)
+        self.packets += int(packets.size)
+
+    def merge(self, other: "CaptureIndexBuilder") -> None:
+        """Append the checkpoints of the following capture shard."""
+        for numbers, offsets, ts_min, ts_max in zip(other._numbers, other._offsets, other._ts_min, other._ts_max):
+            self._numbers.append(numbers + self.packets)
+            self._offsets.append(offsets)
+            self._ts_min.append(ts_min)
+            self._ts_max.append(ts_max)
+        self.packets += other.packets
+
+    def save(self, path: str) -> None:
+        def joined(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+        temp_path = f"{path}.tmp.npz"
+        np.savez(
+            temp_path,
+            packets=np.array(self.packets, dtype=np.int64),
+            numbers=joined(self._numbers, np.int64),
+            offsets=joined(self._offsets, np.uint64),
+            ts_min=joined(self._ts_min, np.float64),
+            ts_max=joined(self._ts_max, np.float64)
+        )
+        os.replace(temp_path, path)
+        logger.info(f"Wrote capture index {path} with {sum(len(n) for n in self._numbers)} checkpoints")
+
+class CaptureIndex:
+    """
+    Seek into a capture by packet number or time using a saved index.
+
+    Only the records between the surrounding checkpoints are read, so
+    the cost of a lookup depends on the window, not the capture size.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.packets = int(data["packets"])
+            self.numbers = data["numbers"]
+            self.offsets = data["offsets"]
+            self.ts_min = data["ts_min"]
+            self.ts_max = data["ts_max"]
+
+    def _end_offset(self, block: int) -> Optional[int]:
+        """Offset where block ends (the next checkpoint), None for the last block."""
+        return int(self.offsets[block + 1]) if block + 1 < self.numbers.size else None
+
+    def iter_packets(self, reader: PcapReader, first: int, count: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield (packet numbers, packets) for packets first .. first + count - 1.
+        """
+        if count <= 0 or first >= self.packets or not self.numbers.size:
+            return
+        first = max(first, 0)
+        last = min(first + count, self.packets) - 1
+        lo = int(np.searchsorted(self.numbers, first, side="right")) - 1
+        hi = int(np.searchsorted(self.numbers, last, side="right")) - 1
+        number = int(self.numbers[lo])
+        for batch in reader.iter_batches(start=int(self.offsets[lo]), end=self._end_offset(hi)):
+            numbers = number + np.arange(batch.size)
+            number += batch.size
+            keep = (numbers >= first) & (numbers <= last)
+            if keep.any():
+                yield numbers[keep], batch[keep]
+            if number > last:
+                break
+
+    def iter_time_range(self, reader: PcapReader, start: float, end: float) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (packet numbers, packets) with start <= timestamp <= end."""
+        blocks = np.flatnonzero((self.ts_max >= start) & (self.ts_min <= end))
+        # Read each run of consecutive overlapping blocks, skipping the gaps
+        breaks = np.flatnonzero(np.diff(blocks) > 1) + 1
+        for run in np.split(blocks, breaks) if blocks.size else []:
+            lo, hi = int(run[0]), int(run[-1])
+            number = int(self.numbers[lo])
+            for batch in reader.iter_batches(start=int(self.offsets[lo]), end=self._end_offset(hi)):
+                numbers = number + np.arange(batch.size)
+                number += batch.size
+                keep = (batch["ts"] >= start) & (batch["ts"] <= end)
+                if keep.any():
+                    yield numbers[keep], batch[keep]
+
+def capture_index_path(analysis_dir: str) -> str:
+    return os.path.join(analysis_dir, CAPTURE_INDEX_FILENAME)
+
+def index_capture(pcap_file: str, builder: CaptureIndexBuilder) -> None:
+    """Build the index with a header-only pass of the native reader."""
+    with PcapReader(pcap_file) as reader:
+        for batch in reader.iter_batches():
+            builder.add_batch(batch)
@@ -0,0 +1,249 @@
+import os
+import csv
+import hashlib
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from services.pcap_reader import pack_ip, format_ip
+from services.indicators import V4_MAPPED_PREFIX, unique_addresses
+
+logger = logging.getLogger(__name__)
+
+# The enrichment dataset is a CSV of address ranges (ASN, owner, country,
+# ...), e.g. an ip2asn or GeoLite export. The header names the range
+# columns, either start/end addresses or a CIDR network, and every other
+# column is kept as an attribute. Ranges must not overlap.
+START_COLUMNS = ("start_ip", "range_start", "ip_start", "start")
+END_COLUMNS = ("end_ip", "range_end", "ip_end", "end")
+NETWORK_COLUMNS = ("network", "cidr", "prefix")
+
+# Parsing a multi-million row CSV takes seconds, so the compiled arrays
+# are cached per dataset version and shared by every worker.
+ENRICHMENT_CACHE_DIRNAME = "enrichment"
+
+class EnrichmentError(Exception):
+    """Raised when the enrichment dataset cannot be read."""
+    pass
+
+def _parse_range(row: Dict[str, str], start_column: Optional[str], end_column: Optional[str],
+                 network_column: Optional[str]) -> Tuple[bytes, bytes]:
+    if network_column is not None:
+        address, _, prefix = row[network_column].strip().partition("/")
+        start = pack_ip(address)
+        length = int(prefix) if prefix else (32 if "." in address else 128)
+        length += 96 if "." in address else 0
+        value = int.from_bytes(start, "big")
+        host_bits = (1 << (128 - length)) - 1
+        return (value & ~host_bits).to_bytes(16, "big"), (value | host_bits).to_bytes(16, "big")
+    return pack_ip(row[start_column].strip()), pack_ip(row[end_column].strip())
+
+def _find_column(header: List[str], names: Tuple[str, ...]) -> Optional[str]:
+    lowered = {name.strip().lower(): name for name in header}
+    for name in names:
+        if name in lowered:
+            return lowered[name]
+    return None
+
+class IpRangeDatabase:
+    """
+    Address ranges with attributes, compiled for vectorized lookup.
+
+    Ranges are kept as sorted start/end arrays per address family (uint32
+    for IPv4, packed 16-byte strings for IPv6); a lookup is one
+    searchsorted over all addresses followed by an end check. Attribute
+    values are dictionary-encoded per column.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.v4_start = arrays["v4_start"]
+        self.v4_end = arrays["v4_end"]
+        self.v4_rows = arrays["v4_rows"]
+        self.v6_start = arrays["v6_start"]
+        self.v6_end = arrays["v6_end"]
+        self.v6_rows = arrays["v6_rows"]
+        self.fields: List[str] = arrays["fields"].tolist()
+        self.codes = {field: arrays[f"codes:{field}"] for field in self.fields}
+        self.values = {field: arrays[f"values:{field}"].tolist() for field in self.fields}
+
+    @classmethod
+    def from_csv(cls, path: str) -> "IpRangeDatabase":
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            reader = csv.DictReader(f)
+            header = reader.fieldnames or []
+            start_column = _find_column(header, START_COLUMNS)
+            end_column = _find_column(header, END_COLUMNS)
+            network_column = _find_column(header, NETWORK_COLUMNS)
+            if network_column is None and (start_column is None or end_column is None):
+                raise EnrichmentError(f"No range columns in {path}; expected start/end or network")
+            fields = [name for name in header if name not in (start_column, end_column, network_column)]
+
+            starts, ends = [], []
+            lookups = {field: {"": 0} for field in fields}
+            values = {field: [""] for field in fields}
+            codes = {field: [] for field in fields}
+            invalid = 0
+            for row in reader:
+                try:
+                    start, end = _parse_range(row, start_column, end_column, network_column)
+                except (OSError, ValueError, AttributeError):
+                    invalid += 1
+                    continue
+                starts.append(start)
+                ends.append(end)
+                for field in fields:
+                    value = (row.get(field) or "").strip()
+                    code = lookups[field].get(value)
+                    if code is None:
+                        code = lookups[field][value] = len(values[field])
+                        values[field].append(value)
+                    codes[field].append(code)
+        if invalid:
+            logger.warning(f"Skipped {invalid} invalid ranges in {path}")
+
+        start = np.array(starts, dtype="S16")
+        end = np.array(ends, dtype="S16")
+        rows = np.arange(start.size, dtype=np.int64)
+        raw_start = start.view(np.uint8).reshape(-1, 16)
+        raw_end = end.view(np.uint8).reshape(-1, 16)
+        is_v4 = (raw_start[:, :12] == V4_MAPPED_PREFIX).all(axis=1) & (raw_end[:, :12] == V4_MAPPED_PREFIX).all(axis=1)
+
+        def v4_column(raw: np.ndarray) -> np.ndarray:
+            return np.ascontiguousarray(raw[is_v4, 12:]).view(">u4").ravel().astype(np.uint32)
+
+        v4_start, v4_end, v4_rows = v4_column(raw_start), v4_column(raw_end), rows[is_v4]
+        v6_start, v6_end, v6_rows = start[~is_v4], end[~is_v4], rows[~is_v4]
+        v4_order = np.argsort(v4_start, kind="stable")
+        v6_order = np.argsort(v6_start, kind="stable")
+        arrays = {
+            "v4_start": v4_start[v4_order], "v4_end": v4_end[v4_order], "v4_rows": v4_rows[v4_order],
+            "v6_start": v6_start[v6_order], "v6_end": v6_end[v6_order], "v6_rows": v6_rows[v6_order],
+            "fields": np.array(fields, dtype=str)
+        }
+        for field in fields:
+            arrays[f"codes:{field}"] = np.array(codes[field], dtype=np.uint32)
+            arrays[f"values:{field}"] = np.array(values[field], dtype=str)
+        logger.info(f"Loaded {start.size} address ranges from {path}")
+        return cls(arrays)
+
+    def save(self, path: str) -> None:
+        arrays = {
+            "v4_start": self.v4_start, "v4_end": self.v4_end, "v4_rows": self.v4_rows,
+            "v6_start": self.v6_start, "v6_end": self.v6_end, "v6_rows": self.v6_rows,
+            "fields": np.array(self.fields, dtype=str)
+        }
+        for field in self.fields:
+            arrays[f"codes:{field}"] = self.codes[field]
+            arrays[f"values:{field}"] = np.array(self.values[field], dtype=str)
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IpRangeDatabase":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def lookup(self, addresses: np.ndarray) -> np.ndarray:
+        """
+        Return the dataset row of the range holding each packed address,
+        or -1. Sorted (e.g. unique) input is fastest.
+        """
+        addresses = np.ascontiguousarray(addresses, dtype="S16")
+        result = np.full(addresses.size, -1, dtype=np.int64)
+        raw = addresses.view(np.uint8).reshape(-1, 16)
+        is_v4 = (raw[:, :12] == V4_MAPPED_PREFIX).all(axis=1)
+
+        rows = np.flatnonzero(is_v4)
+        if rows.size and self.v4_start.size:
+            keys = np.ascontiguousarray(raw[rows, 12:]).view(">u4").ravel().astype(np.uint32)
+            result[rows] = self._search(keys, self.v4_start, self.v4_end, self.v4_rows)
+        rows = np.flatnonzero(~is_v4)
+        if rows.size and self.v6_start.size:
+            result[rows] = self._search(addresses[rows], self.v6_start, self.v6_end, self.v6_rows)
+        return result
+
+    @staticmethod
+    def _search(keys: np.ndarray, starts: np.ndarray, ends: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        # The candidate is the last range starting at or before the key
+        pos = np.searchsorted(starts, keys, side="right") - 1
+        inside = pos >= 0
+        inside[inside] = keys[inside] <= ends[pos[inside]]
+        return np.where(inside, ids[pos.clip(min=0)], -1)
+
+    def record(self, row: int) -> Dict[str, str]:
+        """Attributes of a dataset row, without empty values."""
+        record = {}
+        for field in self.fields:
+            value = self.values[field][self.codes[field][row]]
+            if value:
+                record[field] = value
+        return record
+
+    def annotate(self, addresses: np.ndarray) -> Dict[bytes, Dict[str, str]]:
+        """Return attributes for every distinct packed address found in the dataset."""
+        unique, _ = unique_addresses(addresses)
+        rows = self.lookup(unique)
+        found = np.flatnonzero(rows >= 0)
+        records: Dict[int, Dict[str, str]] = {}
+        annotated = {}
+        for address, row in zip(unique[found].tolist(), rows[found].tolist()):
+            if row not in records:
+                records[row] = self.record(row)
+            annotated[address] = records[row]
+        return annotated
+
+def _dataset_signature(path: str) -> str:
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+_database: Optional[IpRangeDatabase] = None
+_database_signature: Optional[str] = None
+
+def get_ip_database() -> Optional[IpRangeDatabase]:
+    """
+    Process-wide enrichment dataset, or None when none is configured.
+
+    The compiled form is cached under ANALYSIS_DATA_DIR keyed by the
+    dataset's path, size and modification time, so only the first worker
+    to see a new version parses the CSV.
+    """
+    global _database, _database_signature
+    path = settings.IP_ENRICHMENT_DB
+    if not path or not os.path.exists(path):
+        return None
+    signature = _dataset_signature(path)
+    if signature == _database_signature:
+        return _database
+
+    cache_dir = os.path.join(settings.ANALYSIS_DATA_DIR, ENRICHMENT_CACHE_DIRNAME)
+    cache_path = os.path.join(cache_dir, f"{signature}.npz")
+    try:
+        if os.path.exists(cache_path):
+            database = IpRangeDatabase.load(cache_path)
+        else:
+            database = IpRangeDatabase.from_csv(path)
+            os.makedirs(cache_dir, exist_ok=True)
+            database.save(cache_path)
+    except (OSError, ValueError, EnrichmentError) as e:
+        logger.error(f"Failed to load enrichment dataset {path}: {str(e)}")
+        return None
+    _database, _database_signature = database, signature
+    return database
+
+def enrich_ips(ips: List[str]) -> Dict[str, Dict[str, str]]:
+    """Attributes of each address in ips found in the dataset, keyed by address string."""
+    database = get_ip_database()
+    if database is None or not ips:
+        return {}
+    packed = []
+    for ip in ips:
+        try:
+            packed.append(pack_ip(ip))
+        except (OSError, ValueError):
+            continue
+    if not packed:
+        return {}
+    annotated = database.annotate(np.array(packed, dtype="S16"))
+    return {format_ip(address): record for address, record in annotated.items()}
@@ -18,6 +18,7 @@ from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
 from core.enums import AnalysisStatus, FileType
 from core.exceptions import FileAnalysisError
+from utils.seekable_compression import open_evidence, evidence_size
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -52,7 +53,7 @@ def calculate_entropy(file_path: str, chunk_size: int = 8192) -> float:
         byte_counts = [0] * 256
         total_bytes = 0
 
-        with open(file_path, "rb") as f:
+        with open_evidence(file_path) as f:
             for chunk in iter(lambda: f.read(chunk_size), b""):
                 for byte in chunk:
                     byte_counts[byte] += 1
@@ -110,24 +111,26 @@ def get_file_metadata(file_path: str) -> Dict[str, Any]:
         if not os.path.exists(temp_file_path):
             raise FileNotFoundError(f"No such file: '{temp_file_path}'")
 
+        with open_evidence(temp_file_path) as f:
+            head = f.read(2048)
+
         metadata = {
-            "size": os.path.getsize(temp_file_path),
-            "mime_type": magic.from_file(temp_file_path, mime=True),
+            "size": evidence_size(temp_file_path),
+            "mime_type": magic.from_buffer(head, mime=True),
             "last_modified": os.path.getmtime(temp_file_path),
             "entropy": calculate_entropy(temp_file_path),
         }
 
         # Calculate MD5 hash
         md5_hash = hashlib.md5()
-        with open(temp_file_path, "rb") as f:
+        with open_evidence(temp_file_path) as f:
             for chunk in iter(lambda: f.read(4096), b""):
                 md5_hash.update(chunk)
         metadata["md5"] = md5_hash.hexdigest()
 
         # If it's a text file, include a preview
         if metadata["mime_type"].startswith("text/"):
-            with open(temp_file_path, "r", encoding="utf-8", errors="ignore") as f:
-                metadata["preview"] = f.read(100)  # First 100 chars
+            metadata["preview"] = head.decode("utf-8", errors="ignore")[:100]  # First 100 chars
 
         logger.info(f"Extracted metadata for {file_path}: {metadata}")
         return metadata
@@ -255,6 +258,29 @@ def analyze_directory_task(self, directory_path: str, file_id: int) -> List[dict
     logger.info(f"Completed directory analysis for {directory_path} with {len(analysis_results)} files")
     return analysis_results
 
+@shared_task(base=CustomTask)
+def analyze_file_task(file_path: str, file_id: int) -> Dict[str, Any]:
+    """
+    Extract metadata for a single stored file and store the result.
+    Args:
+        file_path: Local path of the stored file.
+        file_id: ID of the File record.
+    Returns:
+        File metadata dictionary.
+    """
+    result = get_file_metadata(file_path)
+    with SessionLocal() as db:
+        analysis = FileAnalysis(
+            file_id=file_id,
+            metadata_json=json.dumps(result),
+            mime_type=result["mime_type"],
+            file_size=result["size"],
+            file_hash=result["md5"]
+        )
+        db.add(analysis)
+        db.commit()
+    return result
+
 async def update_analysis_status(
     file_id: int,
     status: AnalysisStatus,
@@ -0,0 +1,324 @@
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models.network_flow import NetworkFlow
+from services.pcap_reader import format_ip_column
+from services.indicators import unique_addresses
+from utils.vector_hash import hash_columns
+
+logger = logging.getLogger(__name__)
+
+# Flow key: endpoints are ordered so that (a_ip, a_port) <= (b_ip, b_port),
+# which makes both directions of a conversation map to the same key.
+FLOW_KEY_DTYPE = np.dtype([
+    ("a_ip", "S16"),
+    ("b_ip", "S16"),
+    ("a_port", "<u2"),
+    ("b_port", "<u2"),
+    ("protocol", "u1"),
+])
+
+FLOW_DTYPE = np.dtype(FLOW_KEY_DTYPE.descr + [
+    ("first_seen", "<f8"),
+    ("last_seen", "<f8"),
+    ("packets_ab", "<u8"),
+    ("packets_ba", "<u8"),
+    ("bytes_ab", "<u8"),
+    ("bytes_ba", "<u8"),
+    ("tcp_flags", "u1"),    # OR of all TCP flags seen
+    ("initiator", "u1"),    # 0 if a sent the first packet, 1 if b did
+])
+
+FLOW_INSERT_BATCH = 10_000
+MAX_LOAD_FACTOR = 0.5
+
+def flow_keys(packets: np.ndarray):
+    """
+    Build canonical flow keys for decoded packets.
+
+    Returns:
+        Tuple of (keys, reverse) where reverse is True for packets sent
+        from the b endpoint to the a endpoint.
+    """
+    src, dst = packets["src_ip"], packets["dst_ip"]
+    sport, dport = packets["src_port"], packets["dst_port"]
+    reverse = (src > dst) | ((src == dst) & (sport > dport))
+    keys = np.empty(packets.size, dtype=FLOW_KEY_DTYPE)
+    keys["a_ip"] = np.where(reverse, dst, src)
+    keys["b_ip"] = np.where(reverse, src, dst)
+    keys["a_port"] = np.where(reverse, dport, sport)
+    keys["b_port"] = np.where(reverse, sport, dport)
+    keys["protocol"] = packets["protocol"]
+    return keys, reverse
+
+def flow_channels(flows: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Group FLOW_DTYPE rows by (client, server, server port, protocol).
+
+    Returns:
+        Dict of addresses (distinct packed addresses), client and server
+        (per-flow indexes into addresses), port (server port), protocol
+        and channel (per-flow channel number, dense and ordered by key).
+    """
+    # Stored flows are oriented client -> server; a is the client unless b initiated
+    reverse = flows["initiator"] == 1
+    client = np.where(reverse, flows["b_ip"], flows["a_ip"])
+    server = np.where(reverse, flows["a_ip"], flows["b_ip"])
+    port = np.where(reverse, flows["a_port"], flows["b_port"])
+    protocol = flows["protocol"]
+
+    addresses, inverse = unique_addresses(np.concatenate([client, server]))
+    client_id, server_id = inverse[:flows.size], inverse[flows.size:]
+    _, pair = np.unique(client_id * max(addresses.size, 1) + server_id, return_inverse=True)
+    key = (pair.ravel().astype(np.int64) << 24) | (port.astype(np.int64) << 8) | protocol
+    _, channel = np.unique(key, return_inverse=True)
+    return {
+        "addresses": addresses,
+        "client": client_id,
+        "server": server_id,
+        "port": port,
+        "protocol": protocol,
+        "channel": channel.ravel()
+    }
+
+def _hash_keys(keys: np.ndarray) -> np.ndarray:
+    return hash_columns(keys["a_ip"], keys["b_ip"], keys["a_port"], keys["b_port"], keys["protocol"])
+
+class FlowTable:
+    """
+    Bidirectional 5-tuple session table.
+
+    Flows live in one structured NumPy array; an open-addressing hash table
+    of int64 slots maps keys to rows. Lookups and inserts are done for a
+    whole batch of keys at once with vectorized linear probing, so there
+    is no Python object per flow.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self._capacity = 1 << max(4, int(capacity - 1).bit_length())
+        self.clear()
+
+    def clear(self) -> None:
+        """Drop all flows, e.g. before re-reading a capture with another decoder."""
+        self._slots = np.full(self._capacity, -1, dtype=np.int64)
+        self._flows = np.zeros(self._capacity // 2, dtype=FLOW_DTYPE)
+        self._hashes = np.zeros(self._capacity // 2, dtype=np.uint64)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def flows(self) -> np.ndarray:
+        """View of the live flow rows."""
+        return self._flows[:self.size]
+
+    def canonical_order(self) -> np.ndarray:
+        """
+        Row order of the flows sorted by first seen, then key, which does
+        not depend on how packets were batched or sharded.
+        """
+        flows = self.flows
+        return np.lexsort((
+            flows["protocol"], flows["b_port"], flows["a_port"],
+            flows["b_ip"], flows["a_ip"], flows["first_seen"]
+        ))
+
+    def to_array(self) -> np.ndarray:
+        """Return a copy of all flows in canonical order."""
+        return self.flows[self.canonical_order()]
+
+    def add_batch(self, packets: np.ndarray) -> None:
+        """Aggregate a decoded PACKET_DTYPE batch into the table."""
+        packets = packets[packets["ip_version"] != 0]
+        if not packets.size:
+            return
+        keys, reverse = flow_keys(packets)
+        ids = self._lookup_or_insert(keys, _hash_keys(keys))
+        rows, inverse = np.unique(ids, return_inverse=True)
+        count = rows.size
+        lengths = packets["length"].astype(np.uint64)
+
+        ts = packets["ts"]
+        aggregates = np.zeros(count, dtype=FLOW_DTYPE)
+        first = np.full(count, np.inf)
+        last = np.full(count, -np.inf)
+        np.minimum.at(first, inverse, ts)
+        np.maximum.at(last, inverse, ts)
+        aggregates["first_seen"] = first
+        aggregates["last_seen"] = last
+
+        forward = ~reverse
+        aggregates["packets_ab"] = np.bincount(inverse[forward], minlength=count)
+        aggregates["packets_ba"] = np.bincount(inverse[reverse], minlength=count)
+        aggregates["bytes_ab"] = np.bincount(inverse[forward], weights=lengths[forward], minlength=count)
+        aggregates["bytes_ba"] = np.bincount(inverse[reverse], weights=lengths[reverse], minlength=count)
+        flags = np.zeros(count, dtype=np.uint8)
+        np.bitwise_or.at(flags, inverse, packets["tcp_flags"])
+        aggregates["tcp_flags"] = flags
+
+        # Direction of the earliest packet of each flow in this batch
+        order = np.lexsort((ts, inverse))
+        earliest = order[np.searchsorted(inverse[order], np.arange(count))]
+        aggregates["initiator"] = reverse[earliest]
+        self._update(rows, aggregates)
+
+    def merge(self, other: "FlowTable") -> None:
+        """Merge another table (e.g. from a capture shard) into this one."""
+        if not other.size:
+            return
+        aggregates = other.flows
+        keys = np.empty(aggregates.size, dtype=FLOW_KEY_DTYPE)
+        for name in FLOW_KEY_DTYPE.names:
+            keys[name] = aggregates[name]
+        self._update(self._lookup_or_insert(keys, other._hashes[:other.size]), aggregates)
+
+    def _update(self, rows: np.ndarray, aggregates: np.ndarray) -> None:
+        """Fold per-flow aggregates into distinct table rows."""
+        flows = self._flows
+        earlier = aggregates["first_seen"] < flows["first_seen"][rows]
+        flows["initiator"][rows] = np.where(earlier, aggregates["initiator"], flows["initiator"][rows])
+        flows["first_seen"][rows] = np.minimum(flows["first_seen"][rows], aggregates["first_seen"])
+        flows["last_seen"][rows] = np.maximum(flows["last_seen"][rows], aggregates["last_seen"])
+        for name in ("packets_ab", "packets_ba", "bytes_ab", "bytes_ba"):
+            flows[name][rows] += aggregates[name]
+        flows["tcp_flags"][rows] |= aggregates["tcp_flags"]
+
+    def _lookup_or_insert(self, keys: np.ndarray, hashes: np.ndarray):
+        """
+        Return the row id of every key, inserting missing ones.
+        Keys may repeat; duplicates resolve to the same row.
+        """
+        self._reserve(self.size + keys.size)
+        mask = np.uint64(self._slots.size - 1)
+        probe = (hashes & mask).astype(np.int64)
+        ids = np.full(keys.size, -1, dtype=np.int64)
+        pending = np.arange(keys.size)
+
+        while pending.size:
+            slot = probe[pending]
+            occupant = self._slots[slot]
+            empty = occupant < 0
+
+            # Occupied slots: hit if the stored key matches, otherwise probe on
+            occupied = pending[~empty]
+            rows = occupant[~empty]
+            match = self._hashes[rows] == hashes[occupied]
+            for name in FLOW_KEY_DTYPE.names:
+                match &= self._flows[name][rows] == keys[name][occupied]
+            ids[occupied[match]] = rows[match]
+            missed = occupied[~match]
+            probe[missed] = (probe[missed] + 1) & int(mask)
+
+            # Empty slots: the first key claiming a slot wins, the rest retry it
+            claimants = pending[empty]
+            claimed_slots, first = np.unique(slot[empty], return_index=True)
+            winners = claimants[first]
+            new_rows = np.arange(self.size, self.size + winners.size)
+            self._slots[claimed_slots] = new_rows
+            self._hashes[new_rows] = hashes[winners]
+            for name in FLOW_KEY_DTYPE.names:
+                self._flows[name][new_rows] = keys[name][winners]
+            self._flows["first_seen"][new_rows] = np.inf
+            self._flows["last_seen"][new_rows] = -np.inf
+            self.size += winners.size
+            ids[winners] = new_rows
+
+            losers = np.setdiff1d(claimants, winners, assume_unique=True)
+            pending = np.concatenate([missed, losers])
+        return ids
+
+    def _reserve(self, needed: int) -> None:
+        if needed > self._flows.size:
+            grown = np.zeros(max(needed, self._flows.size * 2), dtype=FLOW_DTYPE)
+            grown[:self.size] = self._flows[:self.size]
+            self._flows = grown
+            hashes = np.zeros(grown.size, dtype=np.uint64)
+            hashes[:self.size] = self._hashes[:self.size]
+            self._hashes = hashes
+        if needed <= self._slots.size * MAX_LOAD_FACTOR:
+            return
+
+        capacity = self._slots.size
+        while needed > capacity * MAX_LOAD_FACTOR:
+            capacity *= 2
+        self._slots = np.full(capacity, -1, dtype=np.int64)
+        mask = np.uint64(capacity - 1)
+        rows = np.arange(self.size)
+        probe = (self._hashes[:self.size] & mask).astype(np.int64)
+        while rows.size:
+            slots, first = np.unique(probe, return_index=True)
+            free = self._slots[slots] < 0
+            self._slots[slots[free]] = rows[first[free]]
+            placed = np.zeros(rows.size, dtype=bool)
+            placed[first[free]] = True
+            rows, probe = rows[~placed], probe[~placed]
+            probe = np.where(self._slots[probe] >= 0, (probe + 1) & int(mask), probe)
+
+def flow_rows(flows: np.ndarray, analysis_id: int, indicators: Optional[List] = None) -> List[Dict]:
+    """
+    Convert flow rows to NetworkFlow column dicts oriented client -> server.
+    indicators holds the indicator matches of each row (None if clean).
+    """
+    swap = flows["initiator"] == 1
+    a_ips = format_ip_column(flows["a_ip"])
+    b_ips = format_ip_column(flows["b_ip"])
+    src_ip = np.where(swap, b_ips, a_ips)
+    dst_ip = np.where(swap, a_ips, b_ips)
+    src_port = np.where(swap, flows["b_port"], flows["a_port"])
+    dst_port = np.where(swap, flows["a_port"], flows["b_port"])
+    packets_sent = np.where(swap, flows["packets_ba"], flows["packets_ab"])
+    packets_received = np.where(swap, flows["packets_ab"], flows["packets_ba"])
+    bytes_sent = np.where(swap, flows["bytes_ba"], flows["bytes_ab"])
+    bytes_received = np.where(swap, flows["bytes_ab"], flows["bytes_ba"])
+    columns = zip(
+        src_ip.tolist(), dst_ip.tolist(), src_port.tolist(), dst_port.tolist(),
+        flows["protocol"].tolist(), flows["first_seen"].tolist(), flows["last_seen"].tolist(),
+        packets_sent.tolist(), packets_received.tolist(), bytes_sent.tolist(),
+        bytes_received.tolist(), flows["tcp_flags"].tolist(),
+        indicators if indicators is not None else [None] * flows.size
+    )
+    return [
+        {
+            "analysis_id": analysis_id,
+            "src_ip": s,
+            "dst_ip": d,
+            "src_port": sp,
+            "dst_port": dp,
+            "protocol": proto,
+            "first_seen": first,
+            "last_seen": last,
+            "duration": last - first,
+            "packets_sent": ps,
+            "packets_received": pr,
+            "bytes_sent": bs,
+            "bytes_received": br,
+            "total_packets": ps + pr,
+            "total_bytes": bs + br,
+            "tcp_flags": flags,
+            "indicator_count": len(matches) if matches else 0,
+            "indicators": matches
+        }
+        for s, d, sp, dp, proto, first, last, ps, pr, bs, br, flags, matches in columns
+    ]
+
+def persist_flows(db: Session, analysis_id: int, table: FlowTable, indicators: Optional[List] = None) -> int:
+    """
+    Bulk insert all flows of an analysis in canonical order. indicators,
+    when given, holds the indicator matches of each row of table.flows.
+    Returns the number of flows written.
+    """
+    order = table.canonical_order()
+    flows = table.flows[order]
+    if indicators is not None:
+        indicators = [indicators[row] for row in order.tolist()]
+    for start in range(0, flows.size, FLOW_INSERT_BATCH):
+        stop = start + FLOW_INSERT_BATCH
+        db.execute(insert(NetworkFlow), flow_rows(
+            flows[start:stop], analysis_id, None if indicators is None else indicators[start:stop]
+        ))
+    db.commit()
+    logger.info(f"Stored {flows.size} flows for analysis {analysis_id}")
+    return int(flows.size)
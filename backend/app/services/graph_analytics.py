@@ -0,0 +1,283 @@
+import logging
+import threading
+import numpy as np
+import networkx as nx
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from core.config import settings
+from models.network import NetworkNode, NetworkConnection
+
+logger = logging.getLogger(__name__)
+
+# Topology analytics are computed on first use and kept with the graph
+# they were computed on. A graph is identified by the row count and
+# highest id of its analysis' connections: persist_topology replaces all
+# rows, so any rebuild, in this process or another, changes the version.
+CENTRALITY_METRICS = ("degree", "in_degree", "out_degree", "bytes", "betweenness")
+NEIGHBORHOOD_DIRECTIONS = ("out", "in", "both")
+NEIGHBORHOOD_CACHE_SIZE = 64
+
+GraphVersion = Tuple[int, int]
+
+class GraphAnalyticsError(Exception):
+    """Raised when an analytics query is invalid for the graph."""
+    pass
+
+def expand_frontier(indptr: np.ndarray, indices: np.ndarray, frontier: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All (source, target) edges out of the frontier nodes of a CSR adjacency."""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return np.repeat(frontier, counts), indices[np.arange(total) + offsets]
+
+def sampled_betweenness(indptr: np.ndarray, indices: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Unnormalized betweenness of a directed unweighted graph accumulated
+    over the given source nodes (Brandes).
+
+    Each source is a level-synchronous BFS: one level's edges are
+    expanded, path counts propagated and dependencies accumulated with
+    array operations, so the cost per source is a handful of NumPy calls
+    per BFS level rather than Python work per edge.
+    """
+    count = indptr.size - 1
+    betweenness = np.zeros(count)
+    for source in sources.tolist():
+        dist = np.full(count, -1, dtype=np.int64)
+        sigma = np.zeros(count)
+        dist[source] = 0
+        sigma[source] = 1
+        frontier = np.array([source], dtype=np.int64)
+        levels = []
+        depth = 0
+        while frontier.size:
+            tails, heads = expand_frontier(indptr, indices, frontier)
+            unseen = heads[dist[heads] < 0]
+            frontier = np.unique(unseen)
+            dist[frontier] = depth + 1
+            shortest = dist[heads] == depth + 1
+            tails, heads = tails[shortest], heads[shortest]
+            sigma += np.bincount(heads, weights=sigma[tails], minlength=count)
+            levels.append((tails, heads))
+            depth += 1
+        delta = np.zeros(count)
+        for tails, heads in reversed(levels):
+            delta += np.bincount(tails, weights=sigma[tails] / sigma[heads] * (1 + delta[heads]), minlength=count)
+        delta[source] = 0
+        betweenness += delta
+    return betweenness
+
+class TopologyGraph:
+    """
+    Directed host graph of one analysis with lazily cached analytics.
+
+    Nodes are node ids (addresses); the protocol/port connections between
+    two nodes are merged into one edge carrying the summed bytes, packets
+    and flows and the distinct ports. Every analytic is computed once per
+    graph and served from memory afterwards.
+    """
+
+    def __init__(self, graph: nx.DiGraph, version: GraphVersion):
+        self.graph = graph
+        self.version = version
+        self._lock = threading.RLock()
+        self._results: Dict[str, Any] = {}
+        self._neighborhoods: "OrderedDict[Tuple[str, int, str], Dict]" = OrderedDict()
+
+    @classmethod
+    def load(cls, db: Session, analysis_id: int, version: GraphVersion) -> "TopologyGraph":
+        graph = nx.DiGraph()
+        nodes = db.query(NetworkNode.id, NetworkNode.node_id, NetworkNode.type).filter(
+            NetworkNode.analysis_id == analysis_id
+        ).all()
+        node_ids = {}
+        for row_id, node_id, node_type in nodes:
+            node_ids[row_id] = node_id
+            graph.add_node(node_id, type=node_type.value if node_type else None)
+
+        connections = db.query(
+            NetworkConnection.source_id, NetworkConnection.target_id, NetworkConnection.port,
+            NetworkConnection.bytes_transferred, NetworkConnection.packets_transferred,
+            NetworkConnection.flow_count
+        ).filter(NetworkConnection.analysis_id == analysis_id)
+        for source_id, target_id, port, size, packets, flows in connections:
+            source, target = node_ids[source_id], node_ids[target_id]
+            edge = graph.get_edge_data(source, target)
+            if edge is None:
+                graph.add_edge(source, target, bytes=size or 0, packets=packets or 0, flows=flows or 0,
+                               ports=set() if port is None else {port})
+                continue
+            edge["bytes"] += size or 0
+            edge["packets"] += packets or 0
+            edge["flows"] += flows or 0
+            if port is not None:
+                edge["ports"].add(port)
+        logger.info(f"Loaded graph of analysis {analysis_id}: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+        return cls(graph, version)
+
+    def _cached(self, name: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name not in self._results:
+                self._results[name] = compute()
+            return self._results[name]
+
+    @property
+    def approximate(self) -> bool:
+        """Whether sampled metrics are estimates rather than exact values."""
+        return self.graph.number_of_nodes() > settings.GRAPH_EXACT_NODES
+
+    def _csr(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        def compute():
+            nodes = list(self.graph)
+            index = {node: i for i, node in enumerate(nodes)}
+            sources = np.fromiter((index[u] for u, _ in self.graph.edges()), dtype=np.int64, count=self.graph.number_of_edges())
+            targets = np.fromiter((index[v] for _, v in self.graph.edges()), dtype=np.int64, count=sources.size)
+            order = np.argsort(sources, kind="stable")
+            indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+            return nodes, indptr, targets[order]
+        return self._cached("csr", compute)
+
+    def _betweenness(self) -> Dict[str, float]:
+        # Exact betweenness is O(nodes * edges); large graphs use Brandes'
+        # estimator over a fixed random sample of source nodes, scaled up
+        # by nodes / samples. Scores are normalized like networkx.
+        nodes, indptr, indices = self._csr()
+        count = len(nodes)
+        if self.approximate:
+            sources = np.random.default_rng(0).choice(count, min(settings.GRAPH_BETWEENNESS_SAMPLES, count), replace=False)
+        else:
+            sources = np.arange(count)
+        scores = sampled_betweenness(indptr, indices, sources)
+        if count > 2:
+            scores *= count / max(sources.size, 1) / ((count - 1) * (count - 2))
+        return dict(zip(nodes, scores.tolist()))
+
+    def centrality(self, metric: str) -> Dict[str, float]:
+        """Score of every node for one of CENTRALITY_METRICS."""
+        if metric == "degree":
+            return self._cached(metric, lambda: dict(self.graph.degree()))
+        if metric == "in_degree":
+            return self._cached(metric, lambda: dict(self.graph.in_degree()))
+        if metric == "out_degree":
+            return self._cached(metric, lambda: dict(self.graph.out_degree()))
+        if metric == "bytes":
+            return self._cached(metric, lambda: dict(self.graph.degree(weight="bytes")))
+        if metric == "betweenness":
+            return self._cached(metric, self._betweenness)
+        raise GraphAnalyticsError(f"Unknown centrality metric: {metric}")
+
+    def top(self, metric: str, limit: int) -> List[Dict]:
+        scores = self.centrality(metric)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{"node": node, "score": score} for node, score in ranked]
+
+    def components(self) -> List[List[str]]:
+        """Weakly connected components, largest first."""
+        def compute():
+            components = [sorted(component) for component in nx.weakly_connected_components(self.graph)]
+            return sorted(components, key=lambda component: (-len(component), component[0]))
+        return self._cached("components", compute)
+
+    def communities(self) -> List[List[str]]:
+        """
+        Communities of the undirected graph weighted by bytes, largest first.
+
+        Louvain is used where networkx provides it and the graph is small
+        enough for exact metrics; otherwise near-linear label propagation.
+        """
+        def compute():
+            undirected = self.graph.to_undirected(as_view=True)
+            louvain = getattr(nx.community, "louvain_communities", None)
+            if louvain is not None and not self.approximate:
+                found = louvain(undirected, weight="bytes", seed=0)
+            else:
+                found = nx.community.label_propagation_communities(undirected)
+            communities = [sorted(community) for community in found]
+            return sorted(communities, key=lambda community: (-len(community), community[0]))
+        return self._cached("communities", compute)
+
+    def neighborhood(self, node: str, hops: int, direction: str = "both") -> Dict:
+        """
+        Nodes within `hops` of node, following edges out of it, into it or
+        both ways, and the edges between them.
+        """
+        if node not in self.graph:
+            raise KeyError(node)
+        if direction not in NEIGHBORHOOD_DIRECTIONS:
+            raise GraphAnalyticsError(f"Unknown direction: {direction}")
+        key = (node, hops, direction)
+        with self._lock:
+            if key in self._neighborhoods:
+                self._neighborhoods.move_to_end(key)
+                return self._neighborhoods[key]
+
+        if direction == "out":
+            view = self.graph
+        elif direction == "in":
+            view = self.graph.reverse(copy=False)
+        else:
+            view = self.graph.to_undirected(as_view=True)
+        distances = nx.single_source_shortest_path_length(view, node, cutoff=hops)
+        subgraph = self.graph.subgraph(distances)
+        result = {
+            "nodes": [{"node": name, "hops": distance} for name, distance in sorted(distances.items(), key=lambda item: (item[1], item[0]))],
+            "edges": [
+                {
+                    "source": source,
+                    "target": target,
+                    "bytes": data["bytes"],
+                    "packets": data["packets"],
+                    "flows": data["flows"],
+                    "ports": sorted(data["ports"])
+                }
+                for source, target, data in subgraph.edges(data=True)
+            ]
+        }
+        with self._lock:
+            self._neighborhoods[key] = result
+            while len(self._neighborhoods) > NEIGHBORHOOD_CACHE_SIZE:
+                self._neighborhoods.popitem(last=False)
+        return result
+
+def graph_version(db: Session, analysis_id: int) -> GraphVersion:
+    count, last_id = db.query(func.count(NetworkConnection.id), func.max(NetworkConnection.id)).filter(
+        NetworkConnection.analysis_id == analysis_id
+    ).one()
+    return int(count or 0), int(last_id or 0)
+
+class GraphCache:
+    """
+    Per-process LRU of analysis graphs.
+
+    get() checks the stored version with one aggregate query and reloads
+    the graph when the topology was rebuilt since it was cached.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.GRAPH_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._graphs: "OrderedDict[int, TopologyGraph]" = OrderedDict()
+
+    def get(self, db: Session, analysis_id: int) -> TopologyGraph:
+        version = graph_version(db, analysis_id)
+        with self._lock:
+            graph = self._graphs.get(analysis_id)
+            if graph is not None and graph.version == version:
+                self._graphs.move_to_end(analysis_id)
+                return graph
+
+        graph = TopologyGraph.load(db, analysis_id, version)
+        with self._lock:
+            self._graphs[analysis_id] = graph
+            self._graphs.move_to_end(analysis_id)
+            while len(self._graphs) > self.size:
+                self._graphs.popitem(last=False)
+        return graph
+
+    def invalidate(self, analysis_id: int) -> None:
+        with self._lock:
+            self._graphs.pop(analysis_id, None)
@@ -0,0 +1,183 @@
+import logging
+import numpy as np
+from typing import Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from core.config import settings
+from models.network import NetworkNode, NetworkConnection
+
+logger = logging.getLogger(__name__)
+
+# Fruchterman-Reingold layout. Up to LAYOUT_EXACT_NODES nodes every pair
+# of nodes repels; above that repulsion is approximated on a hierarchy of
+# grids (a quadtree with fixed cells, as in Barnes-Hut): nodes in the same
+# or an adjacent finest cell repel exactly, farther nodes through the
+# centroids of ever coarser cells with distance.
+LAYOUT_EXACT_NODES = 1500
+LAYOUT_MAX_DEPTH = 10       # Finest grid has at most 2^10 x 2^10 cells
+LAYOUT_TEMPERATURE = 0.1    # Largest step of the first iteration
+LAYOUT_GRAVITY = 0.05       # Keeps disconnected components near the centre
+LAYOUT_PRECISION = 4        # Decimals of the stored [0, 1] coordinates
+
+ProgressCallback = Callable[[int, int, List[str], np.ndarray], None]
+
+def _repulsion_exact(pos: np.ndarray, k2: float) -> np.ndarray:
+    delta = pos[:, None, :] - pos[None, :, :]
+    dist2 = np.maximum((delta ** 2).sum(axis=-1), 1e-12)
+    np.fill_diagonal(dist2, np.inf)
+    return (delta * (k2 / dist2)[..., None]).sum(axis=1)
+
+def _repulsion_grid(pos: np.ndarray, k2: float) -> np.ndarray:
+    count = pos.shape[0]
+    low = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    unit = (pos - low) / (span * (1 + 1e-9))
+    depth = int(np.clip(np.ceil(np.log(count) / np.log(4)), 2, LAYOUT_MAX_DEPTH))
+    force = np.zeros_like(pos)
+
+    # Far field: at each level a node feels the cells that are children
+    # of its parent's neighbours but not its own neighbours, each as one
+    # mass at its centroid. Over all levels that covers every node outside
+    # the 3 x 3 cells around the node's finest cell exactly once.
+    for level in range(2, depth + 1):
+        side = 1 << level
+        cxy = (unit * side).astype(np.int64)
+        cell = cxy[:, 0] * side + cxy[:, 1]
+        mass = np.bincount(cell, minlength=side * side).astype(np.float64)
+        centroid = np.stack([np.bincount(cell, weights=pos[:, axis], minlength=side * side) for axis in (0, 1)], axis=1)
+        centroid /= np.maximum(mass, 1)[:, None]
+        base = 2 * ((cxy >> 1) - 1)
+        for ox in range(6):
+            x = base[:, 0] + ox
+            x_valid = (x >= 0) & (x < side)
+            x_near = np.abs(x - cxy[:, 0]) <= 1
+            for oy in range(6):
+                y = base[:, 1] + oy
+                valid = x_valid & (y >= 0) & (y < side) & ~(x_near & (np.abs(y - cxy[:, 1]) <= 1))
+                other = np.where(valid, x * side + y, 0)
+                weight = np.where(valid, mass[other], 0.0)
+                delta = pos - centroid[other]
+                scale = k2 * weight / np.maximum((delta ** 2).sum(axis=1), 1e-12)
+                force += delta * scale[:, None]
+
+    # Near field: exact pairs with the nodes of the 3 x 3 surrounding cells
+    side = 1 << depth
+    cell_xy = (unit * side).astype(np.int64)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+    order = np.argsort(cell, kind="stable")
+    mass = np.bincount(cell, minlength=side * side)
+    starts = np.cumsum(mass) - mass
+    nodes = np.arange(count)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx_, ny_ = cell_xy[:, 0] + dx, cell_xy[:, 1] + dy
+            valid = (nx_ >= 0) & (nx_ < side) & (ny_ >= 0) & (ny_ < side)
+            neighbour = np.where(valid, nx_ * side + ny_, 0)
+            counts = np.where(valid, mass[neighbour], 0)
+            first = np.repeat(starts[neighbour] - (np.cumsum(counts) - counts), counts)
+            i = np.repeat(nodes, counts)
+            j = order[np.arange(i.size) + first]
+            keep = i != j
+            i, j = i[keep], j[keep]
+            delta = pos[i] - pos[j]
+            scale = k2 / np.maximum((delta ** 2).sum(axis=1), 1e-12)
+            force[:, 0] += np.bincount(i, weights=delta[:, 0] * scale, minlength=count)
+            force[:, 1] += np.bincount(i, weights=delta[:, 1] * scale, minlength=count)
+    return force
+
+def _normalized(pos: np.ndarray) -> np.ndarray:
+    low = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    return (pos - low) / span
+
+def force_layout(
+    count: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    positions: Optional[np.ndarray] = None,
+    iterations: Optional[int] = None,
+    every: Optional[int] = None,
+    seed: int = 0
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Lay out an undirected graph of `count` nodes, yielding (iteration,
+    positions scaled into the unit square) every `every` iterations and
+    after the last one.
+
+    positions seeds the layout, e.g. with a previous layout so the
+    picture stays stable; rows that are NaN start at random points.
+    """
+    iterations = iterations or settings.LAYOUT_ITERATIONS
+    every = every or settings.LAYOUT_PUBLISH_INTERVAL
+    rng = np.random.default_rng(seed)
+    pos = rng.random((count, 2)) if positions is None else np.array(positions, dtype=np.float64)
+    missing = np.isnan(pos).any(axis=1)
+    pos[missing] = rng.random((int(missing.sum()), 2))
+    if count < 2:
+        yield iterations, np.full((count, 2), 0.5)
+        return
+
+    k = 1 / np.sqrt(count)
+    repulsion = _repulsion_exact if count <= LAYOUT_EXACT_NODES else _repulsion_grid
+    temperature = LAYOUT_TEMPERATURE
+    cooling = LAYOUT_TEMPERATURE / (iterations + 1)
+    for iteration in range(1, iterations + 1):
+        force = repulsion(pos, k * k)
+        # Edges pull their endpoints together with d^2 / k
+        delta = pos[sources] - pos[targets]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) / k)[:, None]
+        for axis in (0, 1):
+            force[:, axis] -= np.bincount(sources, weights=pull[:, axis], minlength=count)
+            force[:, axis] += np.bincount(targets, weights=pull[:, axis], minlength=count)
+        force -= LAYOUT_GRAVITY * (pos - pos.mean(axis=0)) / k
+
+        length = np.sqrt((force ** 2).sum(axis=1))
+        pos += force * (np.minimum(length, temperature) / np.maximum(length, 1e-12))[:, None]
+        temperature -= cooling
+        if iteration % every == 0 or iteration == iterations:
+            yield iteration, _normalized(pos)
+
+def layout_topology(db: Session, analysis_id: int, on_progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Compute and store the layout of an analysis' topology in
+    NetworkNode.coordinates.
+
+    Coordinates are written (and on_progress called) at every
+    intermediate result, so a client opening the topology while the
+    layout is refined gets the latest positions. Existing coordinates
+    seed the layout.
+
+    Returns:
+        Number of nodes laid out
+    """
+    nodes = db.query(NetworkNode.id, NetworkNode.node_id, NetworkNode.coordinates).filter(
+        NetworkNode.analysis_id == analysis_id
+    ).order_by(NetworkNode.id).all()
+    if not nodes:
+        return 0
+    row_ids = np.array([row_id for row_id, _, _ in nodes], dtype=np.int64)
+    node_ids = [node_id for _, node_id, _ in nodes]
+    seeded = np.array([
+        coordinates if coordinates and len(coordinates) == 2 else (np.nan, np.nan)
+        for _, _, coordinates in nodes
+    ], dtype=np.float64)
+
+    edges = np.array(db.query(NetworkConnection.source_id, NetworkConnection.target_id).filter(
+        NetworkConnection.analysis_id == analysis_id
+    ).all(), dtype=np.int64).reshape(-1, 2)
+    # Parallel edges (other ports, the reverse direction) pull only once
+    ends = np.sort(np.searchsorted(row_ids, edges), axis=1)
+    ends = np.unique(ends[ends[:, 0] != ends[:, 1]], axis=0)
+
+    iterations = settings.LAYOUT_ITERATIONS
+    for iteration, positions in force_layout(len(nodes), ends[:, 0], ends[:, 1], positions=seeded, iterations=iterations):
+        rounded = np.round(positions, LAYOUT_PRECISION)
+        db.execute(update(NetworkNode), [
+            {"id": row_id, "coordinates": coordinates}
+            for row_id, coordinates in zip(row_ids.tolist(), rounded.tolist())
+        ])
+        db.commit()
+        if on_progress is not None:
+            on_progress(iteration, iterations, node_ids, rounded)
+    logger.info(f"Laid out {len(nodes)} nodes and {ends.shape[0]} edges of analysis {analysis_id}")
+    return len(nodes)
@@ -0,0 +1,291 @@
+import os
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from services.pcap_reader import format_ips
+from services.topology_builder import TopologyEdges
+from services.graph_analytics import GraphAnalyticsError, NEIGHBORHOOD_DIRECTIONS, expand_frontier
+from utils.analysis_storage import get_analysis_dir
+
+logger = logging.getLogger(__name__)
+
+GRAPH_INDEX_FILENAME = "graph_index.npz"
+# Time-respecting searches settle arrivals in this many buckets of the
+# graph's time span, earliest first (delta-stepping)
+TEMPORAL_BUCKETS = 64
+
+def graph_index_path(analysis_dir: str) -> str:
+    return os.path.join(analysis_dir, GRAPH_INDEX_FILENAME)
+
+def _csr(keys: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row pointers and edge ids grouping edges by key node."""
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=count), out=indptr[1:])
+    return indptr, np.argsort(keys, kind="stable")
+
+class GraphIndex:
+    """
+    Host graph of an analysis as CSR arrays for path queries.
+
+    The protocol/port edges between two hosts are merged into one edge
+    with the summed bytes and the first and last activity of any of them.
+    Edges are indexed by source and by target, so every query is a
+    breadth-first search that expands a whole hop with a few array
+    operations.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.node_ids: List[str] = arrays["node_ids"].tolist()
+        self.index = {node: i for i, node in enumerate(self.node_ids)}
+        self.src, self.dst = arrays["src"], arrays["dst"]
+        self._lock = threading.Lock()
+        self._undirected: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def build(cls, topology: TopologyEdges) -> "GraphIndex":
+        count = topology.addresses.size
+        width = max(count, 1)
+        edges = topology.edges[topology.edges["src"] != topology.edges["dst"]]
+        pairs, inverse = np.unique(edges["src"] * width + edges["dst"], return_inverse=True)
+        inverse = inverse.ravel()
+        first_seen = np.full(pairs.size, np.inf)
+        last_seen = np.full(pairs.size, -np.inf)
+        np.minimum.at(first_seen, inverse, edges["first_seen"])
+        np.maximum.at(last_seen, inverse, edges["last_seen"])
+        arrays = {
+            "node_ids": np.array(format_ips(topology.addresses), dtype=str),
+            "src": pairs // width,
+            "dst": pairs % width,
+            "bytes": np.bincount(inverse, weights=edges["bytes"], minlength=pairs.size).astype(np.uint64),
+            "first_seen": first_seen,
+            "last_seen": last_seen
+        }
+        arrays["out_indptr"], arrays["out_edges"] = _csr(arrays["src"], count)
+        arrays["in_indptr"], arrays["in_edges"] = _csr(arrays["dst"], count)
+        logger.info(f"Built graph index for {count} hosts and {pairs.size} host pairs")
+        return cls(arrays)
+
+    def save(self, path: str) -> None:
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, **self.arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GraphIndex":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def node(self, node_id: str) -> int:
+        """Index of a node id; KeyError if the graph does not have it."""
+        return self.index[node_id]
+
+    def _step(self, frontier: np.ndarray, direction: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(tail, head, edge id) of every edge leaving the frontier in a direction."""
+        if direction not in NEIGHBORHOOD_DIRECTIONS:
+            raise GraphAnalyticsError(f"Unknown direction: {direction}")
+        steps = []
+        if direction != "in":
+            tails, edge_ids = expand_frontier(self.arrays["out_indptr"], self.arrays["out_edges"], frontier)
+            steps.append((tails, self.dst[edge_ids], edge_ids))
+        if direction != "out":
+            tails, edge_ids = expand_frontier(self.arrays["in_indptr"], self.arrays["in_edges"], frontier)
+            steps.append((tails, self.src[edge_ids], edge_ids))
+        if len(steps) == 1:
+            return steps[0]
+        return tuple(np.concatenate(parts) for parts in zip(*steps))
+
+    def _bfs(
+        self,
+        source: int,
+        direction: str,
+        max_hops: Optional[int] = None,
+        target: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Hop distance (-1 if unreached) and the edge each node was reached by."""
+        count = len(self.node_ids)
+        distance = np.full(count, -1, dtype=np.int64)
+        parent = np.full(count, -1, dtype=np.int64)
+        distance[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        depth = 0
+        while frontier.size and (max_hops is None or depth < max_hops):
+            if target is not None and distance[target] >= 0:
+                break
+            _, heads, edge_ids = self._step(frontier, direction)
+            unseen = distance[heads] < 0
+            heads, edge_ids = heads[unseen], edge_ids[unseen]
+            # One of the edges reaching each new node wins the scatter; its
+            # entries are the deduplicated frontier, without a sort
+            parent[heads] = edge_ids
+            frontier = heads[parent[heads] == edge_ids]
+            depth += 1
+            distance[frontier] = depth
+        return distance, parent
+
+    def _walk(self, target: int, parent: np.ndarray) -> Tuple[List[int], List[int]]:
+        """Nodes and edges from the search source to target, following parent edges back."""
+        nodes, edges = [target], []
+        while parent[nodes[-1]] >= 0 and len(edges) < len(self.node_ids):
+            edge = int(parent[nodes[-1]])
+            edges.append(edge)
+            nodes.append(int(self.src[edge]) if self.dst[edge] == nodes[-1] else int(self.dst[edge]))
+        return nodes[::-1], edges[::-1]
+
+    def _edge(self, edge: int) -> Dict:
+        return {
+            "source": self.node_ids[self.src[edge]],
+            "target": self.node_ids[self.dst[edge]],
+            "bytes": int(self.arrays["bytes"][edge]),
+            "first_seen": float(self.arrays["first_seen"][edge]),
+            "last_seen": float(self.arrays["last_seen"][edge])
+        }
+
+    def shortest_path(self, source: str, target: str, direction: str = "out", max_hops: Optional[int] = None) -> Optional[Dict]:
+        """Fewest-hop path from source to target, or None if there is none within max_hops."""
+        start, end = self.node(source), self.node(target)
+        distance, parent = self._bfs(start, direction, max_hops, end)
+        if distance[end] < 0:
+            return None
+        nodes, edges = self._walk(end, parent)
+        return {
+            "hops": len(edges),
+            "nodes": [self.node_ids[node] for node in nodes],
+            "edges": [self._edge(edge) for edge in edges]
+        }
+
+    def reachable(self, source: str, hops: int, direction: str = "out") -> List[Dict]:
+        """Nodes within hops of source with their distance, nearest first."""
+        distance, _ = self._bfs(self.node(source), direction, hops)
+        reached = np.flatnonzero(distance >= 0)
+        reached = reached[np.lexsort((reached, distance[reached]))]
+        return [{"node": self.node_ids[node], "hops": hop} for node, hop in zip(reached.tolist(), distance[reached].tolist())]
+
+    def temporal_path(self, source: str, target: str, start: Optional[float] = None) -> Optional[Dict]:
+        """
+        Earliest-arriving time-respecting path from source to target.
+
+        Edges are followed in their direction and only while active: one
+        can be taken once its first activity is reached and not after its
+        last, so each hop happens no earlier than the one before it. The
+        search starts at start (epoch seconds) or at any time.
+        """
+        origin, end = self.node(source), self.node(target)
+        first_seen, last_seen = self.arrays["first_seen"], self.arrays["last_seen"]
+        step = float(last_seen.max() - first_seen.min()) / TEMPORAL_BUCKETS if first_seen.size else 0.0
+        arrival = np.full(len(self.node_ids), np.inf)
+        parent = np.full(len(self.node_ids), -1, dtype=np.int64)
+        arrival[origin] = -np.inf if start is None else start
+        pending = np.zeros(len(self.node_ids), dtype=bool)
+        pending[origin] = True
+        # Nodes are expanded a bucket of arrival times at a time, earliest
+        # first, and again whenever they are reached earlier; arrivals no
+        # earlier than the target's cannot lead to a better path
+        while True:
+            candidates = np.flatnonzero(pending)
+            if not candidates.size:
+                break
+            earliest = arrival[candidates].min()
+            frontier = candidates[arrival[candidates] <= earliest + step] if np.isfinite(earliest) else candidates[arrival[candidates] == earliest]
+            pending[frontier] = False
+            tails, heads, edge_ids = self._step(frontier, "out")
+            usable = last_seen[edge_ids] >= arrival[tails]
+            times = np.maximum(arrival[tails[usable]], first_seen[edge_ids[usable]])
+            heads, edge_ids = heads[usable], edge_ids[usable]
+            earlier = times < np.minimum(arrival[heads], arrival[end])
+            heads, edge_ids, times = heads[earlier], edge_ids[earlier], times[earlier]
+            np.minimum.at(arrival, heads, times)
+            reached = times == arrival[heads]
+            parent[heads[reached]] = edge_ids[reached]
+            pending[heads] = True
+        if not np.isfinite(arrival[end]) and end != origin:
+            return None
+        nodes, edges = self._walk(end, parent)
+        taken, at = [], arrival[origin]
+        for edge in edges:
+            at = max(at, float(first_seen[edge]))
+            taken.append({**self._edge(edge), "at": at})
+        return {
+            "hops": len(edges),
+            "arrival": float(arrival[end]) if np.isfinite(arrival[end]) else None,
+            "nodes": [self.node_ids[node] for node in nodes],
+            "edges": taken
+        }
+
+    def _neighbors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Undirected adjacency without parallel edges, built on first use."""
+        with self._lock:
+            if self._undirected is None:
+                width = max(len(self.node_ids), 1)
+                pairs = np.sort(np.concatenate([self.src * width + self.dst, self.dst * width + self.src]))
+                pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+                indptr, _ = _csr(pairs // width, len(self.node_ids))
+                self._undirected = (indptr, pairs % width)
+            return self._undirected
+
+    def shared_peers(self, node: str, max_degree: int, limit: int) -> Dict:
+        """
+        Hosts that share rare peers with node.
+
+        A peer is rare when it talks to at most max_degree hosts; hosts
+        are ranked by the number of node's rare peers they also talk to.
+        """
+        indptr, neighbors = self._neighbors()
+        origin = self.node(node)
+        degree = np.diff(indptr)
+        peers = neighbors[indptr[origin]:indptr[origin + 1]]
+        rare = peers[degree[peers] <= max_degree]
+        via, hosts = expand_frontier(indptr, neighbors, rare)
+        keep = hosts != origin
+        via, hosts = via[keep], hosts[keep]
+        found, counts = np.unique(hosts, return_counts=True)
+        ranked = found[np.lexsort((found, -counts))][:limit]
+        order = np.lexsort((via, hosts))
+        via, hosts = via[order], hosts[order]
+        starts = np.searchsorted(hosts, ranked)
+        ends = np.searchsorted(hosts, ranked, side="right")
+        return {
+            "peers": [self.node_ids[peer] for peer in rare.tolist()],
+            "nodes": [
+                {
+                    "node": self.node_ids[host],
+                    "shared": end - begin,
+                    "peers": [self.node_ids[peer] for peer in via[begin:end].tolist()]
+                }
+                for host, begin, end in zip(ranked.tolist(), starts.tolist(), ends.tolist())
+            ]
+        }
+
+class GraphIndexCache:
+    """
+    Per-process LRU of loaded graph indexes.
+
+    get() stats the stored index and reloads it when it was rewritten
+    since it was cached, e.g. by a topology rebuild.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.GRAPH_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[int, Tuple[int, GraphIndex]]" = OrderedDict()
+
+    def get(self, analysis_id: int) -> GraphIndex:
+        """Graph index of an analysis; FileNotFoundError if none was stored."""
+        path = graph_index_path(get_analysis_dir(analysis_id, create=False))
+        version = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._indexes.get(analysis_id)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(analysis_id)
+                return cached[1]
+
+        index = GraphIndex.load(path)
+        with self._lock:
+            self._indexes[analysis_id] = (version, index)
+            self._indexes.move_to_end(analysis_id)
+            while len(self._indexes) > self.size:
+                self._indexes.popitem(last=False)
+        return index
@@ -0,0 +1,332 @@
+import os
+import socket
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from services.pcap_reader import format_ip
+
+logger = logging.getLogger(__name__)
+
+# Indicator sets are text files in INDICATOR_DIR, one per threat-intel
+# list: one address or CIDR per line, optionally followed by ",label".
+# Blank lines and lines starting with "#" are ignored. A set is named
+# after its file and reloaded when the file changes.
+INDICATOR_EXTENSIONS = (".txt", ".csv")
+INDICATOR_SUMMARY_LIMIT = 50
+
+# Packed addresses are IPv4-mapped IPv6 (::ffff:a.b.c.d)
+V4_MAPPED_PREFIX = np.frombuffer(b"\0" * 10 + b"\xff\xff", dtype=np.uint8)
+
+def _v4_mask(length: int) -> np.uint32:
+    return np.uint32((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+
+def _v6_mask(length: int) -> np.ndarray:
+    bits = np.zeros(128, dtype=np.uint8)
+    bits[:length] = 1
+    return np.packbits(bits)
+
+def unique_addresses(addresses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    np.unique(addresses, return_inverse=True) for packed S16 addresses.
+
+    Sorting the two big-endian 64-bit halves is several times faster than
+    sorting 16-byte strings and gives the same order.
+    """
+    addresses = np.ascontiguousarray(addresses, dtype="S16")
+    words = addresses.view(">u8").reshape(-1, 2)
+    order = np.lexsort((words[:, 1], words[:, 0]))
+    ordered = words[order]
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    inverse = np.empty(order.size, dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return addresses[order[first]], inverse
+
+class IndicatorSet:
+    """
+    One indicator list compiled for longest-prefix matching.
+
+    Networks are grouped by prefix length into sorted arrays; a lookup
+    masks the addresses to each length, longest first, and finds exact
+    matches with searchsorted. IPv4 networks are kept as uint32, IPv6
+    networks as packed 16-byte strings.
+    """
+
+    def __init__(self, name: str, networks: np.ndarray, lengths: np.ndarray, labels: List[Optional[str]]):
+        """
+        Args:
+            name: Set name
+            networks: Packed network addresses (S16, IPv4-mapped for IPv4)
+            lengths: Prefix length of each packed address (96 + n for IPv4 /n)
+            labels: Optional label of each indicator
+        """
+        self.name = name
+        self.lengths = np.asarray(lengths, dtype=np.uint8)
+        self.networks = np.array(networks, dtype="S16")
+        self.labels, self.label_codes = self._encode_labels(labels)
+        self._v4_tables = []
+        self._v6_tables = []
+
+        # Host bits set in a CIDR (10.1.2.3/8) are ignored
+        raw = self.networks.view(np.uint8).reshape(-1, 16)
+        for length in np.unique(self.lengths).tolist():
+            raw[self.lengths == length] &= _v6_mask(length)
+
+        self._is_v4 = (raw[:, :12] == V4_MAPPED_PREFIX).all(axis=1) & (self.lengths >= 96)
+        v4 = np.ascontiguousarray(raw[:, 12:]).view(">u4").ravel().astype(np.uint32)
+        for length in np.unique(self.lengths)[::-1].tolist():
+            at_length = self.lengths == length
+            ids = np.flatnonzero(at_length & self._is_v4)
+            if ids.size:
+                self._v4_tables.append(self._table(length - 96, v4[ids], ids))
+            ids = np.flatnonzero(at_length & ~self._is_v4)
+            if ids.size:
+                self._v6_tables.append(self._table(length, self.networks[ids], ids))
+
+    @staticmethod
+    def _encode_labels(labels: List[Optional[str]]):
+        values = [None]
+        codes = {None: 0}
+        encoded = np.zeros(len(labels), dtype=np.uint32)
+        for i, label in enumerate(labels):
+            code = codes.get(label)
+            if code is None:
+                code = codes[label] = len(values)
+                values.append(label)
+            encoded[i] = code
+        return values, encoded
+
+    @staticmethod
+    def _table(length: int, networks: np.ndarray, ids: np.ndarray):
+        # The first of duplicate networks wins
+        unique, first = np.unique(networks, return_index=True)
+        return length, unique, ids[first]
+
+    @classmethod
+    def from_file(cls, path: str) -> "IndicatorSet":
+        name = os.path.splitext(os.path.basename(path))[0]
+        networks, lengths, labels = [], [], []
+        invalid = 0
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                indicator, _, label = line.partition(",")
+                address, _, prefix = indicator.strip().partition("/")
+                try:
+                    if ":" in address:
+                        packed = socket.inet_pton(socket.AF_INET6, address)
+                        length = int(prefix) if prefix else 128
+                    else:
+                        packed = V4_MAPPED_PREFIX.tobytes() + socket.inet_pton(socket.AF_INET, address)
+                        length = 96 + (int(prefix) if prefix else 32)
+                except (OSError, ValueError):
+                    invalid += 1
+                    continue
+                if not 0 <= length <= 128 or (":" not in address and length < 96):
+                    invalid += 1
+                    continue
+                networks.append(packed)
+                lengths.append(length)
+                labels.append(label.strip() or None)
+        if invalid:
+            logger.warning(f"Skipped {invalid} invalid indicators in {path}")
+        logger.info(f"Loaded {len(networks)} indicators from {path}")
+        return cls(name, np.array(networks, dtype="S16"), np.array(lengths, dtype=np.uint8), labels)
+
+    def __len__(self) -> int:
+        return int(self.networks.size)
+
+    def lookup(self, addresses: np.ndarray) -> np.ndarray:
+        """
+        Return the id of the longest indicator matching each packed
+        address, or -1. Sorted (e.g. unique) input is fastest.
+        """
+        addresses = np.ascontiguousarray(addresses, dtype="S16")
+        result = np.full(addresses.size, -1, dtype=np.int64)
+        raw = addresses.view(np.uint8).reshape(-1, 16)
+        is_v4 = (raw[:, :12] == V4_MAPPED_PREFIX).all(axis=1)
+
+        rows = np.flatnonzero(is_v4)
+        v4 = np.ascontiguousarray(raw[rows, 12:]).view(">u4").ravel().astype(np.uint32)
+        for length, networks, ids in self._v4_tables:
+            if not rows.size:
+                break
+            keys = v4 & _v4_mask(length)
+            pos = np.searchsorted(networks, keys).clip(max=networks.size - 1)
+            hit = networks[pos] == keys
+            result[rows[hit]] = ids[pos[hit]]
+            rows, v4 = rows[~hit], v4[~hit]
+        if rows.size:
+            # IPv6 networks shorter than /96 (::/0, ...) can cover all IPv4
+            # addresses at once, since they share the mapped prefix
+            mapped = np.zeros(16, dtype=np.uint8)
+            mapped[:12] = V4_MAPPED_PREFIX
+            for length, networks, ids in self._v6_tables:
+                if length < 96:
+                    key = (mapped & _v6_mask(length)).view("S16")
+                    pos = min(int(np.searchsorted(networks, key)[0]), networks.size - 1)
+                    if networks[pos] == key[0]:
+                        result[rows] = ids[pos]
+                        break
+
+        rows = np.flatnonzero(~is_v4)
+        for length, networks, ids in self._v6_tables:
+            if not rows.size:
+                break
+            keys = (raw[rows] & _v6_mask(length)).view("S16").ravel()
+            pos = np.searchsorted(networks, keys).clip(max=networks.size - 1)
+            hit = networks[pos] == keys
+            result[rows[hit]] = ids[pos[hit]]
+            rows = rows[~hit]
+        return result
+
+    def indicator(self, indicator_id: int) -> str:
+        """Render an indicator as CIDR, or as a bare address for a single host."""
+        length = int(self.lengths[indicator_id])
+        address = format_ip(self.networks[indicator_id])
+        if length == 128:
+            return address
+        return f"{address}/{length - 96 if self._is_v4[indicator_id] else length}"
+
+    def label(self, indicator_id: int) -> Optional[str]:
+        return self.labels[self.label_codes[indicator_id]]
+
+class IndicatorMatcher:
+    """
+    The indicator sets of a directory, reloaded when their files change.
+
+    refresh() only stats the files, so it is cheap to call before every
+    use; changed sets are compiled off to the side and swapped in whole.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.INDICATOR_DIR
+        self.sets: Dict[str, IndicatorSet] = {}
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+
+    def refresh(self) -> bool:
+        """Reload added or changed sets and drop removed ones. Returns True on change."""
+        try:
+            names = sorted(
+                name for name in os.listdir(self.directory)
+                if name.endswith(INDICATOR_EXTENSIONS)
+            )
+        except FileNotFoundError:
+            names = []
+
+        signatures = {}
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            signatures[name] = (stat.st_mtime_ns, stat.st_size)
+        if signatures == self._signatures:
+            return False
+
+        sets = {}
+        for name, signature in signatures.items():
+            previous = self._signatures.get(name)
+            set_name = os.path.splitext(name)[0]
+            if previous == signature and set_name in self.sets:
+                sets[set_name] = self.sets[set_name]
+                continue
+            try:
+                sets[set_name] = IndicatorSet.from_file(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.error(f"Failed to load indicator set {name}: {str(e)}")
+        self.sets, self._signatures = sets, signatures
+        return True
+
+    def match(self, addresses: np.ndarray) -> Dict[str, np.ndarray]:
+        """Return, per set, the matching indicator id of each address (-1 for none)."""
+        unique, inverse = unique_addresses(addresses)
+        return {name: indicators.lookup(unique)[inverse] for name, indicators in self.sets.items()}
+
+_matcher: Optional[IndicatorMatcher] = None
+
+def get_indicator_matcher() -> IndicatorMatcher:
+    """Process-wide matcher, refreshed from INDICATOR_DIR on every call."""
+    global _matcher
+    if _matcher is None:
+        _matcher = IndicatorMatcher()
+    _matcher.refresh()
+    return _matcher
+
+def match_flows(matcher: IndicatorMatcher, flows: np.ndarray) -> Tuple[List[Optional[List[Dict]]], List[Dict]]:
+    """
+    Tag flows whose endpoints match an indicator.
+
+    Args:
+        matcher: Indicator sets to match against
+        flows: FLOW_DTYPE rows
+
+    Returns:
+        Tuple of (per-flow matches, summary). Per-flow matches are None for
+        clean flows, otherwise a list of {set, indicator, label, endpoint}
+        with endpoint "src" or "dst" as the flow is stored. The summary
+        lists the indicators hit, with flow and byte counts and the
+        matching addresses, most bytes first.
+    """
+    tags: List[Optional[List[Dict]]] = [None] * flows.size
+    summary = []
+    if not flows.size or not matcher.sets:
+        return tags, summary
+
+    addresses = np.concatenate([flows["a_ip"], flows["b_ip"]])
+    matches = matcher.match(addresses)
+    # Stored flows are oriented client -> server; a is the client unless b initiated
+    a_endpoint = np.where(flows["initiator"] == 1, "dst", "src")
+    b_endpoint = np.where(flows["initiator"] == 1, "src", "dst")
+    flow_bytes = (flows["bytes_ab"] + flows["bytes_ba"]).astype(np.float64)
+
+    for name, ids in matches.items():
+        indicators = matcher.sets[name]
+        a_ids, b_ids = ids[:flows.size], ids[flows.size:]
+        hit_rows = np.flatnonzero((a_ids >= 0) | (b_ids >= 0))
+        if not hit_rows.size:
+            continue
+
+        for ids_side, endpoint_side in ((a_ids, a_endpoint), (b_ids, b_endpoint)):
+            rows = np.flatnonzero(ids_side >= 0)
+            for row, indicator_id, endpoint in zip(rows.tolist(), ids_side[rows].tolist(), endpoint_side[rows].tolist()):
+                if tags[row] is None:
+                    tags[row] = []
+                tags[row].append({
+                    "set": name,
+                    "indicator": indicators.indicator(indicator_id),
+                    "label": indicators.label(indicator_id),
+                    "endpoint": endpoint
+                })
+
+        # A flow counts once per indicator even if both endpoints match it
+        pairs = np.concatenate([
+            np.stack([hit_rows, a_ids[hit_rows]], axis=1),
+            np.stack([hit_rows, b_ids[hit_rows]], axis=1)
+        ])
+        pairs = np.unique(pairs[pairs[:, 1] >= 0], axis=0)
+        hit_ids, inverse = np.unique(pairs[:, 1], return_inverse=True)
+        flow_counts = np.bincount(inverse.ravel(), minlength=hit_ids.size)
+        byte_counts = np.bincount(inverse.ravel(), weights=flow_bytes[pairs[:, 0]], minlength=hit_ids.size)
+
+        matched = np.concatenate([flows["a_ip"][a_ids >= 0], flows["b_ip"][b_ids >= 0]])
+        matched_ids = np.concatenate([a_ids[a_ids >= 0], b_ids[b_ids >= 0]])
+        hosts: Dict[int, List[str]] = {}
+        for address, indicator_id in sorted(set(zip(matched.tolist(), matched_ids.tolist()))):
+            hosts.setdefault(indicator_id, []).append(format_ip(address))
+
+        for indicator_id, flow_count, byte_count in zip(hit_ids.tolist(), flow_counts.tolist(), byte_counts.tolist()):
+            summary.append({
+                "set": name,
+                "indicator": indicators.indicator(indicator_id),
+                "label": indicators.label(indicator_id),
+                "flows": flow_count,
+                "bytes": int(byte_count),
+                "addresses": hosts[indicator_id][:10]
+            })
+
+    summary.sort(key=lambda item: item["bytes"], reverse=True)
+    return tags, summary[:INDICATOR_SUMMARY_LIMIT]
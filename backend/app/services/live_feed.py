@@ -0,0 +1,188 @@
+import copy
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+from core.config import settings
+from services.network_analysis import layout_channel, live_channel
+
+logger = logging.getLogger(__name__)
+
+# Live messages are deep patches: a client merges each one into its state.
+# A message with "snapshot": true carries the whole state and replaces it.
+# Layout messages are not part of the state: each carries every position
+# of a layout in progress and supersedes the previous one.
+LIVE_FEED_RETRY_INTERVAL = 2.0
+
+def _changed(old: Dict, new: Dict) -> Dict:
+    """Fields of new that differ from old, recursing into nested objects."""
+    changed = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = _changed(previous, value)
+            if nested:
+                changed[key] = nested
+        elif key not in old or previous != value:
+            changed[key] = value
+    return changed
+
+def _merge(state: Dict, changes: Dict) -> None:
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(state.get(key), dict):
+            _merge(state[key], value)
+        else:
+            state[key] = value
+
+class LiveSubscriber:
+    """
+    One client of a feed. At most one message waits to be sent; a client
+    that has not taken it by the next update gets the latest snapshot in
+    its place instead of a growing queue. Likewise at most one layout
+    message waits, the latest.
+    """
+
+    def __init__(self):
+        self.pending: Optional[str] = None
+        self.layout: Optional[str] = None
+        self.skipped = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, message: str) -> None:
+        self.pending = message
+        self._ready.set()
+
+    def offer_layout(self, message: str) -> None:
+        self.layout = message
+        self._ready.set()
+
+    async def next(self) -> str:
+        await self._ready.wait()
+        if self.pending is not None:
+            message, self.pending = self.pending, None
+        else:
+            message, self.layout = self.layout, None
+        if self.pending is None and self.layout is None:
+            self._ready.clear()
+        return message
+
+class LiveFeed:
+    """
+    Live updates of one analysis, received once per process and fanned
+    out to every subscriber.
+
+    Each update is diffed against the feed state and serialized once;
+    subscribers share the same text.
+    """
+
+    def __init__(self, analysis_id: int, client: redis.Redis):
+        self.analysis_id = analysis_id
+        self.client = client
+        self.state: Dict = {}
+        self.subscribers: Set[LiveSubscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def subscribe(self) -> LiveSubscriber:
+        subscriber = LiveSubscriber()
+        if self.state:
+            subscriber.offer(self._snapshot())
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def _snapshot(self) -> str:
+        return json.dumps({"analysis_id": self.analysis_id, "snapshot": True, **self.state})
+
+    def publish(self, message: Dict) -> None:
+        message.pop("analysis_id", None)
+        changes = _changed(self.state, message)
+        if not changes:
+            return
+        _merge(self.state, changes)
+        delta = snapshot = None
+        for subscriber in self.subscribers:
+            if subscriber.pending is None:
+                delta = delta or json.dumps({"analysis_id": self.analysis_id, **changes})
+                subscriber.offer(delta)
+            else:
+                # Behind: the unsent message and this one are both in the snapshot
+                snapshot = snapshot or self._snapshot()
+                subscriber.offer(snapshot)
+                subscriber.skipped += 1
+
+    def publish_layout(self, message: Dict) -> None:
+        """Forward layout progress as is, without merging it into the state."""
+        message.pop("analysis_id", None)
+        text = json.dumps({"analysis_id": self.analysis_id, **message})
+        for subscriber in self.subscribers:
+            subscriber.offer_layout(text)
+
+    async def _run(self) -> None:
+        channel, layout = live_channel(self.analysis_id), layout_channel(self.analysis_id)
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(channel, layout)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    # Channel names arrive as bytes; the client does not decode responses
+                    if message["channel"] == layout.encode():
+                        self.publish_layout(json.loads(message["data"]))
+                    else:
+                        self.publish(json.loads(message["data"]))
+            except (redis.RedisError, OSError, ValueError) as e:
+                logger.warning(f"Live feed of analysis {self.analysis_id} interrupted: {str(e)}")
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(LIVE_FEED_RETRY_INTERVAL)
+
+class LiveFeedHub:
+    """Feeds of the analyses watched in this process, one per analysis."""
+
+    def __init__(self):
+        self.feeds: Dict[int, LiveFeed] = {}
+        self._client: Optional[redis.Redis] = None
+
+    @asynccontextmanager
+    async def subscribe(self, analysis_id: int, state: Optional[Dict] = None) -> AsyncIterator[LiveSubscriber]:
+        """
+        Subscribe to the feed of an analysis, starting it if needed.
+
+        state seeds a feed that has not received an update yet, e.g. with
+        the stored metrics, so the subscriber is sent a snapshot at once.
+        """
+        feed = self.feeds.get(analysis_id)
+        if feed is None:
+            if self._client is None:
+                self._client = redis.from_url(settings.REDIS_URL)
+            feed = self.feeds[analysis_id] = LiveFeed(analysis_id, self._client)
+            feed.start()
+        if state and not feed.state:
+            # Updates are merged into the state in place
+            feed.state = copy.deepcopy(state)
+        subscriber = feed.subscribe()
+        try:
+            yield subscriber
+        finally:
+            feed.subscribers.discard(subscriber)
+            if not feed.subscribers and self.feeds.get(analysis_id) is feed:
+                del self.feeds[analysis_id]
+                await feed.stop()
+
+    def subscriber_count(self, analysis_id: int) -> int:
+        feed = self.feeds.get(analysis_id)
+        return len(feed.subscribers) if feed is not None else 0
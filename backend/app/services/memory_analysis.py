@@ -6,6 +6,7 @@ from volatility3.framework.automagic import stacker
 import volatility3.framework.interfaces.plugins as plugins
 from core.db import SessionLocal
 from models import MemoryAnalysis
+from utils.seekable_compression import materialized_evidence
 import json
 from celery import Celery
 
@@ -54,12 +55,14 @@ def list_loaded_modules(context):
     grid = plugin.run()
     return [{"BaseAddress": row[0], "ModuleName": row[1]} for row in grid]
 
-@app_celery.task
+@app_celery.task(bind=True)
 def analyze_memory_task(self, file_path: str, file_id: int):
-    context = load_memory_dump(file_path)
-    processes = list_processes(context)
-    network_connections = list_network_connections(context)
-    loaded_modules = list_loaded_modules(context)
+    # Volatility opens the dump by location, so compressed evidence is expanded first
+    with materialized_evidence(file_path) as raw_path:
+        context = load_memory_dump(raw_path)
+        processes = list_processes(context)
+        network_connections = list_network_connections(context)
+        loaded_modules = list_loaded_modules(context)
 
     result = {
         "processes": processes,
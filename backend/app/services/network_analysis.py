@@ -1,19 +1,45 @@
 import os
 import json
+import time
 import logging
+import pickle
+import tempfile
 import subprocess
-from celery import Celery
-from typing import Dict, List
+import redis
+import numpy as np
+from datetime import datetime
+from celery import Celery, chord
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from core.db import SessionLocal
+from core.config import settings
+from core.enums import AnalysisStatus
 from models import NetworkAnalysis
+from utils.analysis_storage import get_analysis_dir, remove_analysis_dir
+from utils.seekable_compression import materialized_evidence
+from services.pcap_reader import PcapReader, CaptureFormatError, PACKET_DTYPE, pack_ip, format_ip
+from services.sketches import SpaceSaving, CountMinSketch, HyperLogLog, SKETCHES_FILENAME, save_sketches
+from services.packet_store import PacketStore, PacketStoreWriter, STRING_COLUMNS, packet_store_path
+from services.flow_table import FlowTable, persist_flows
+from services.artifacts import ArtifactIndex, tshark_artifacts, persist_artifacts
+from services.passive_dns import label_topology
+from services.timeseries import TimeSeriesBuilder, build_timeseries, timeseries_dir
+from services.capture_index import CaptureIndexBuilder, capture_index_path, index_capture
+from services.indicators import get_indicator_matcher, match_flows
+from services.enrichment import enrich_ips, get_ip_database
+from services.beaconing import detect_beacons
+from services.analysis_pipeline import AnalysisPipeline, PluginTimings, native_batches
+from services.topology_builder import aggregate_edges, persist_topology
+from services.graph_layout import layout_topology
+from services.topology_levels import TopologyLevels, topology_levels_path
+from services.graph_queries import GraphIndex, graph_index_path
 from scapy.all import rdpcap  # Kept for potential custom use cases
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Celery setup
-app_celery = Celery("mini-forensic", broker="redis://localhost:6379/0")
+# Celery setup; sharded analyses run as chords, which need a result backend
+app_celery = Celery("mini-forensic", broker="redis://localhost:6379/0", backend="redis://localhost:6379/0")
 
 def validate_pcap_file(pcap_file: str) -> None:
     """Validate the existence and readability of the PCAP file."""
@@ -24,100 +50,1031 @@ def validate_pcap_file(pcap_file: str) -> None:
         logger.error(f"PCAP file not readable: {pcap_file}")
         raise PermissionError(f"PCAP file not readable: {pcap_file}")
 
-def analyze_with_tshark(pcap_file: str) -> Dict:
+# TShark fields extracted per packet, in output column order
+TSHARK_FIELDS = [
+    "frame.time_epoch",       # Timestamp (seconds since epoch)
+    "ip.src",                 # Source IP
+    "ip.dst",                 # Destination IP
+    "ipv6.src",               # Source IPv6 address
+    "ipv6.dst",               # Destination IPv6 address
+    "tcp.srcport",            # TCP source port
+    "tcp.dstport",            # TCP destination port
+    "udp.srcport",            # UDP source port
+    "udp.dstport",            # UDP destination port
+    "ip.proto",               # Protocol number
+    "ipv6.nxt",               # IPv6 next header
+    "http.request.method",    # HTTP method (if applicable)
+    "dns.qry.name",           # DNS query name (if applicable)
+    "http.host",              # HTTP Host header
+    "http.request.uri",       # HTTP request URI
+    "tls.handshake.extensions_server_name",  # TLS SNI
+    "frame.len"               # Packet length
+]
+
+class TrafficSummary:
     """
-    Analyze a PCAP file using TShark with detailed forensic insights.
-    Returns structured JSON data including summary stats and packet details.
+    Summary statistics aggregated batch by batch.
+
+    Per-key statistics (talkers, ports, conversations, DNS names, distinct
+    addresses) are kept in fixed-size sketches, so memory does not grow
+    with the number of hosts in the capture.
     """
-    validate_pcap_file(pcap_file)
 
-    # Define TShark fields for comprehensive analysis
-    fields = [
-        "-e frame.time",          # Timestamp
-        "-e ip.src",              # Source IP
-        "-e ip.dst",              # Destination IP
-        "-e tcp.srcport",         # Source port
-        "-e tcp.dstport",         # Destination port
-        "-e udp.srcport",         # UDP source port
-        "-e udp.dstport",         # UDP destination port
-        "-e ip.proto",            # Protocol number
-        "-e http.request.method", # HTTP method (if applicable)
-        "-e dns.qry.name",        # DNS query name (if applicable)
-        "-e frame.len"            # Packet length
-    ]
-    tshark_command = ["tshark", "-r", pcap_file, "-T", "json"] + fields
+    def __init__(self):
+        self.packet_count = 0
+        self.total_bytes = 0
+        self.non_ip_bytes = 0
+        self.protocols: Dict[str, int] = {}
+        capacity = settings.SKETCH_CAPACITY
+        self.top_talkers = SpaceSaving(capacity, dtype="S16")         # bytes sent per source
+        self.talker_bytes = CountMinSketch()                          # bytes sent by any source
+        self.top_ports = SpaceSaving(capacity, dtype="<u2")           # packets per destination port
+        self.top_conversations = SpaceSaving(capacity, dtype="S32")   # bytes per source/destination pair
+        self.top_dns_queries = SpaceSaving(capacity)                  # queries per DNS name
+        self.distinct_ips = HyperLogLog()
+        self._pending: List[Dict] = []
 
-    try:
-        logger.info(f"Running TShark analysis on {pcap_file}")
-        process = subprocess.run(
+    def add(self, pkt: Dict) -> None:
+        """Add one packet dict (TShark output); packets are folded in per batch."""
+        self._pending.append(pkt)
+        if len(self._pending) >= settings.PACKET_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            rows, self._pending = self._pending, []
+            self.add_batch(rows_to_packets(rows), dns_queries=[pkt["dns_query"] for pkt in rows])
+
+    def add_batch(self, packets: np.ndarray, dns_queries: Optional[List[str]] = None) -> None:
+        """Update the summary with a decoded PACKET_DTYPE batch."""
+        lengths = packets["length"].astype(np.int64)
+        is_ip = packets["ip_version"] != 0
+        protos, counts = np.unique(packets["protocol"][is_ip], return_counts=True)
+        for proto, count in zip(protos.tolist(), counts.tolist()):
+            self.protocols[str(proto)] = self.protocols.get(str(proto), 0) + count
+
+        ip = packets[is_ip]
+        ip_lengths = lengths[is_ip]
+        self.top_talkers.update(ip["src_ip"], ip_lengths)
+        self.talker_bytes.update(ip["src_ip"], ip_lengths)
+        self.top_ports.update(ip["dst_port"][np.isin(ip["protocol"], (6, 17))])
+        pairs = np.empty(ip.size, dtype=[("src", "S16"), ("dst", "S16")])
+        pairs["src"] = ip["src_ip"]
+        pairs["dst"] = ip["dst_ip"]
+        self.top_conversations.update(pairs.view("S32"), ip_lengths)
+        self.distinct_ips.update(ip["src_ip"])
+        self.distinct_ips.update(ip["dst_ip"])
+        if dns_queries is not None:
+            names = [name for name in dns_queries if name and name != "N/A"]
+            self.top_dns_queries.update(np.array(names, dtype=object))
+
+        non_ip = int(packets.size - is_ip.sum())
+        if non_ip:
+            self.protocols["N/A"] = self.protocols.get("N/A", 0) + non_ip
+            self.non_ip_bytes += int(lengths[~is_ip].sum())
+        self.packet_count += int(packets.size)
+        self.total_bytes += int(lengths.sum())
+
+    def merge(self, other: "TrafficSummary") -> None:
+        """Fold another summary (e.g. from a capture shard) into this one."""
+        self.flush()
+        other.flush()
+        for proto, count in other.protocols.items():
+            self.protocols[proto] = self.protocols.get(proto, 0) + count
+        for name, sketch in self.sketches().items():
+            sketch.merge(other.sketches()[name])
+        self.non_ip_bytes += other.non_ip_bytes
+        self.packet_count += other.packet_count
+        self.total_bytes += other.total_bytes
+
+    def recount(self, flows: FlowTable, artifacts: ArtifactIndex) -> None:
+        """
+        Rebuild the heavy-hitter sketches from the finished flow table and
+        artifact index, which count every key exactly.
+
+        Once keys are evicted, Space-Saving estimates depend on the order
+        batches and shards were folded in; recounting makes the reported
+        talkers, ports, conversations and DNS names exact, so a sharded
+        analysis reports the same as a single pass. The Count-Min and
+        HyperLogLog sketches merge exactly and are kept.
+        """
+        self.flush()
+        capacity = settings.SKETCH_CAPACITY
+        table = flows.flows
+        # Each flow holds the traffic of both directions: a -> b and b -> a
+        sent = np.concatenate([table["packets_ab"], table["packets_ba"]]) > 0
+        src = np.concatenate([table["a_ip"], table["b_ip"]])[sent]
+        dst = np.concatenate([table["b_ip"], table["a_ip"]])[sent]
+        dst_port = np.concatenate([table["b_port"], table["a_port"]])[sent]
+        protocol = np.concatenate([table["protocol"], table["protocol"]])[sent]
+        packets = np.concatenate([table["packets_ab"], table["packets_ba"]])[sent].astype(np.int64)
+        sent_bytes = np.concatenate([table["bytes_ab"], table["bytes_ba"]])[sent].astype(np.int64)
+
+        self.top_talkers = SpaceSaving(capacity, dtype="S16")
+        self.top_talkers.update(src, sent_bytes)
+        ported = np.isin(protocol, (6, 17))
+        self.top_ports = SpaceSaving(capacity, dtype="<u2")
+        self.top_ports.update(dst_port[ported], packets[ported])
+        pairs = np.empty(src.size, dtype=[("src", "S16"), ("dst", "S16")])
+        pairs["src"] = src
+        pairs["dst"] = dst
+        self.top_conversations = SpaceSaving(capacity, dtype="S32")
+        self.top_conversations.update(pairs.view("S32"), sent_bytes)
+        names = artifacts.value_counts("dns_query")
+        self.top_dns_queries = SpaceSaving(capacity)
+        self.top_dns_queries.update(np.array(list(names), dtype=object), np.array(list(names.values()), dtype=np.int64))
+
+    def sketches(self) -> Dict:
+        """Named sketch state, as persisted with the analysis."""
+        self.flush()
+        return {
+            "top_talkers": self.top_talkers,
+            "talker_bytes": self.talker_bytes,
+            "top_ports": self.top_ports,
+            "top_conversations": self.top_conversations,
+            "top_dns_queries": self.top_dns_queries,
+            "distinct_ips": self.distinct_ips
+        }
+
+    def to_dict(self) -> Dict:
+        sketches = self.sketches()
+        talkers = {format_ip(ip): sent for ip, sent in estimate_talkers(sketches, 5)}
+        if self.non_ip_bytes:
+            talkers["N/A"] = self.non_ip_bytes
+        return {
+            "packet_count": self.packet_count,
+            "total_bytes": self.total_bytes,
+            "protocol_distribution": self.protocols,
+            **describe_sketches(sketches),
+            # The summary keeps its address -> bytes map, with non-IP traffic
+            "top_talkers": dict(sorted(talkers.items(), key=lambda x: x[1], reverse=True)[:5])
+        }
+
+def estimate_talkers(sketches: Dict, limit: int) -> List[Tuple[bytes, int]]:
+    """
+    Heaviest (packed address, bytes sent) pairs, heaviest first.
+
+    Space-Saving and Count-Min both overestimate a talker's bytes; the
+    smaller of the two estimates is the tighter bound.
+    """
+    talkers = sketches["top_talkers"]
+    keys = talkers.keys[:limit]
+    sent = np.minimum(talkers.counts[:limit], sketches["talker_bytes"].query(keys))
+    order = np.argsort(-sent, kind="stable")
+    return list(zip(keys[order].tolist(), sent[order].tolist()))
+
+def describe_sketches(sketches: Dict, limit: int = 10) -> Dict:
+    """Render heavy hitters and distinct counts from a set of summary sketches."""
+    return {
+        "top_talkers": [
+            {"ip": format_ip(ip), "bytes": sent} for ip, sent in estimate_talkers(sketches, limit)
+        ],
+        "top_destination_ports": [
+            {"port": port, "packets": count} for port, count in sketches["top_ports"].top(limit)
+        ],
+        "top_conversations": [
+            {"src_ip": format_ip(pair[:16]), "dst_ip": format_ip(pair.ljust(32, b"\0")[16:]), "bytes": count}
+            for pair, count in sketches["top_conversations"].top(limit)
+        ],
+        "top_dns_queries": [
+            {"query": name, "count": count} for name, count in sketches["top_dns_queries"].top(limit)
+        ],
+        "distinct_ips": sketches["distinct_ips"].count()
+    }
+
+def rows_to_packets(rows: List[Dict]) -> np.ndarray:
+    """
+    Convert packet dicts (TShark output) into a PACKET_DTYPE batch.
+    Fields TShark does not report here, such as TCP flags, are left as zero.
+    """
+    packets = np.zeros(len(rows), dtype=PACKET_DTYPE)
+    for i, pkt in enumerate(rows):
+        packets[i]["ts"] = pkt["timestamp"] if pkt["timestamp"] != "N/A" else 0.0
+        packets[i]["length"] = pkt["length"]
+        try:
+            packets[i]["src_ip"] = pack_ip(pkt["src_ip"])
+            packets[i]["dst_ip"] = pack_ip(pkt["dst_ip"])
+        except (OSError, ValueError):
+            continue  # Non-IP traffic keeps ip_version 0
+        packets[i]["ip_version"] = 6 if ":" in pkt["src_ip"] else 4
+        packets[i]["protocol"] = int(pkt["protocol"]) if pkt["protocol"].isdigit() else 0
+        packets[i]["src_port"] = int(pkt["src_port"]) if pkt["src_port"].isdigit() else 0
+        packets[i]["dst_port"] = int(pkt["dst_port"]) if pkt["dst_port"].isdigit() else 0
+    return packets
+
+def parse_tshark_line(line: str) -> Optional[Dict]:
+    """Convert one tab-separated TShark fields line into a packet dict."""
+    values = line.rstrip("\n").split("\t")
+    if len(values) < len(TSHARK_FIELDS):
+        return None
+    (timestamp, ip_src, ip_dst, ipv6_src, ipv6_dst, tcp_src, tcp_dst,
+     udp_src, udp_dst, ip_proto, ipv6_nxt, http_method, dns_query,
+     http_host, http_uri, tls_sni, length) = values[:len(TSHARK_FIELDS)]
+    return {
+        "timestamp": float(timestamp) if timestamp else "N/A",
+        "src_ip": ip_src or ipv6_src or "N/A",
+        "dst_ip": ip_dst or ipv6_dst or "N/A",
+        "src_port": tcp_src or udp_src or "N/A",
+        "dst_port": tcp_dst or udp_dst or "N/A",
+        "protocol": ip_proto or ipv6_nxt or "N/A",
+        "http_method": http_method or "N/A",
+        "dns_query": dns_query or "N/A",
+        "http_host": http_host or "N/A",
+        "http_uri": http_uri or "N/A",
+        "tls_sni": tls_sni or "N/A",
+        "length": int(length or 0)
+    }
+
+def iter_tshark_packets(pcap_file: str) -> Iterator[Dict]:
+    """
+    Stream packets from TShark one line at a time.
+    Only the current line is held in memory, regardless of capture size.
+    """
+    tshark_command = ["tshark", "-r", pcap_file, "-T", "fields", "-E", "separator=/t", "-E", "occurrence=f"]
+    for field in TSHARK_FIELDS:
+        tshark_command += ["-e", field]
+
+    # stderr goes to a file so a chatty TShark can never block on a full pipe
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
             tshark_command,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
             text=True,
-            check=True
+            bufsize=1024 * 1024
         )
-        raw_results = json.loads(process.stdout)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"TShark failed: {e.stderr}")
-        raise RuntimeError(f"TShark analysis failed: {e.stderr}")
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse TShark output: {str(e)}")
-        raise ValueError(f"Invalid TShark JSON output: {str(e)}")
-
-    # Process results into a structured format
-    packets = []
-    protocols = {}
-    top_talkers = {}
-    total_bytes = 0
-
-    for packet in raw_results:
         try:
-            source = packet["_source"]["layers"]
-            pkt_data = {
-                "timestamp": source.get("frame.time", ["N/A"])[0],
-                "src_ip": source.get("ip.src", ["N/A"])[0],
-                "dst_ip": source.get("ip.dst", ["N/A"])[0],
-                "src_port": source.get("tcp.srcport", source.get("udp.srcport", ["N/A"]))[0],
-                "dst_port": source.get("tcp.dstport", source.get("udp.dstport", ["N/A"]))[0],
-                "protocol": source.get("ip.proto", ["N/A"])[0],
-                "http_method": source.get("http.request.method", ["N/A"])[0],
-                "dns_query": source.get("dns.qry.name", ["N/A"])[0],
-                "length": int(source.get("frame.len", ["0"])[0])
-            }
-            packets.append(pkt_data)
-
-            # Aggregate stats
-            proto = pkt_data["protocol"]
-            protocols[proto] = protocols.get(proto, 0) + 1
-            src_ip = pkt_data["src_ip"]
-            top_talkers[src_ip] = top_talkers.get(src_ip, 0) + pkt_data["length"]
-            total_bytes += pkt_data["length"]
-        except (KeyError, IndexError) as e:
-            logger.warning(f"Skipping malformed packet: {str(e)}")
-
-    # Summarize results
-    summary = {
-        "packet_count": len(packets),
-        "total_bytes": total_bytes,
-        "protocol_distribution": protocols,
-        "top_talkers": dict(sorted(top_talkers.items(), key=lambda x: x[1], reverse=True)[:5])
+            for line in process.stdout:
+                try:
+                    pkt = parse_tshark_line(line)
+                except ValueError as e:
+                    pkt = None
+                    logger.warning(f"Skipping malformed packet: {str(e)}")
+                if pkt is not None:
+                    yield pkt
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", errors="replace")
+            logger.error(f"TShark failed: {message}")
+            raise RuntimeError(f"TShark analysis failed: {message}")
+
+def iter_tshark_batches(
+    pcap_file: str,
+    batch_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, Dict[str, List[Optional[str]]]]]:
+    """
+    Decode a capture with TShark into (packets, found) batches, the same
+    shape native_batches yields, so TShark can feed an AnalysisPipeline.
+    """
+    batch_size = batch_size or settings.PACKET_BATCH_SIZE
+    rows: List[Dict] = []
+    for pkt in iter_tshark_packets(pcap_file):
+        rows.append(pkt)
+        if len(rows) >= batch_size:
+            yield rows_to_packets(rows), tshark_artifacts(rows)
+            rows = []
+    if rows:
+        yield rows_to_packets(rows), tshark_artifacts(rows)
+
+def analysis_pipeline(
+    summary: TrafficSummary,
+    store: Optional[PacketStoreWriter] = None,
+    flows: Optional[FlowTable] = None,
+    artifacts: Optional[ArtifactIndex] = None,
+    capture_index: Optional[CaptureIndexBuilder] = None,
+    timeseries: Optional[TimeSeriesBuilder] = None,
+    timings: Optional[PluginTimings] = None
+) -> AnalysisPipeline:
+    """
+    Register the standard packet analyzers on a new pipeline.
+
+    Aggregates left as None are not registered. When both flows and
+    timeseries are given, flows are counted into the series as they open.
+    """
+    pipeline = AnalysisPipeline(timings)
+    pipeline.on_packets("summary", lambda packets, found: summary.add_batch(packets, dns_queries=found["dns_query"]))
+    if store is not None:
+        pipeline.on_packets(
+            "packet_store",
+            lambda packets, found: store.add_batch(packets, {name: found[name] for name in STRING_COLUMNS})
+        )
+    if flows is not None:
+        def add_flows(packets: np.ndarray, found: Dict[str, List[Optional[str]]]) -> None:
+            known = len(flows)
+            flows.add_batch(packets)
+            if timeseries is not None:
+                timeseries.add_flows(flows.flows["first_seen"][known:])
+        pipeline.on_packets("flows", add_flows)
+    if artifacts is not None:
+        pipeline.on_packets("artifacts", artifacts.add_batch)
+    if capture_index is not None:
+        pipeline.on_packets("capture_index", lambda packets, found: capture_index.add_batch(packets))
+    if timeseries is not None:
+        pipeline.on_packets("timeseries", lambda packets, found: timeseries.add_batch(packets))
+    return pipeline
+
+def analyze_with_tshark(
+    pcap_file: str,
+    packet_sink: Optional[Callable[[Dict], None]] = None,
+    summary: Optional[TrafficSummary] = None
+) -> Dict:
+    """
+    Analyze a PCAP file using TShark with detailed forensic insights.
+
+    TShark output is consumed as a stream and the summary is aggregated
+    packet by packet. When packet_sink is given every packet is handed to
+    it and only the summary is returned, so peak memory does not depend
+    on capture size. Without a sink the packet list is returned alongside
+    the summary. Pass summary to aggregate into an existing
+    TrafficSummary.
+    """
+    validate_pcap_file(pcap_file)
+    logger.info(f"Running TShark analysis on {pcap_file}")
+
+    summary = TrafficSummary() if summary is None else summary
+    packets = [] if packet_sink is None else None
+    for pkt in iter_tshark_packets(pcap_file):
+        summary.add(pkt)
+        if packets is None:
+            packet_sink(pkt)
+        else:
+            packets.append(pkt)
+
+    result = {"summary": summary.to_dict()}
+    if packets is not None:
+        result["packets"] = packets
+    return result
+
+def analyze_with_native_reader(
+    pcap_file: str,
+    batch_sink: Optional[Callable[[np.ndarray, Dict[str, List[Optional[str]]]], None]] = None,
+    summary: Optional[TrafficSummary] = None,
+    artifacts: Optional[ArtifactIndex] = None
+) -> Dict:
+    """
+    Summarize a PCAP file with the native reader.
+
+    Headers are decoded in bulk into NumPy arrays and aggregated per batch;
+    the summary has the same shape as analyze_with_tshark. DNS, HTTP and
+    TLS artifacts are parsed from the payloads that carry them and indexed
+    into artifacts when given. Decoded batches are handed to batch_sink
+    together with the per-packet artifact strings, as a packet plugin.
+
+    Raises:
+        CaptureFormatError: If the capture cannot be decoded natively
+    """
+    validate_pcap_file(pcap_file)
+    logger.info(f"Running native analysis on {pcap_file}")
+
+    summary = TrafficSummary() if summary is None else summary
+    pipeline = analysis_pipeline(summary, artifacts=artifacts)
+    if batch_sink is not None:
+        pipeline.on_packets("batch_sink", batch_sink)
+    with PcapReader(pcap_file) as reader:
+        pipeline.run(native_batches(reader))
+    return {"summary": summary.to_dict()}
+
+def plan_shards(pcap_file: str) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Split a capture into record-aligned byte ranges of at least
+    NETWORK_SHARD_MIN_SIZE bytes, at most NETWORK_ANALYSIS_WORKERS of them.
+
+    Returns the ranges, empty when the capture should be analyzed in one
+    pass, and the number of pcapng sections the first shard opens.
+
+    Raises:
+        CaptureFormatError: If the capture cannot be decoded natively
+    """
+    if settings.NETWORK_DEEP_DISSECTION:
+        return [], 0
+    with PcapReader(pcap_file) as reader:
+        shards = min(settings.NETWORK_ANALYSIS_WORKERS, reader.size // max(settings.NETWORK_SHARD_MIN_SIZE, 1))
+        if shards < 2:
+            return [], 0
+        ranges = reader.shard_ranges(shards)
+        first_sections = 1 if reader.format == "pcapng" else 0
+    return (ranges if len(ranges) >= 2 else []), first_sections
+
+def shard_store_path(store_path: str, shard: int) -> str:
+    return f"{store_path}.shard{shard}"
+
+def _partial_path(shard_path: str) -> str:
+    return f"{shard_path}.partial"
+
+@app_celery.task
+def analyze_capture_range(pcap_file: str, start: int, end: int, shard_path: str) -> Dict:
+    """
+    Analyze the records of one capture shard.
+
+    Runs as a chord member of analyze_network_task. The packet store is
+    written to shard_path and the partial aggregates are pickled next to
+    it, since they cannot travel in a task result; the reader position is
+    returned so the chord callback can check the shard ended exactly where
+    the next one starts.
+    """
+    summary = TrafficSummary()
+    flows = FlowTable()
+    artifacts = ArtifactIndex()
+    capture_index = CaptureIndexBuilder()
+    timings = PluginTimings()
+    with PcapReader(pcap_file) as reader, PacketStoreWriter(shard_path) as store:
+        pipeline = analysis_pipeline(
+            summary, store, flows=flows, artifacts=artifacts, capture_index=capture_index, timings=timings
+        )
+        pipeline.run(native_batches(reader, start=start, end=end))
+        position, sections = reader.position, reader.sections_seen
+    with open(_partial_path(shard_path), "wb") as f:
+        pickle.dump({
+            "summary": summary,
+            "flows": flows,
+            "artifacts": artifacts,
+            "capture_index": capture_index,
+            "timings": timings
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"position": position, "sections": sections}
+
+def merge_shards(
+    shards: List[Dict],
+    ranges: List[Tuple[int, int]],
+    first_sections: int,
+    store_path: str,
+    flows: Optional[FlowTable] = None,
+    artifacts: Optional[ArtifactIndex] = None,
+    capture_index: Optional[CaptureIndexBuilder] = None,
+    timings: Optional[PluginTimings] = None
+) -> Optional[TrafficSummary]:
+    """
+    Merge the results of analyze_capture_range over ranges, in shard order.
+
+    Partial summaries, flow tables, artifact and capture indexes and packet
+    stores are merged into the given aggregates and the packet store at
+    store_path; plugin timings are summed over the shards. Space-Saving
+    heavy hitters merge approximately, so _complete_analysis recounts
+    them from the merged flows and artifacts. Returns None when shard
+    boundaries could not be confirmed, in which case the caller should
+    analyze the capture in one pass.
+    """
+    # A shard must stop exactly on the next shard's first record, and
+    # only the last shard may open a new pcapng section
+    for i, ((_, end), shard) in enumerate(zip(ranges, shards)):
+        last = i == len(ranges) - 1
+        expected_sections = first_sections if i == 0 else 0
+        if not last and (shard["position"] != end or shard["sections"] > expected_sections):
+            logger.warning(f"Shard {i} of {store_path} is not record-aligned")
+            return None
+
+    summary = TrafficSummary()
+    with PacketStoreWriter(store_path) as store:
+        for i in range(len(ranges)):
+            shard_path = shard_store_path(store_path, i)
+            with open(_partial_path(shard_path), "rb") as f:
+                partial = pickle.load(f)
+            summary.merge(partial["summary"])
+            if flows is not None:
+                flows.merge(partial["flows"])
+            if artifacts is not None:
+                artifacts.merge(partial["artifacts"])
+            if capture_index is not None:
+                capture_index.merge(partial["capture_index"])
+            if timings is not None:
+                timings.merge(partial["timings"])
+            with PacketStore(shard_path) as part:
+                store.add_store(part)
+    return summary
+
+def remove_shards(store_path: str, count: int) -> None:
+    """Delete the shard packet stores and partial aggregates of store_path."""
+    for i in range(count):
+        shard_path = shard_store_path(store_path, i)
+        for path in (shard_path, _partial_path(shard_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+def run_network_analysis(
+    pcap_file: str,
+    store_path: str,
+    flows: Optional[FlowTable] = None,
+    artifacts: Optional[ArtifactIndex] = None,
+    capture_index: Optional[CaptureIndexBuilder] = None,
+    timings: Optional[PluginTimings] = None
+) -> TrafficSummary:
+    """
+    Analyze a capture, writing the packet table to a columnar store at
+    store_path and aggregating sessions into flows, protocol artifacts
+    into artifacts and seek checkpoints into capture_index when given.
+    The native reader is used unless deep dissection is enabled or the
+    capture cannot be decoded natively, in which case TShark is used.
+    Either way the capture is decoded once, in one pass, and fanned out to
+    the analyzers of analysis_pipeline; their timings go into timings.
+    """
+    if not settings.NETWORK_DEEP_DISSECTION:
+        try:
+            validate_pcap_file(pcap_file)
+            logger.info(f"Running native analysis on {pcap_file}")
+            summary = TrafficSummary()
+            with PcapReader(pcap_file) as reader, PacketStoreWriter(store_path) as store:
+                pipeline = analysis_pipeline(
+                    summary, store, flows=flows, artifacts=artifacts, capture_index=capture_index, timings=timings
+                )
+                pipeline.run(native_batches(reader))
+            return summary
+        except CaptureFormatError as e:
+            logger.warning(f"Native reader cannot decode {pcap_file}: {str(e)}. Falling back to TShark")
+            _reset(flows, artifacts, capture_index, timings)
+
+    # TShark needs the raw capture on disk
+    summary = TrafficSummary()
+    with materialized_evidence(pcap_file) as raw_path, PacketStoreWriter(store_path) as store:
+        validate_pcap_file(raw_path)
+        logger.info(f"Running TShark analysis on {raw_path}")
+        pipeline = analysis_pipeline(summary, store, flows=flows, artifacts=artifacts, timings=timings)
+        pipeline.run(iter_tshark_batches(raw_path))
+    if capture_index is not None:
+        # TShark reports no record offsets; a header-only native pass still
+        # gives seek checkpoints when the capture format allows it
+        try:
+            with pipeline.timed("capture_index"):
+                index_capture(pcap_file, capture_index)
+        except CaptureFormatError as e:
+            capture_index.clear()
+            logger.warning(f"No capture index for {pcap_file}: {str(e)}")
+    return summary
+
+def _reset(*aggregates) -> None:
+    """Drop partial results before re-reading a capture another way."""
+    for aggregate in aggregates:
+        if aggregate is not None:
+            aggregate.clear()
+
+# Smallest file that can hold a pcap file header or pcapng section header
+FOLLOW_MIN_SIZE = 28
+
+def live_channel(analysis_id: int) -> str:
+    """Pub/sub channel carrying the metric deltas of a followed capture."""
+    return f"network:live:{analysis_id}"
+
+def layout_channel(analysis_id: int) -> str:
+    """Pub/sub channel carrying the positions of a topology layout in progress."""
+    return f"network:layout:{analysis_id}"
+
+def publish_live(publisher: redis.Redis, analysis_id: int, message: Dict, channel: Optional[str] = None) -> None:
+    """Publish a live update (on live_channel by default); clients missing one update is not an error."""
+    try:
+        publisher.publish(channel or live_channel(analysis_id), json.dumps({"analysis_id": analysis_id, **message}))
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish live update for analysis {analysis_id}: {str(e)}")
+
+def metrics_key(analysis_id: int) -> str:
+    """Redis key of the latest NetworkMetrics of an analysis, shared by all API workers."""
+    return f"network:metrics:{analysis_id}"
+
+def network_metrics(summary: TrafficSummary, flows: FlowTable, packets_per_second: float, limit: int = 10) -> Dict:
+    """
+    NetworkMetrics fields from the aggregates kept while ingesting.
+
+    Built once per follow poll and at completion, so reading metrics
+    never touches the packets or flows.
+    """
+    summary.flush()
+    last_seen = flows.flows["last_seen"]
+    active = int(np.count_nonzero(last_seen >= last_seen.max() - settings.NETWORK_ACTIVE_WINDOW)) if last_seen.size else 0
+    return {
+        "total_bytes": summary.total_bytes,
+        "packets_per_second": packets_per_second,
+        "active_connections": active,
+        "unique_ips": summary.distinct_ips.count(),
+        "protocols": dict(summary.protocols),
+        "top_talkers": [{"ip": format_ip(ip), "bytes": sent} for ip, sent in estimate_talkers(summary.sketches(), limit)],
+        "timestamp": datetime.utcnow().isoformat()
     }
 
-    return {"summary": summary, "packets": packets}
+def store_metrics(client: redis.Redis, analysis_id: int, metrics: Dict) -> None:
+    """Share metrics with the API workers; they fall back to the stored results."""
+    try:
+        client.set(metrics_key(analysis_id), json.dumps(metrics), ex=settings.NETWORK_METRICS_REDIS_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Could not store metrics for analysis {analysis_id}: {str(e)}")
+
+class CaptureFollower:
+    """
+    Analyze a capture that is still being written.
+
+    Each poll reads the records appended since the previous one with the
+    native reader and feeds them through the same analysis_pipeline a full
+    analysis uses. A record the writer has not finished is left for the
+    next poll.
+    """
+
+    def __init__(
+        self,
+        pcap_file: str,
+        store: PacketStoreWriter,
+        summary: TrafficSummary,
+        flows: Optional[FlowTable] = None,
+        artifacts: Optional[ArtifactIndex] = None,
+        capture_index: Optional[CaptureIndexBuilder] = None,
+        timeseries: Optional[TimeSeriesBuilder] = None,
+        timings: Optional[PluginTimings] = None
+    ):
+        self.pcap_file = pcap_file
+        self.summary = summary
+        self.flows = flows
+        self.position: Optional[int] = None  # Offset of the next unread record
+        self.pipeline = analysis_pipeline(
+            summary, store, flows=flows, artifacts=artifacts,
+            capture_index=capture_index, timeseries=timeseries, timings=timings
+        )
+        self.pipeline.on_packets("live", self._observe)
+        self._delta: Dict = {}
+
+    def _observe(self, packets: np.ndarray, found: Dict[str, List[Optional[str]]]) -> None:
+        """Packet plugin accumulating the metric delta of the current poll."""
+        self._delta["packets"] += int(packets.size)
+        self._delta["bytes"] += int(packets["length"].sum(dtype=np.int64))
+        self._delta["first_seen"] = min(self._delta["first_seen"], float(packets["ts"].min()))
+        self._delta["last_seen"] = max(self._delta["last_seen"], float(packets["ts"].max()))
+
+    def poll(self) -> Optional[Dict]:
+        """
+        Read the records appended since the last poll.
+
+        Returns:
+            Metric delta for the new packets, or None if there were none
+
+        Raises:
+            CaptureFormatError: If the capture cannot be decoded natively or
+                shrank below what was already read (it was replaced)
+        """
+        size = os.path.getsize(self.pcap_file)
+        if size < FOLLOW_MIN_SIZE:
+            return None
+        if self.position is not None:
+            if size < self.position:
+                raise CaptureFormatError(f"Capture shrank below offset {self.position}: {self.pcap_file}")
+            if size == self.position:
+                return None
+
+        self._delta = {"packets": 0, "bytes": 0, "first_seen": np.inf, "last_seen": -np.inf}
+        known_flows = len(self.flows) if self.flows is not None else 0
+        protocols = dict(self.summary.protocols)
+        with PcapReader(self.pcap_file) as reader:
+            self.pipeline.run(native_batches(reader, start=self.position, allow_truncated=True))
+            self.position = reader.position
+        if not self._delta["packets"]:
+            return None
+
+        return {
+            **self._delta,
+            "new_flows": len(self.flows) - known_flows if self.flows is not None else 0,
+            "protocols": {
+                proto: count - protocols.get(proto, 0)
+                for proto, count in self.summary.protocols.items()
+                if count != protocols.get(proto, 0)
+            },
+            "packet_count": self.summary.packet_count,
+            "total_bytes": self.summary.total_bytes,
+            "flow_count": len(self.flows) if self.flows is not None else None,
+            "distinct_ips": self.summary.distinct_ips.count()
+        }
+
+    def follow(
+        self,
+        on_update: Optional[Callable[[Dict], None]] = None,
+        poll_interval: Optional[float] = None,
+        idle_timeout: Optional[float] = None
+    ) -> None:
+        """
+        Poll until the capture has not grown for idle_timeout seconds,
+        handing every metric delta to on_update.
+        """
+        poll_interval = settings.NETWORK_FOLLOW_POLL_INTERVAL if poll_interval is None else poll_interval
+        idle_timeout = settings.NETWORK_FOLLOW_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        last_update = time.monotonic()
+        while True:
+            delta = self.poll()
+            now = time.monotonic()
+            if delta is not None:
+                delta["packets_per_second"] = delta["packets"] / max(now - last_update, poll_interval, 1e-3)
+                last_update = now
+                if on_update is not None:
+                    on_update(delta)
+            elif now - last_update >= idle_timeout:
+                logger.info(f"{self.pcap_file} idle for {idle_timeout}s; stopped following")
+                return
+            time.sleep(poll_interval)
+
+def summary_addresses(summary: Dict) -> List[str]:
+    """Addresses shown in a rendered summary: talkers, conversations, indicator hits and beacons."""
+    addresses = [ip for ip in summary.get("top_talkers", {}) if ip != "N/A"]
+    for conversation in summary.get("top_conversations", []):
+        addresses += [conversation["src_ip"], conversation["dst_ip"]]
+    for match in summary.get("indicator_matches", []):
+        addresses += match["addresses"]
+    for beacon in summary.get("beacons", []):
+        addresses += [beacon["src_ip"], beacon["dst_ip"]]
+    return sorted(set(addresses))
+
+def _complete_analysis(
+    db,
+    analysis: NetworkAnalysis,
+    analysis_dir: str,
+    summary: TrafficSummary,
+    flows: FlowTable,
+    artifacts: ArtifactIndex,
+    capture_index: CaptureIndexBuilder,
+    timings: PluginTimings,
+    started: float
+) -> Dict:
+    """
+    Write the derived data of a finished capture and mark the analysis completed.
+
+    Analyzers that need the finished flow table run here as flow plugins.
+    """
+    summary.recount(flows, artifacts)
+    if capture_index.packets:
+        capture_index.save(capture_index_path(analysis_dir))
+    # Sketch state is kept so captures can later be combined
+    save_sketches(os.path.join(analysis_dir, SKETCHES_FILENAME), summary.sketches())
+
+    pipeline = AnalysisPipeline(timings)
+    # Chart series are bucketed once here from the packet store, which by
+    # now knows the top hosts, so they never need a rescan
+    hosts = np.array([ip for ip, _ in summary.top_talkers.top(settings.TIMESERIES_TOP_HOSTS)], dtype="S16")
+
+    def timeseries(table: np.ndarray) -> None:
+        with PacketStore(packet_store_path(analysis_dir)) as store:
+            build_timeseries(store, table, list(summary.protocols), hosts, timeseries_dir(analysis_dir))
+    pipeline.on_flows("timeseries", timeseries)
+    # Flows are tagged against the threat-intel sets current at completion
+    pipeline.on_flows("indicators", lambda table: match_flows(get_indicator_matcher(), table))
+    pipeline.on_flows("beacons", detect_beacons)
+    pipeline.on_flows("topology", aggregate_edges)
+    found = pipeline.finish(flows.flows)
+
+    indicators, indicator_matches = found["indicators"]
+    rendered = {**summary.to_dict(), "indicator_matches": indicator_matches, "beacons": found["beacons"]}
+    # Owner/ASN/geo attributes are resolved once here, not per request
+    with pipeline.timed("enrichment"):
+        rendered["enrichment"] = enrich_ips(summary_addresses(rendered))
+        database = get_ip_database()
+        topology = found["topology"]
+        node_metadata = database.annotate(topology.addresses) if database is not None else {}
+    # Nodes are named from the capture's own DNS answers, SNI and Host
+    # headers, falling back to what other analyses saw
+    with pipeline.timed("hostnames"):
+        labels = label_topology(db, analysis.id, topology, artifacts.hostnames, node_metadata)
+    with pipeline.timed("persist"):
+        node_count, connection_count = persist_topology(db, analysis.id, topology, metadata=node_metadata, labels=labels)
+        results = {
+            "summary": rendered,
+            "flow_count": persist_flows(db, analysis.id, flows, indicators=indicators),
+            "artifact_count": persist_artifacts(db, analysis.id, artifacts),
+            "node_count": node_count,
+            "connection_count": connection_count
+        }
+    # Zoom levels and the path query index of the topology are built once here
+    if node_count:
+        with pipeline.timed("topology_levels"):
+            TopologyLevels.build(topology).save(topology_levels_path(analysis_dir))
+        with pipeline.timed("graph_index"):
+            GraphIndex.build(topology).save(graph_index_path(analysis_dir))
+    # Rate over the capture's own time span, not the analysis run time
+    span = float(flows.flows["last_seen"].max() - flows.flows["first_seen"].min()) if len(flows) else 0.0
+    results["metrics"] = network_metrics(summary, flows, summary.packet_count / span if span > 0 else 0.0)
+    results["timings"] = timings.to_dict()
+    logger.info(f"Analysis {analysis.id} stage timings: {results['timings']['seconds']}")
+
+    analysis.result_json = json.dumps(results)
+    analysis.packet_count = results["summary"]["packet_count"]
+    analysis.flow_count = results["flow_count"]
+    analysis.artifact_count = results["artifact_count"]
+    analysis.duration = int(time.time() - started)
+    analysis.status = AnalysisStatus.COMPLETED
+    db.commit()
+    # The layout is refined in the background; the topology is usable before
+    if node_count:
+        queue_layout(analysis.id)
+    return results
+
+def _fail_analysis(db, analysis: NetworkAnalysis, error: str) -> None:
+    """Mark an analysis failed and delete the derived data it left half written."""
+    analysis.status = AnalysisStatus.FAILED
+    analysis.error_message = error
+    db.commit()
+    remove_analysis_dir(analysis.id)
 
 @app_celery.task(bind=True)
 def analyze_network_task(self, pcap_file: str, file_id: int) -> Dict:
-    tshark_results = analyze_with_tshark(pcap_file)
+    """
+    Analyze an uploaded capture.
+
+    Captures spanning at least two NETWORK_SHARD_MIN_SIZE shards are split
+    by plan_shards and analyzed by a chord of analyze_capture_range
+    subtasks, spread over the Celery workers; its callback,
+    merge_shards_task, completes the analysis and this task only returns
+    the analysis id and shard count. Smaller captures are analyzed here
+    in one pass.
+    """
+    db = SessionLocal()
+    analysis = NetworkAnalysis(file_id=file_id, status=AnalysisStatus.IN_PROGRESS)
+    db.add(analysis)
+    db.commit()
 
-    db.session = SessionLocal()
-    analysis = NetworkAnalysis(
-        file_id=file_id,
-        result_json=json.dumps(tshark_results)
-    )
-    db.session.add(analysis)
-    db.session.commit()
-    db.session.close()
+    started = time.time()
+    try:
+        # Only the summary goes into result_json; the packet table lives in
+        # the analysis' columnar store and is read on demand.
+        analysis_dir = get_analysis_dir(analysis.id)
+        store_path = packet_store_path(analysis_dir)
+        validate_pcap_file(pcap_file)
+        try:
+            ranges, first_sections = plan_shards(pcap_file)
+        except CaptureFormatError:
+            # run_network_analysis falls back to TShark
+            ranges, first_sections = [], 0
+        if ranges:
+            logger.info(f"Analyzing {pcap_file} in {len(ranges)} shards")
+            callback = merge_shards_task.s(pcap_file, analysis.id, ranges, first_sections, started)
+            chord([
+                analyze_capture_range.s(pcap_file, start, end, shard_store_path(store_path, i))
+                for i, (start, end) in enumerate(ranges)
+            ])(callback.on_error(shard_failed_task.s(analysis.id, len(ranges))))
+            return {"analysis_id": analysis.id, "shards": len(ranges)}
 
-    return tshark_results
+        flows = FlowTable()
+        artifacts = ArtifactIndex()
+        capture_index = CaptureIndexBuilder()
+        timings = PluginTimings()
+        summary = run_network_analysis(
+            pcap_file, store_path, flows=flows, artifacts=artifacts, capture_index=capture_index, timings=timings
+        )
+        return _complete_analysis(db, analysis, analysis_dir, summary, flows, artifacts, capture_index, timings, started)
+    except Exception as e:
+        logger.error(f"Network analysis failed for file {file_id}: {str(e)}")
+        _fail_analysis(db, analysis, str(e))
+        raise
+    finally:
+        db.close()
+
+@app_celery.task(bind=True)
+def merge_shards_task(
+    self,
+    shards: List[Dict],
+    pcap_file: str,
+    analysis_id: int,
+    ranges: List[Tuple[int, int]],
+    first_sections: int,
+    started: float
+) -> Dict:
+    """
+    Chord callback of a sharded analyze_network_task: merge the shards and
+    complete the analysis. If shard boundaries cannot be confirmed the
+    capture is analyzed again in one pass.
+    """
+    db = SessionLocal()
+    analysis = db.get(NetworkAnalysis, analysis_id)
+    analysis_dir = get_analysis_dir(analysis_id)
+    store_path = packet_store_path(analysis_dir)
+    try:
+        flows = FlowTable()
+        artifacts = ArtifactIndex()
+        capture_index = CaptureIndexBuilder()
+        timings = PluginTimings()
+        summary = merge_shards(
+            shards, ranges, first_sections, store_path, flows=flows, artifacts=artifacts,
+            capture_index=capture_index, timings=timings
+        )
+        if summary is None:
+            logger.warning(f"Shards of {pcap_file} are not record-aligned; analyzing in one pass")
+            _reset(flows, artifacts, capture_index, timings)
+            summary = run_network_analysis(
+                pcap_file, store_path, flows=flows, artifacts=artifacts, capture_index=capture_index, timings=timings
+            )
+        return _complete_analysis(db, analysis, analysis_dir, summary, flows, artifacts, capture_index, timings, started)
+    except Exception as e:
+        logger.error(f"Network analysis {analysis_id} failed: {str(e)}")
+        _fail_analysis(db, analysis, str(e))
+        raise
+    finally:
+        remove_shards(store_path, len(ranges))
+        db.close()
+
+@app_celery.task
+def shard_failed_task(request, exc, traceback, analysis_id: int, shard_count: int) -> None:
+    """Error callback of a sharded analysis: a shard failed, so the merge never runs."""
+    logger.error(f"Network analysis {analysis_id} failed in a shard: {str(exc)}")
+    db = SessionLocal()
+    try:
+        _fail_analysis(db, db.get(NetworkAnalysis, analysis_id), str(exc))
+    finally:
+        remove_shards(packet_store_path(get_analysis_dir(analysis_id)), shard_count)
+        db.close()
+
+@app_celery.task(bind=True)
+def follow_network_task(self, pcap_file: str, file_id: int) -> Dict:
+    """
+    Analyze a capture while a sensor is still writing it.
+
+    Flows, sketches and time series are updated as records arrive and a
+    metric delta, with the current NetworkMetrics under "metrics", is
+    published on live_channel(analysis_id) after every poll that found
+    packets. Once the file has not grown for NETWORK_FOLLOW_IDLE_TIMEOUT
+    seconds the analysis is completed exactly like analyze_network_task.
+    Follow mode always uses the native reader.
+    """
+    db = SessionLocal()
+    analysis = NetworkAnalysis(file_id=file_id, status=AnalysisStatus.IN_PROGRESS)
+    db.add(analysis)
+    db.commit()
+
+    started = time.time()
+    publisher = redis.Redis.from_url(settings.REDIS_URL)
+    try:
+        validate_pcap_file(pcap_file)
+        analysis_dir = get_analysis_dir(analysis.id)
+        summary = TrafficSummary()
+        flows = FlowTable()
+        artifacts = ArtifactIndex()
+        capture_index = CaptureIndexBuilder()
+        timeseries = TimeSeriesBuilder()
+        timings = PluginTimings()
+
+        def on_update(delta: Dict) -> None:
+            # Live series and sketches are rewritten so queries see new data
+            timeseries.write(timeseries_dir(analysis_dir))
+            save_sketches(os.path.join(analysis_dir, SKETCHES_FILENAME), summary.sketches())
+            analysis.packet_count = summary.packet_count
+            analysis.flow_count = len(flows)
+            db.commit()
+            metrics = network_metrics(summary, flows, delta["packets_per_second"])
+            store_metrics(publisher, analysis.id, metrics)
+            publish_live(publisher, analysis.id, {**delta, "metrics": metrics})
+
+        logger.info(f"Following {pcap_file} as analysis {analysis.id}")
+        with PacketStoreWriter(packet_store_path(analysis_dir)) as store:
+            follower = CaptureFollower(
+                pcap_file, store, summary, flows=flows, artifacts=artifacts,
+                capture_index=capture_index, timeseries=timeseries, timings=timings
+            )
+            follower.follow(on_update=on_update)
+        results = _complete_analysis(
+            db, analysis, analysis_dir, summary, flows, artifacts, capture_index, timings, started
+        )
+        store_metrics(publisher, analysis.id, results["metrics"])
+        publish_live(publisher, analysis.id, {"completed": True, "metrics": results["metrics"]})
+        return results
+    except Exception as e:
+        logger.error(f"Following capture failed for file {file_id}: {str(e)}")
+        _fail_analysis(db, analysis, str(e))
+        raise
+    finally:
+        publisher.close()
+        db.close()
+
+@app_celery.task(bind=True)
+def layout_network_task(self, analysis_id: int) -> Dict:
+    """
+    Compute the server-side layout of an analysis' topology.
+
+    Coordinates are stored on the topology nodes and published on
+    layout_channel(analysis_id) every LAYOUT_PUBLISH_INTERVAL iterations,
+    so an open topology view settles progressively.
+    """
+    db = SessionLocal()
+    publisher = redis.Redis.from_url(settings.REDIS_URL)
+    try:
+        def on_progress(iteration: int, iterations: int, node_ids: List[str], positions: np.ndarray) -> None:
+            publish_live(publisher, analysis_id, {"layout": {
+                "iteration": iteration,
+                "iterations": iterations,
+                "positions": dict(zip(node_ids, positions.tolist()))
+            }}, channel=layout_channel(analysis_id))
+
+        return {"node_count": layout_topology(db, analysis_id, on_progress=on_progress)}
+    except Exception as e:
+        logger.error(f"Topology layout failed for analysis {analysis_id}: {str(e)}")
+        raise
+    finally:
+        publisher.close()
+        db.close()
+
+def queue_layout(analysis_id: int) -> None:
+    """
+    Queue the layout of an analysis' topology. The topology is complete
+    without it (nodes just have no coordinates), so a broker failure is
+    logged rather than raised.
+    """
+    try:
+        layout_network_task.delay(analysis_id)
+    except Exception as e:
+        logger.error(f"Failed to queue topology layout for analysis {analysis_id}: {str(e)}")
 
 def analyze_with_scapy(pcap_file: str) -> List[str]:
     """
@@ -133,5 +1090,5 @@ def analyze_with_scapy(pcap_file: str) -> List[str]:
 
 if __name__ == "__main__":
     pcap_file = "upload.pcap"
-    results = analyze_network_task(pcap_file)
+    results = analyze_with_tshark(pcap_file)
     print(json.dumps(results, indent=4))
\ No newline at end of file
@@ -0,0 +1,76 @@
+import json
+import time
+import logging
+import redis.asyncio as redis
+from typing import Callable, Dict, Optional, Tuple
+from core.config import settings
+from services.network_analysis import metrics_key
+
+logger = logging.getLogger(__name__)
+
+# Metrics are written by the analysis tasks (every follow poll and at
+# completion), never computed on read. A read is a dict lookup, else one
+# Redis GET, else one stored-results row for analyses Redis has expired.
+METRICS_CACHE_SIZE = 1024
+
+MetricsLoader = Callable[[], Optional[Dict]]
+
+class MetricsCache:
+    """
+    NetworkMetrics of analyses, cached in this process for
+    NETWORK_METRICS_CACHE_TTL seconds in front of the Redis copy shared
+    by all API workers.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.NETWORK_METRICS_CACHE_TTL if ttl is None else ttl
+        self._entries: Dict[int, Tuple[float, Dict]] = {}
+        self._client: Optional[redis.Redis] = None
+
+    def _redis(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.from_url(settings.REDIS_URL)
+        return self._client
+
+    async def get(self, analysis_id: int, load: MetricsLoader) -> Optional[Dict]:
+        """
+        Latest metrics of an analysis, or None if none were recorded.
+
+        load reads them from the stored results when Redis has none; what
+        it returns is written back to Redis for the other workers.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(analysis_id)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+
+        metrics = await self._get_shared(analysis_id)
+        if metrics is None:
+            metrics = load()
+            if metrics is not None:
+                await self._set_shared(analysis_id, metrics)
+        if metrics is None:
+            return None
+        self._entries.pop(analysis_id, None)
+        self._entries[analysis_id] = (now, metrics)
+        while len(self._entries) > METRICS_CACHE_SIZE:
+            # Dicts keep insertion order, so the first entry is the oldest
+            del self._entries[next(iter(self._entries))]
+        return metrics
+
+    async def _get_shared(self, analysis_id: int) -> Optional[Dict]:
+        try:
+            cached = await self._redis().get(metrics_key(analysis_id))
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Could not read metrics of analysis {analysis_id} from Redis: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _set_shared(self, analysis_id: int, metrics: Dict) -> None:
+        try:
+            await self._redis().set(metrics_key(analysis_id), json.dumps(metrics), ex=settings.NETWORK_METRICS_REDIS_TTL)
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Could not store metrics of analysis {analysis_id} in Redis: {str(e)}")
+
+    def invalidate(self, analysis_id: int) -> None:
+        self._entries.pop(analysis_id, None)
@@ -1,121 +1,112 @@
+import json
 import asyncio
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Optional
 from sqlalchemy.orm import Session
 from fastapi import WebSocket
-from models.network import NetworkNode, NetworkConnection
-from schemas.network import NetworkTopologyResponse, NetworkMetrics
-import networkx as nx
+from models.network import NetworkNode, NetworkConnection, NodeStatus
+from schemas.network import NetworkTopologyResponse, NetworkNodeResponse, NetworkConnectionResponse, NetworkMetrics
 import logging
-from core.enums import NodeType, NodeStatus
 from models import NetworkAnalysis
-from core.exceptions import FileAnalysisError
+from services.live_feed import LiveFeedHub
+from services.network_metrics import MetricsCache
+from services.graph_analytics import GraphCache, TopologyGraph
+from services.graph_queries import GraphIndex, GraphIndexCache
+from services.topology_levels import TopologyLevels, TopologyLevelsCache
 
 logger = logging.getLogger(__name__)
 
 class NetworkTopologyService:
     def __init__(self):
-        self.active_connections = {}
-        self.graph = nx.DiGraph()
+        self.feeds = LiveFeedHub()
+        self.graphs = GraphCache()
+        self.metrics = MetricsCache()
+        self.graph_indexes = GraphIndexCache()
+        self.topology_levels = TopologyLevelsCache()
 
-    async def analyze_pcap(self, file_path: str, db: Session) -> NetworkTopologyResponse:
-        """Analyze PCAP file and build network topology."""
-        try:
-            # Use scapy to analyze PCAP file
-            packets = rdpcap(file_path)
-            nodes = set()
-            connections = []
-            
-            for packet in packets:
-                if IP in packet:
-                    src_ip = packet[IP].src
-                    dst_ip = packet[IP].dst
-                    
-                    # Add nodes
-                    nodes.add(src_ip)
-                    nodes.add(dst_ip)
-                    
-                    # Add connection
-                    protocol = packet.name
-                    port = packet[TCP].dport if TCP in packet else packet[UDP].dport if UDP in packet else None
-                    
-                    connections.append({
-                        "source": src_ip,
-                        "target": dst_ip,
-                        "protocol": protocol,
-                        "port": port,
-                        "timestamp": datetime.fromtimestamp(packet.time)
-                    })
-            
-            # Create network topology
-            topology = self._build_topology(nodes, connections, db)
-            return topology
-            
-        except Exception as e:
-            logger.error(f"Failed to analyze PCAP file: {str(e)}")
-            raise NetworkAnalysisError(f"PCAP analysis failed: {str(e)}")
+    def get_graph(self, db: Session, analysis_id: int) -> TopologyGraph:
+        """Analytics graph of an analysis, rebuilt only when its topology changed."""
+        return self.graphs.get(db, analysis_id)
 
-    def _build_topology(self, nodes: set, connections: List[Dict], db: Session) -> NetworkTopologyResponse:
-        """Build network topology from analyzed data."""
-        network_nodes = []
-        network_connections = []
-        
-        # Create nodes
-        for ip in nodes:
-            node_type = self._determine_node_type(ip, connections)
-            node = NetworkNode(
-                node_id=ip,
-                label=self._get_hostname(ip),
-                type=node_type,
-                status="active",
-                ip_address=ip
-            )
-            db.add(node)
-            network_nodes.append(node)
-            
-        db.commit()
-        
-        # Create connections
-        for conn in connections:
-            source_node = db.query(NetworkNode).filter(NetworkNode.node_id == conn["source"]).first()
-            target_node = db.query(NetworkNode).filter(NetworkNode.node_id == conn["target"]).first()
-            
-            if source_node and target_node:
-                connection = NetworkConnection(
-                    source_id=source_node.id,
-                    target_id=target_node.id,
-                    connection_type=self._determine_connection_type(conn),
-                    protocol=conn["protocol"],
-                    port=conn["port"],
-                    status="active"
-                )
-                db.add(connection)
-                network_connections.append(connection)
-                
-        db.commit()
-        
+    def get_graph_index(self, analysis_id: int) -> GraphIndex:
+        """Path query index of an analysis, kept loaded between requests."""
+        return self.graph_indexes.get(analysis_id)
+
+    def get_topology_levels(self, analysis_id: int) -> TopologyLevels:
+        """Level-of-detail topology of an analysis, kept loaded between requests."""
+        return self.topology_levels.get(analysis_id)
+
+    def get_topology(self, db: Session, analysis_id: int) -> NetworkTopologyResponse:
+        """Stored topology of an analysis; edges reference nodes by node_id."""
+        nodes = db.query(NetworkNode).filter(NetworkNode.analysis_id == analysis_id).all()
+        connections = db.query(NetworkConnection).filter(NetworkConnection.analysis_id == analysis_id).all()
+        node_ids = {node.id: node.node_id for node in nodes}
         return NetworkTopologyResponse(
-            nodes=network_nodes,
-            connections=network_connections
+            nodes=[NetworkNodeResponse.model_validate(node) for node in nodes],
+            connections=[
+                NetworkConnectionResponse(
+                    source=node_ids[conn.source_id],
+                    target=node_ids[conn.target_id],
+                    type=conn.connection_type.value if conn.connection_type else conn.protocol.lower(),
+                    status=conn.status.value if conn.status else NodeStatus.ACTIVE.value,
+                    protocol=conn.protocol,
+                    port=conn.port,
+                    bytes_transferred=conn.bytes_transferred,
+                    packets_transferred=conn.packets_transferred,
+                    flow_count=conn.flow_count
+                )
+                for conn in connections
+            ]
         )
 
-    async def stream_network_data(self, websocket: WebSocket, analysis_id: int):
-        """Stream real-time network data updates."""
+    async def _get_network_metrics(self, analysis_id: int, db: Session) -> Optional[NetworkMetrics]:
+        """
+        Latest metrics of an analysis, as recorded by its task: live while
+        a capture is followed, final once completed. None if there are none.
+        """
+        metrics = await self._latest_metrics(analysis_id, db)
+        return NetworkMetrics(**metrics) if metrics is not None else None
+
+    async def _latest_metrics(self, analysis_id: int, db: Session) -> Optional[Dict]:
+        def load() -> Optional[Dict]:
+            result_json = db.query(NetworkAnalysis.result_json).filter(NetworkAnalysis.id == analysis_id).scalar()
+            return json.loads(result_json).get("metrics") if result_json else None
+
+        return await self.metrics.get(analysis_id, load)
+
+    async def stream_network_data(self, websocket: WebSocket, analysis_id: int, db: Session):
+        """
+        Stream real-time network data updates.
+
+        Every socket watching an analysis shares one feed: updates
+        published by the analysis tasks are received and diffed once and
+        each socket is sent only the changed fields. A socket that cannot
+        keep up is sent the latest snapshot instead of every update. A feed
+        starts from the stored metrics, so the first message of every
+        socket is a snapshot even before the analysis publishes again.
+        """
         await websocket.accept()
-        self.active_connections[analysis_id] = websocket
-        
+        metrics = await self._latest_metrics(analysis_id, db)
+        async with self.feeds.subscribe(analysis_id, {"metrics": metrics} if metrics else None) as subscriber:
+            closed = asyncio.create_task(self._wait_closed(websocket))
+            try:
+                while True:
+                    update = asyncio.create_task(subscriber.next())
+                    done, _ = await asyncio.wait({update, closed}, return_when=asyncio.FIRST_COMPLETED)
+                    if update not in done:
+                        update.cancel()
+                        break
+                    await websocket.send_text(update.result())
+
+            except Exception as e:
+                logger.error(f"WebSocket error: {str(e)}")
+            finally:
+                closed.cancel()
+
+    @staticmethod
+    async def _wait_closed(websocket: WebSocket) -> None:
+        # Clients send nothing; reading only notices them leaving
         try:
             while True:
-                # Get updated metrics
-                metrics = await self._get_network_metrics(analysis_id)
-                
-                # Send updates to client
-                await websocket.send_json(metrics.dict())
-                
-                # Wait before next update
-                await asyncio.sleep(1)
-                
-        except Exception as e:
-            logger.error(f"WebSocket error: {str(e)}")
-        finally:
-            del self.active_connections[analysis_id] 
\ No newline at end of file
+                await websocket.receive_text()
+        except Exception:
+            return
@@ -0,0 +1,355 @@
+import os
+import json
+import shutil
+import struct
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from services.pcap_reader import pack_ip, format_ips
+
+logger = logging.getLogger(__name__)
+
+# Store layout (one file per analysis):
+#   magic | column 0 | column 1 | ... | footer json | footer length | magic
+# Every column is a contiguous little-endian array aligned to ALIGNMENT so
+# the reader can memory-map it in place. String columns are stored as
+# uint32 codes into a dictionary kept in the footer; code 0 means "N/A".
+MAGIC = b"MFPK"
+VERSION = 1
+ALIGNMENT = 64
+TRAILER = struct.Struct("<Q4s")  # footer_length, magic
+
+PACKET_STORE_FILENAME = "packets.mfpk"
+
+COLUMNS = {
+    "timestamp": np.dtype("<f8"),
+    "src_ip": np.dtype("S16"),
+    "dst_ip": np.dtype("S16"),
+    "src_port": np.dtype("<u2"),
+    "dst_port": np.dtype("<u2"),
+    "protocol": np.dtype("u1"),
+    "ip_version": np.dtype("u1"),
+    "tcp_flags": np.dtype("u1"),
+    "length": np.dtype("<u4"),
+    "offset": np.dtype("<u8"),  # Record offset in the capture, for raw packet access
+}
+
+# Store column -> PACKET_DTYPE field
+PACKET_FIELDS = {name: name for name in COLUMNS}
+PACKET_FIELDS["timestamp"] = "ts"
+
+STRING_COLUMNS = ("http_method", "dns_query")
+CODE_DTYPE = np.dtype("<u4")
+
+IP_COLUMNS = ("src_ip", "dst_ip")
+PORT_COLUMNS = ("src_port", "dst_port")
+QUERY_CHUNK = 1 << 20
+
+class PacketStoreError(Exception):
+    """Raised when a packet store is missing or malformed."""
+    pass
+
+class StringDictionary:
+    """Assign stable uint32 codes to strings; code 0 is reserved for missing values."""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values = values or ["N/A"]
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, values: Sequence[Optional[str]]) -> np.ndarray:
+        codes = np.empty(len(values), dtype=CODE_DTYPE)
+        lookup = self._codes
+        for i, value in enumerate(values):
+            if not value or value == "N/A":
+                codes[i] = 0
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+    def code(self, value: str) -> Optional[int]:
+        return self._codes.get(value)
+
+class PacketStoreWriter:
+    """
+    Append packet batches column by column.
+
+    Each column is spilled to its own temporary file while batches arrive,
+    so memory stays bounded by the batch size; close() stitches the columns
+    into the final store and writes the footer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._dictionaries = {name: StringDictionary() for name in STRING_COLUMNS}
+        self._spill_paths = {
+            name: f"{path}.{name}.tmp" for name in list(COLUMNS) + list(STRING_COLUMNS)
+        }
+        self._spills = {name: open(spill, "wb") for name, spill in self._spill_paths.items()}
+        self.closed = False
+
+    def add_batch(self, packets: np.ndarray, strings: Optional[Dict[str, Sequence[str]]] = None) -> None:
+        """
+        Append a decoded PACKET_DTYPE batch.
+
+        Args:
+            packets: Packet header fields
+            strings: Optional per-packet values for STRING_COLUMNS
+        """
+        if not packets.size:
+            return
+        for name, dtype in COLUMNS.items():
+            self._spills[name].write(np.ascontiguousarray(packets[PACKET_FIELDS[name]], dtype=dtype).tobytes())
+        for name in STRING_COLUMNS:
+            values = (strings or {}).get(name)
+            if values is None:
+                codes = np.zeros(packets.size, dtype=CODE_DTYPE)
+            else:
+                codes = self._dictionaries[name].encode(values)
+            self._spills[name].write(codes.tobytes())
+        self.rows += int(packets.size)
+
+    def add_store(self, store: "PacketStore") -> None:
+        """Append all rows of another store, re-encoding its string columns."""
+        remap = {
+            name: self._dictionaries[name].encode(store._dictionaries[name].values)
+            for name in STRING_COLUMNS
+        }
+        for start in range(0, store.rows, QUERY_CHUNK):
+            stop = min(start + QUERY_CHUNK, store.rows)
+            for name, dtype in COLUMNS.items():
+                self._spills[name].write(np.ascontiguousarray(store.column(name)[start:stop], dtype=dtype).tobytes())
+            for name in STRING_COLUMNS:
+                self._spills[name].write(remap[name][store.column(name)[start:stop]].tobytes())
+        self.rows += store.rows
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for spill in self._spills.values():
+            spill.close()
+
+        footer = {
+            "version": VERSION,
+            "rows": self.rows,
+            "columns": {},
+            "dictionaries": {name: d.values for name, d in self._dictionaries.items()}
+        }
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "wb") as out:
+                out.write(MAGIC)
+                for name, spill_path in self._spill_paths.items():
+                    out.write(b"\0" * (-out.tell() % ALIGNMENT))
+                    dtype = COLUMNS.get(name, CODE_DTYPE)
+                    footer["columns"][name] = {"dtype": dtype.str, "offset": out.tell()}
+                    with open(spill_path, "rb") as spill:
+                        shutil.copyfileobj(spill, out, length=1024 * 1024)
+                encoded = json.dumps(footer).encode("utf-8")
+                out.write(encoded)
+                out.write(TRAILER.pack(len(encoded), MAGIC))
+            os.replace(temp_path, self.path)
+        finally:
+            self._remove_spills()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        logger.info(f"Wrote packet store {self.path} with {self.rows} packets")
+
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        if not self.closed:
+            self.closed = True
+            for spill in self._spills.values():
+                spill.close()
+            self._remove_spills()
+
+    def _remove_spills(self) -> None:
+        for spill_path in self._spill_paths.values():
+            try:
+                os.remove(spill_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class PacketStore:
+    """
+    Read-only view of a packet store.
+
+    Columns are memory-mapped on first access, so opening a store and
+    answering a query only touches the columns and rows that are needed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(path):
+            raise PacketStoreError(f"Packet store not found: {path}")
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise PacketStoreError(f"Not a packet store: {path}")
+            f.seek(-TRAILER.size, os.SEEK_END)
+            footer_length, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC:
+                raise PacketStoreError(f"Packet store footer is corrupt: {path}")
+            f.seek(-TRAILER.size - footer_length, os.SEEK_END)
+            footer = json.loads(f.read(footer_length))
+        if footer.get("version") != VERSION:
+            raise PacketStoreError(f"Unsupported packet store version: {footer.get('version')}")
+        self.rows = footer["rows"]
+        self._layout = footer["columns"]
+        self._dictionaries = {
+            name: StringDictionary(values) for name, values in footer["dictionaries"].items()
+        }
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._layout)
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a column as a memory-mapped array (codes for string columns)."""
+        array = self._columns.get(name)
+        if array is None:
+            layout = self._layout.get(name)
+            if layout is None:
+                raise KeyError(f"Unknown column: {name}")
+            if self.rows:
+                array = np.memmap(self.path, dtype=np.dtype(layout["dtype"]), mode="r",
+                                  offset=layout["offset"], shape=(self.rows,))
+            else:
+                array = np.zeros(0, dtype=np.dtype(layout["dtype"]))
+            self._columns[name] = array
+        return array
+
+    def select(self, filters: Optional[Dict] = None) -> np.ndarray:
+        """
+        Return indices of rows matching all filters.
+
+        Supported filters: ip and port (either endpoint), src_ip, dst_ip,
+        src_port, dst_port, protocol, http_method, dns_query and a
+        start/end timestamp range.
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        if not filters:
+            return np.arange(self.rows)
+
+        # Translate filter values into column-typed predicates once
+        predicates = []
+        for name, value in filters.items():
+            if name == "ip":
+                packed = pack_ip(value)
+                predicates.append((IP_COLUMNS, "eq", packed))
+            elif name == "port":
+                predicates.append((PORT_COLUMNS, "eq", int(value)))
+            elif name in IP_COLUMNS:
+                predicates.append(((name,), "eq", pack_ip(value)))
+            elif name in STRING_COLUMNS:
+                code = self._dictionaries[name].code(value)
+                if code is None:
+                    return np.zeros(0, dtype=np.int64)
+                predicates.append(((name,), "eq", code))
+            elif name == "start":
+                predicates.append((("timestamp",), "ge", float(value)))
+            elif name == "end":
+                predicates.append((("timestamp",), "le", float(value)))
+            elif name in COLUMNS:
+                predicates.append(((name,), "eq", value))
+            else:
+                raise ValueError(f"Unsupported filter: {name}")
+
+        matches = []
+        for start in range(0, self.rows, QUERY_CHUNK):
+            stop = min(start + QUERY_CHUNK, self.rows)
+            mask = np.ones(stop - start, dtype=bool)
+            for names, op, value in predicates:
+                hit = np.zeros(stop - start, dtype=bool)
+                for name in names:
+                    chunk = self.column(name)[start:stop]
+                    if op == "eq":
+                        hit |= chunk == value
+                    elif op == "ge":
+                        hit |= chunk >= value
+                    else:
+                        hit |= chunk <= value
+                mask &= hit
+            matches.append(np.flatnonzero(mask) + start)
+        return np.concatenate(matches) if matches else np.zeros(0, dtype=np.int64)
+
+    def query(
+        self,
+        columns: Optional[List[str]] = None,
+        filters: Optional[Dict] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        offset: int = 0,
+        limit: int = 100
+    ) -> Dict:
+        """
+        Run a filtered, sorted and paginated query.
+
+        Returns:
+            Dictionary with the total number of matches and the requested
+            page of rows restricted to the projected columns
+        """
+        columns = columns or self.columns
+        unknown = [name for name in columns if name not in self._layout]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        if sort_by is None and not any(value is not None for value in (filters or {}).values()):
+            # Plain pagination reads only the rows of the page
+            page = np.arange(min(offset, self.rows), min(offset + limit, self.rows))
+            return {"total": self.rows, "items": self.rows_at(page, columns)}
+
+        indices = self.select(filters)
+        total = int(indices.size)
+        if sort_by is not None:
+            if sort_by not in self._layout or sort_by in STRING_COLUMNS:
+                raise ValueError(f"Cannot sort by {sort_by}")
+            order = np.argsort(self.column(sort_by)[indices], kind="stable")
+            if descending:
+                order = order[::-1]
+            indices = indices[order]
+        page = indices[offset:offset + limit]
+        return {"total": total, "items": self.rows_at(page, columns)}
+
+    def rows_at(self, indices: np.ndarray, columns: Optional[List[str]] = None) -> List[Dict]:
+        """Materialize rows at the given indices as dicts of plain values."""
+        columns = columns or self.columns
+        is_ip = self.column("ip_version")[indices] != 0
+        values = {}
+        for name in columns:
+            data = self.column(name)[indices]
+            if name in IP_COLUMNS:
+                formatted = format_ips(data)
+                values[name] = [ip if ok else None for ip, ok in zip(formatted, is_ip.tolist())]
+            elif name in STRING_COLUMNS:
+                lookup = self._dictionaries[name].values
+                values[name] = [lookup[code] if code else None for code in data.tolist()]
+            else:
+                values[name] = data.tolist()
+        return [dict(zip(columns, row)) for row in zip(*(values[name] for name in columns))]
+
+    def close(self) -> None:
+        self._columns.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def packet_store_path(analysis_dir: str) -> str:
+    return os.path.join(analysis_dir, PACKET_STORE_FILENAME)
@@ -0,0 +1,181 @@
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import Session
+from core.config import settings
+from models.passive_dns import PassiveDnsRecord
+from services.pcap_reader import format_ip, format_ips, pack_ip
+from services.topology_builder import TopologyEdges
+
+logger = logging.getLogger(__name__)
+
+# Hostnames come from the capture itself: DNS answers name the addresses
+# they resolve to for their TTL, TLS SNI and HTTP Host name the server a
+# request went to at that moment. Sources are listed most trusted first.
+HOSTNAME_SOURCES = ("dns", "tls_sni", "http_host")
+HOSTNAME_LIMIT = 5            # Names kept per node in its metadata
+HOSTNAME_INSERT_BATCH = 10_000
+HOSTNAME_LOOKUP_BATCH = 1000  # Addresses per cross-analysis query
+
+def _is_address(name: str) -> bool:
+    try:
+        pack_ip(name)
+    except (OSError, ValueError):
+        return False
+    return True
+
+def _rank(ranks: Dict[str, Tuple[int, int]], hostname: str, source: str, count: int) -> None:
+    # A name ranks by its most trusted source, then by how often it was seen
+    rank = (HOSTNAME_SOURCES.index(source), -count)
+    ranks[hostname] = min(ranks.get(hostname, rank), rank)
+
+def _ranked(ranks: Dict[str, Tuple[int, int]]) -> List[str]:
+    return sorted(ranks, key=lambda hostname: (ranks[hostname], hostname))
+
+class HostnameIndex:
+    """
+    Hostnames seen for addresses in a capture, aggregated per address,
+    name and source with an observation count and a validity window.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        # (packed address, hostname, source) -> [observations, first_seen, valid_until]
+        self._entries: Dict[Tuple[bytes, str, str], List] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add_batch(self, packets: np.ndarray, found: Dict[str, List]) -> None:
+        """Record the names in a batch's extracted artifacts (see extract_payload_artifacts)."""
+        ts = packets["ts"]
+        for i, answers in enumerate(found.get("dns_answers") or ()):
+            if answers:
+                seen = float(ts[i])
+                for address, name, ttl in answers:
+                    # Packed addresses compare as numpy's S16 values do
+                    self._add((address.rstrip(b"\x00"), name, "dns"), 1, seen, seen + ttl)
+        for source in ("tls_sni", "http_host"):
+            values = found.get(source) or ()
+            hits = [i for i, value in enumerate(values) if value and not _is_address(value)]
+            if not hits:
+                continue
+            for i, address, seen in zip(hits, packets["dst_ip"][hits].tolist(), ts[hits].tolist()):
+                self._add((address, values[i], source), 1, seen, seen)
+
+    def _add(self, key: Tuple[bytes, str, str], count: int, first_seen: float, valid_until: float) -> None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [count, first_seen, valid_until]
+            return
+        entry[0] += count
+        entry[1] = min(entry[1], first_seen)
+        entry[2] = max(entry[2], valid_until)
+
+    def merge(self, other: "HostnameIndex") -> None:
+        """Add the observations of another capture shard."""
+        for key, (count, first_seen, valid_until) in other._entries.items():
+            self._add(key, count, first_seen, valid_until)
+
+    def names(self) -> Dict[bytes, List[str]]:
+        """Names of every address, best first."""
+        found: Dict[bytes, Dict[str, Tuple[int, int]]] = {}
+        for (address, hostname, source), (count, _, _) in self._entries.items():
+            _rank(found.setdefault(address, {}), hostname, source, count)
+        return {address: _ranked(ranks) for address, ranks in found.items()}
+
+    def rows(self, analysis_id: int) -> List[Dict]:
+        """PassiveDnsRecord column dicts for all entries."""
+        return [
+            {
+                "analysis_id": analysis_id,
+                "address": format_ip(address),
+                "hostname": hostname,
+                "source": source,
+                "observations": count,
+                "first_seen": first_seen,
+                "valid_until": valid_until
+            }
+            for (address, hostname, source), (count, first_seen, valid_until) in self._entries.items()
+        ]
+
+def persist_hostnames(db: Session, analysis_id: int, index: HostnameIndex) -> int:
+    """Replace the hostname observations of an analysis. Returns the number of rows written."""
+    db.execute(delete(PassiveDnsRecord).where(PassiveDnsRecord.analysis_id == analysis_id))
+    rows = index.rows(analysis_id)
+    for start in range(0, len(rows), HOSTNAME_INSERT_BATCH):
+        db.execute(insert(PassiveDnsRecord), rows[start:start + HOSTNAME_INSERT_BATCH])
+    db.commit()
+    logger.info(f"Stored {len(rows)} hostname observations for analysis {analysis_id}")
+    return len(rows)
+
+def lookup_hostnames(
+    db: Session,
+    addresses: List[str],
+    start: float,
+    end: float,
+    exclude_analysis: Optional[int] = None
+) -> Dict[str, List[str]]:
+    """
+    Names recorded for addresses by analyses whose observation windows,
+    widened by PASSIVE_DNS_VALIDITY, overlap [start, end]; best first.
+
+    Addresses are looked up in chunks with one grouped query each.
+    """
+    slack = settings.PASSIVE_DNS_VALIDITY
+    found: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    for offset in range(0, len(addresses), HOSTNAME_LOOKUP_BATCH):
+        query = db.query(
+            PassiveDnsRecord.address, PassiveDnsRecord.hostname, PassiveDnsRecord.source,
+            func.sum(PassiveDnsRecord.observations)
+        ).filter(
+            PassiveDnsRecord.address.in_(addresses[offset:offset + HOSTNAME_LOOKUP_BATCH]),
+            PassiveDnsRecord.first_seen <= end + slack,
+            PassiveDnsRecord.valid_until >= start - slack
+        )
+        if exclude_analysis is not None:
+            query = query.filter(PassiveDnsRecord.analysis_id != exclude_analysis)
+        rows = query.group_by(PassiveDnsRecord.address, PassiveDnsRecord.hostname, PassiveDnsRecord.source)
+        for address, hostname, source, count in rows:
+            if source in HOSTNAME_SOURCES:
+                _rank(found.setdefault(address, {}), hostname, source, int(count or 0))
+    return {address: _ranked(ranks) for address, ranks in found.items()}
+
+def label_topology(
+    db: Session,
+    analysis_id: int,
+    topology: TopologyEdges,
+    index: HostnameIndex,
+    metadata: Dict[bytes, Dict]
+) -> Dict[bytes, str]:
+    """
+    Store a capture's hostname observations and name its topology nodes.
+
+    Names seen in the capture win; nodes without one are looked up in the
+    observations of other analyses around the capture's time span. Each
+    named node gets its names under "hostnames" in metadata (updated in
+    place).
+
+    Returns:
+        Best name per packed address, the labels for persist_topology
+    """
+    persist_hostnames(db, analysis_id, index)
+    names = index.names()
+    addresses = topology.addresses.tolist()
+    missing = {ip: address for address, ip in zip(addresses, format_ips(topology.addresses)) if address not in names}
+    if missing and topology.edges.size:
+        start, end = float(topology.edges["first_seen"].min()), float(topology.edges["last_seen"].max())
+        for ip, found in lookup_hostnames(db, list(missing), start, end, exclude_analysis=analysis_id).items():
+            names[missing[ip]] = found
+
+    labels = {}
+    for address in addresses:
+        found = names.get(address)
+        if found:
+            metadata[address] = {**(metadata.get(address) or {}), "hostnames": found[:HOSTNAME_LIMIT]}
+            labels[address] = found[0]
+    logger.info(f"Named {len(labels)} of {len(addresses)} nodes of analysis {analysis_id}")
+    return labels
@@ -0,0 +1,100 @@
+import logging
+import numpy as np
+from typing import Dict, Iterator, Optional
+from services.pcap_reader import PcapReader, pack_ip
+from services.capture_index import CaptureIndex
+
+logger = logging.getLogger(__name__)
+
+# Selected records are copied verbatim from the source capture. Runs of
+# adjacent records are read as one slice and handed out in chunks of
+# about EXPORT_CHUNK bytes, so memory stays bounded by one batch.
+EXPORT_CHUNK = 1024 * 1024
+
+MEDIA_TYPES = {
+    "pcap": "application/vnd.tcpdump.pcap",
+    "pcapng": "application/x-pcapng"
+}
+
+def packet_filter_mask(packets: np.ndarray, filters: Dict) -> np.ndarray:
+    """
+    Match decoded packets against export filters.
+
+    Supported filters: ip and port (either endpoint), protocol, and flow,
+    a (src_ip, dst_ip, src_port, dst_port, protocol) tuple matched in
+    both directions.
+    """
+    mask = np.ones(packets.size, dtype=bool)
+    ip = filters.get("ip")
+    if ip is not None:
+        packed = pack_ip(ip)
+        mask &= (packets["src_ip"] == packed) | (packets["dst_ip"] == packed)
+    port = filters.get("port")
+    if port is not None:
+        mask &= (packets["src_port"] == port) | (packets["dst_port"] == port)
+    protocol = filters.get("protocol")
+    if protocol is not None:
+        mask &= packets["protocol"] == protocol
+    flow = filters.get("flow")
+    if flow is not None:
+        src, dst = pack_ip(flow[0]), pack_ip(flow[1])
+        sport, dport, proto = flow[2], flow[3], flow[4]
+        forward = (packets["src_ip"] == src) & (packets["dst_ip"] == dst) & \
+            (packets["src_port"] == sport) & (packets["dst_port"] == dport)
+        backward = (packets["src_ip"] == dst) & (packets["dst_ip"] == src) & \
+            (packets["src_port"] == dport) & (packets["dst_port"] == sport)
+        mask &= (forward | backward) & (packets["protocol"] == proto)
+    return mask
+
+def _record_runs(packets: np.ndarray):
+    """Yield (offset, length) of runs of records that are adjacent in the file."""
+    if not packets.size:
+        return
+    offsets = packets["offset"].astype(np.int64)
+    ends = offsets + packets["record_len"]
+    breaks = np.flatnonzero(offsets[1:] != ends[:-1]) + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [packets.size]]) - 1
+    yield from zip(offsets[starts].tolist(), (ends[stops] - offsets[starts]).tolist())
+
+def iter_capture_slice(
+    pcap_file: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    filters: Optional[Dict] = None,
+    index: Optional[CaptureIndex] = None
+) -> Iterator[bytes]:
+    """
+    Stream a capture containing the packets of pcap_file within [start, end]
+    that match filters, in the source format.
+
+    With a capture index only the blocks overlapping the window are read;
+    without one the whole capture is scanned. pcapng output carries the
+    first section's header and interfaces, as the reader assumes.
+    """
+    filters = filters or {}
+    start = float("-inf") if start is None else start
+    end = float("inf") if end is None else end
+    with PcapReader(pcap_file) as reader:
+        yield reader.header_bytes()
+        if index is not None:
+            batches = (packets for _, packets in index.iter_time_range(reader, start, end))
+        else:
+            batches = reader.iter_batches()
+
+        pending = []
+        pending_size = 0
+        exported = 0
+        for packets in batches:
+            keep = (packets["ts"] >= start) & (packets["ts"] <= end) & packet_filter_mask(packets, filters)
+            selected = packets[keep]
+            exported += int(selected.size)
+            for offset, length in _record_runs(selected):
+                pending.append(bytes(reader.record_bytes(offset, length)))
+                pending_size += length
+                if pending_size >= EXPORT_CHUNK:
+                    yield b"".join(pending)
+                    pending, pending_size = [], 0
+        if pending:
+            yield b"".join(pending)
+    logger.info(f"Exported {exported} packets from {pcap_file}")
@@ -0,0 +1,642 @@
+import os
+import mmap
+import socket
+import struct
+import logging
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
+from core.config import settings
+from utils.seekable_compression import SeekableCompressedReader, is_compressed_evidence
+
+logger = logging.getLogger(__name__)
+
+# Decoded packet header row. Addresses are 16-byte big-endian values with
+# IPv4 stored IPv4-mapped (::ffff:a.b.c.d), so both families sort and compare
+# the same way. Offsets point back into the capture for zero-copy access.
+PACKET_DTYPE = np.dtype([
+    ("ts", "<f8"),              # Seconds since epoch
+    ("src_ip", "S16"),
+    ("dst_ip", "S16"),
+    ("src_port", "<u2"),        # 0 when not TCP/UDP
+    ("dst_port", "<u2"),
+    ("protocol", "u1"),         # IP protocol number, 0 when not IP
+    ("ip_version", "u1"),       # 4, 6 or 0
+    ("tcp_flags", "u1"),
+    ("length", "<u4"),          # Original length on the wire
+    ("caplen", "<u4"),          # Captured length
+    ("offset", "<u8"),          # Byte offset of the record in the capture
+    ("record_len", "<u4"),      # Total record length including headers
+    ("data_offset", "<u2"),     # Offset of frame data within the record
+    ("payload_offset", "<u2"),  # Offset of L4 payload within the frame, 0 if none
+])
+
+IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAP_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+BLOCK_IDB = 1
+BLOCK_PB = 2
+BLOCK_SPB = 3
+BLOCK_EPB = 6
+PCAPNG_BLOCK_TYPES = (PCAPNG_SHB, BLOCK_IDB, BLOCK_PB, BLOCK_SPB, 4, 5, BLOCK_EPB, 0x0A, 0xBAD, 0x40000BAD)
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW_ALT = 12
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+SUPPORTED_LINKTYPES = {
+    LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW_ALT, LINKTYPE_RAW, LINKTYPE_LOOP,
+    LINKTYPE_LINUX_SLL, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL2
+}
+
+MAX_RECORD_LEN = 64 * 1024 * 1024
+SCAN_WINDOW = 16 * 1024 * 1024
+
+# Shard boundaries are found by resynchronizing on record headers: a
+# candidate offset is accepted only if RESYNC_CHAIN consecutive records
+# starting there are plausible (or the chain runs exactly to end of file).
+RESYNC_WINDOW = 1024 * 1024
+RESYNC_CHAIN = 16
+RESYNC_MAX_TS_SPREAD = 86400  # seconds between timestamps of one pcap chain,
+                              # and before the first record of the capture
+
+PROTOCOL_NAMES = {1: "ICMP", 6: "TCP", 17: "UDP", 58: "ICMPv6", 47: "GRE", 50: "ESP", 132: "SCTP"}
+
+class CaptureFormatError(Exception):
+    """Raised when a capture cannot be decoded by the native reader."""
+    pass
+
+def pack_ip(ip: str) -> bytes:
+    """Convert an IPv4/IPv6 string to the 16-byte form used in packet arrays."""
+    if ":" in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return IPV4_MAPPED_PREFIX + socket.inet_pton(socket.AF_INET, ip)
+
+def format_ip(packed: bytes) -> str:
+    """Convert a 16-byte packed address back to its string form."""
+    packed = packed.ljust(16, b"\x00")
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return socket.inet_ntop(socket.AF_INET, packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+def format_ips(packed: np.ndarray) -> List[str]:
+    """Format an array of packed addresses."""
+    return [format_ip(ip) for ip in packed.tolist()]
+
+def format_ip_column(packed: np.ndarray) -> np.ndarray:
+    """Format a column of packed addresses, converting each distinct address once."""
+    unique, inverse = np.unique(packed, return_inverse=True)
+    return np.array(format_ips(unique), dtype=object)[inverse.ravel()]
+
+def _gather(arr: np.ndarray, pos: np.ndarray, width: int) -> np.ndarray:
+    idx = pos[:, None] + np.arange(width, dtype=np.int64)
+    np.clip(idx, 0, arr.size - 1, out=idx)
+    return arr[idx]
+
+def _u8(arr: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    return arr[np.clip(pos, 0, arr.size - 1)]
+
+def _be16(arr: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    g = _gather(arr, pos, 2).astype(np.uint16)
+    return (g[:, 0] << 8) | g[:, 1]
+
+def _uint(arr: np.ndarray, pos: np.ndarray, width: int, byteorder: str) -> np.ndarray:
+    g = np.ascontiguousarray(_gather(arr, pos, width))
+    return g.view(f"{byteorder}u{width}").ravel()
+
+def _network_offset(arr: np.ndarray, data: np.ndarray, caplen: np.ndarray, linktype: int) -> np.ndarray:
+    """Offset of the IP header within each frame, -1 where the frame is not IP."""
+    n = data.size
+    l3 = np.full(n, -1, dtype=np.int64)
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype = _be16(arr, data + 12)
+        offset = np.full(n, 14, dtype=np.int64)
+        for _ in range(2):  # 802.1Q / 802.1ad tags
+            tagged = (ethertype == 0x8100) | (ethertype == 0x88A8)
+            if not tagged.any():
+                break
+            ethertype = np.where(tagged, _be16(arr, data + offset + 2), ethertype)
+            offset = np.where(tagged, offset + 4, offset)
+        is_ip = (ethertype == 0x0800) | (ethertype == 0x86DD)
+        l3[is_ip] = offset[is_ip]
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ethertype = _be16(arr, data + 14)
+        l3[(ethertype == 0x0800) | (ethertype == 0x86DD)] = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        ethertype = _be16(arr, data)
+        l3[(ethertype == 0x0800) | (ethertype == 0x86DD)] = 20
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        l3[:] = 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_RAW_ALT, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        l3[:] = 0
+    else:
+        raise CaptureFormatError(f"Unsupported link type: {linktype}")
+    l3[caplen < l3 + 20] = -1
+    return l3
+
+def decode_frames(
+    arr: np.ndarray,
+    data: np.ndarray,
+    caplen: np.ndarray,
+    linktype: int,
+    out: np.ndarray
+) -> None:
+    """
+    Decode link, network and transport headers of many frames at once.
+
+    Args:
+        arr: Buffer holding the frames as uint8
+        data: Position of each frame's first byte in arr
+        caplen: Captured length of each frame
+        linktype: Link-layer header type shared by the frames
+        out: PACKET_DTYPE rows to fill (address, port, protocol and flag fields)
+    """
+    n = data.size
+    l3 = _network_offset(arr, data, caplen, linktype)
+    pos = data + np.maximum(l3, 0)
+    first = _u8(arr, pos)
+    version = np.where(l3 >= 0, first >> 4, 0)
+    v4 = (version == 4) & (caplen >= l3 + 20)
+    v6 = (version == 6) & (caplen >= l3 + 40)
+
+    protocol = np.zeros(n, dtype=np.uint8)
+    l4 = np.full(n, -1, dtype=np.int64)
+    src = np.zeros((n, 16), dtype=np.uint8)
+    dst = np.zeros((n, 16), dtype=np.uint8)
+
+    if v4.any():
+        p4 = pos[v4]
+        src[v4, 10:12] = 0xFF
+        dst[v4, 10:12] = 0xFF
+        src[v4, 12:] = _gather(arr, p4 + 12, 4)
+        dst[v4, 12:] = _gather(arr, p4 + 16, 4)
+        protocol[v4] = _u8(arr, p4 + 9)
+        # Non-first fragments carry no transport header
+        unfragmented = (_be16(arr, p4 + 6) & 0x1FFF) == 0
+        ihl = (first[v4] & 0x0F).astype(np.int64) * 4
+        idx = np.flatnonzero(v4)[unfragmented]
+        l4[idx] = l3[idx] + ihl[unfragmented]
+
+    if v6.any():
+        idx = np.flatnonzero(v6)
+        p6 = pos[idx]
+        src[idx] = _gather(arr, p6 + 8, 16)
+        dst[idx] = _gather(arr, p6 + 24, 16)
+        nxt = _u8(arr, p6 + 6)
+        offset = l3[idx] + 40
+        for _ in range(4):  # hop-by-hop, routing, fragment and destination options
+            ext = np.isin(nxt, (0, 43, 44, 60))
+            if not ext.any():
+                break
+            hdr = data[idx] + offset
+            ext_len = np.where(nxt == 44, 8, (_u8(arr, hdr + 1).astype(np.int64) + 1) * 8)
+            nxt = np.where(ext, _u8(arr, hdr), nxt)
+            offset = np.where(ext, offset + ext_len, offset)
+        protocol[idx] = nxt
+        l4[idx] = offset
+
+    l4_pos = data + np.maximum(l4, 0)
+    tcp = (protocol == 6) & (l4 >= 0) & (caplen >= l4 + 20)
+    udp = (protocol == 17) & (l4 >= 0) & (caplen >= l4 + 8)
+    ports = tcp | udp
+
+    out["src_ip"] = np.ascontiguousarray(src).view("S16").ravel()
+    out["dst_ip"] = np.ascontiguousarray(dst).view("S16").ravel()
+    out["protocol"] = protocol
+    out["ip_version"] = np.where(v4, 4, np.where(v6, 6, 0))
+    out["src_port"] = 0
+    out["dst_port"] = 0
+    out["tcp_flags"] = 0
+    out["payload_offset"] = 0
+    if ports.any():
+        out["src_port"][ports] = _be16(arr, l4_pos[ports])
+        out["dst_port"][ports] = _be16(arr, l4_pos[ports] + 2)
+    if tcp.any():
+        out["tcp_flags"][tcp] = _u8(arr, l4_pos[tcp] + 13)
+        data_off = (_u8(arr, l4_pos[tcp] + 12) >> 4).astype(np.int64) * 4
+        out["payload_offset"][tcp] = np.minimum(l4[tcp] + data_off, 0xFFFF)
+    if udp.any():
+        out["payload_offset"][udp] = np.minimum(l4[udp] + 8, 0xFFFF)
+
+class PcapReader:
+    """
+    Native pcap/pcapng reader.
+
+    The capture is memory-mapped (or read through the seekable compressed
+    container) and walked record by record to find boundaries; headers of
+    each batch are then decoded in bulk into PACKET_DTYPE arrays.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = None
+        self._compressed = None
+        self.position = 0        # Offset after the last record read by iter_batches
+        self.sections_seen = 0   # pcapng section headers met by iter_batches
+        if is_compressed_evidence(path):
+            self._compressed = SeekableCompressedReader(path)
+            self.size = self._compressed.size
+        else:
+            self.size = os.path.getsize(path)
+            if self.size == 0:
+                raise CaptureFormatError(f"Empty capture: {path}")
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self, offset: int, length: int):
+        if self._mm is not None:
+            return memoryview(self._mm)[offset:offset + length]
+        return self._compressed.pread(offset, length)
+
+    def _read_header(self) -> None:
+        head = bytes(self._read(0, 28))
+        if head[:4] in PCAP_MAGIC:
+            self.format = "pcap"
+            self.byteorder, self.ts_resolution = PCAP_MAGIC[head[:4]]
+            if len(head) < PCAP_HEADER_LEN:
+                raise CaptureFormatError(f"Truncated pcap header: {self.path}")
+            self.snaplen, self.linktype = struct.unpack_from(f"{self.byteorder}II", head, 16)
+            self.linktype &= 0xFFFF
+            if self.linktype not in SUPPORTED_LINKTYPES:
+                raise CaptureFormatError(f"Unsupported link type: {self.linktype}")
+            self.data_start = PCAP_HEADER_LEN
+        elif len(head) >= 12 and struct.unpack_from("<I", head)[0] == PCAPNG_SHB:
+            self.format = "pcapng"
+            self.data_start = 0
+            # Interfaces of the current section: (linktype, ts_resolution, ts_offset, snaplen)
+            self.interfaces: List[Tuple[int, float, float, int]] = []
+            self.byteorder = "<"
+        else:
+            raise CaptureFormatError(f"Not a pcap or pcapng file: {self.path}")
+
+    def header_bytes(self) -> bytes:
+        """Return the file header that must precede copied records."""
+        if self.format == "pcap":
+            return bytes(self._read(0, PCAP_HEADER_LEN))
+        return b"".join(self._pcapng_preamble())
+
+    def _pcapng_preamble(self) -> Iterator[bytes]:
+        # Section header and interface descriptions appear before the first packet
+        pos = 0
+        byteorder = "<"
+        while pos + 12 <= self.size:
+            head = bytes(self._read(pos, 12))
+            block_type = struct.unpack_from("<I", head)[0]
+            if block_type == PCAPNG_SHB:
+                byteorder = "<" if struct.unpack_from("<I", head, 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            else:
+                block_type = struct.unpack_from(f"{byteorder}I", head)[0]
+            block_len = struct.unpack_from(f"{byteorder}I", head, 4)[0]
+            if block_type not in (PCAPNG_SHB, BLOCK_IDB):
+                break
+            yield bytes(self._read(pos, block_len))
+            pos += block_len
+
+    def record_bytes(self, offset: int, length: int):
+        """Return the raw bytes of a record without copying when memory-mapped."""
+        return self._read(offset, length)
+
+    def payload_prefixes(self, packets: np.ndarray, width: int) -> np.ndarray:
+        """
+        Return the first width bytes of each packet's L4 payload as an
+        (n, width) uint8 array, zero-padded past the captured data.
+        """
+        start = (packets["offset"].astype(np.int64) + packets["data_offset"]
+                 + packets["payload_offset"])
+        available = packets["caplen"].astype(np.int64) - packets["payload_offset"]
+        available[packets["payload_offset"] == 0] = 0
+        if self._mm is not None:
+            arr = np.frombuffer(self._mm, dtype=np.uint8)
+            prefixes = _gather(arr, start, width)
+            del arr
+        else:
+            prefixes = np.zeros((packets.size, width), dtype=np.uint8)
+            for i, (pos, length) in enumerate(zip(start.tolist(), np.minimum(available, width).tolist())):
+                if length > 0:
+                    prefixes[i, :length] = np.frombuffer(bytes(self._read(pos, length)), dtype=np.uint8)
+        prefixes[np.arange(width) >= available[:, None]] = 0
+        return prefixes
+
+    def payloads(self, packets: np.ndarray) -> List[bytes]:
+        """Return the captured L4 payload of each decoded packet."""
+        start = (packets["offset"].astype(np.int64) + packets["data_offset"]
+                 + packets["payload_offset"])
+        length = packets["caplen"].astype(np.int64) - packets["payload_offset"]
+        length[(packets["payload_offset"] == 0) | (length < 0)] = 0
+        read = self._read
+        return [bytes(read(pos, size)) for pos, size in zip(start.tolist(), length.tolist())]
+
+    def iter_batches(
+        self,
+        batch_size: Optional[int] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        allow_truncated: bool = False
+    ) -> Iterator[np.ndarray]:
+        """
+        Yield decoded packets as PACKET_DTYPE arrays.
+
+        Args:
+            batch_size: Maximum packets per batch
+            start: Offset of the first record to read (must be a record boundary)
+            end: Records starting at or after this offset are not read
+            allow_truncated: Stop quietly at a record cut off by the end of
+                the file, as when the capture is still being written
+        """
+        batch_size = batch_size or settings.PACKET_BATCH_SIZE
+        pos = self.data_start if start is None else start
+        stop = self.size if end is None else min(end, self.size)
+        self.position = pos
+        self.sections_seen = 0
+        if self.format == "pcapng" and start:
+            self._load_pcapng_interfaces(start)
+
+        window = SCAN_WINDOW
+        while pos < stop:
+            length = min(window, self.size - pos)
+            buf = self._read(pos, length)
+            if self.format == "pcap":
+                batch, consumed = self._scan_pcap(buf, pos, stop - pos, batch_size)
+            else:
+                batch, consumed = self._scan_pcapng(buf, pos, stop - pos, batch_size)
+            del buf
+            if consumed == 0:
+                if pos + length >= self.size:
+                    if not allow_truncated:
+                        logger.warning(f"Truncated record at offset {pos} in {self.path}")
+                    break
+                window *= 2
+                continue
+            pos += consumed
+            self.position = pos
+            window = SCAN_WINDOW
+            if batch is not None and batch.size:
+                yield batch
+
+    def _scan_pcap(self, buf, base: int, limit: int, batch_size: int) -> Tuple[Optional[np.ndarray], int]:
+        # Record boundaries can only be found sequentially; keep this loop tight
+        unpack = struct.Struct(f"{self.byteorder}I").unpack_from
+        offsets = []
+        append = offsets.append
+        pos = 0
+        end = len(buf)
+        last_header = min(end - PCAP_RECORD_HEADER_LEN, limit - 1)
+        remaining = batch_size
+        while pos <= last_header and remaining:
+            next_pos = pos + PCAP_RECORD_HEADER_LEN + unpack(buf, pos + 8)[0]
+            if next_pos > end:
+                if next_pos - pos > MAX_RECORD_LEN:
+                    raise CaptureFormatError(f"Corrupt record length at offset {base + pos}")
+                break
+            append(pos)
+            pos = next_pos
+            remaining -= 1
+        if not offsets:
+            return None, 0
+
+        arr = np.frombuffer(buf, dtype=np.uint8)
+        rec = np.array(offsets, dtype=np.int64)
+        ts_sec = _uint(arr, rec, 4, self.byteorder)
+        ts_frac = _uint(arr, rec + 4, 4, self.byteorder)
+        caplen = _uint(arr, rec + 8, 4, self.byteorder).astype(np.int64)
+        out = np.zeros(rec.size, dtype=PACKET_DTYPE)
+        out["ts"] = ts_sec + ts_frac * self.ts_resolution
+        out["length"] = _uint(arr, rec + 12, 4, self.byteorder)
+        out["caplen"] = caplen
+        out["offset"] = base + rec
+        out["record_len"] = PCAP_RECORD_HEADER_LEN + caplen
+        out["data_offset"] = PCAP_RECORD_HEADER_LEN
+        decode_frames(arr, rec + PCAP_RECORD_HEADER_LEN, caplen, self.linktype, out)
+        return out, pos
+
+    def shard_ranges(self, shards: int) -> List[Tuple[int, int]]:
+        """
+        Split the capture into up to `shards` contiguous byte ranges that
+        start on record (pcap) or block (pcapng) boundaries.
+
+        Ranges can be read independently with iter_batches(start=, end=);
+        together they cover every record exactly once.
+        """
+        bounds = [self.data_start]
+        step = (self.size - self.data_start) // max(shards, 1)
+        for i in range(1, shards):
+            if step == 0:
+                break
+            boundary = self.find_record_boundary(self.data_start + i * step)
+            if bounds[-1] < boundary < self.size:
+                bounds.append(boundary)
+        bounds.append(self.size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def find_record_boundary(self, offset: int) -> int:
+        """
+        Return the first record boundary at or after offset, or the file
+        size if none can be found.
+        """
+        if self.format == "pcapng":
+            self._load_pcapng_interfaces(self.data_start)
+        pos = max(offset, self.data_start)
+        while pos < self.size:
+            length = min(RESYNC_WINDOW + PCAP_RECORD_HEADER_LEN, self.size - pos)
+            window = np.frombuffer(bytes(self._read(pos, length)), dtype=np.uint8)
+            candidates = self._boundary_candidates(window)
+            for candidate in candidates.tolist():
+                if self._valid_chain(pos + candidate):
+                    return pos + candidate
+            pos += RESYNC_WINDOW
+        return self.size
+
+    def _boundary_candidates(self, window: np.ndarray) -> np.ndarray:
+        # Cheap vectorized prefilter over every byte position in the window
+        positions = np.arange(max(window.size - 12, 0), dtype=np.int64)
+        if self.format == "pcap":
+            frac = _uint(window, positions + 4, 4, self.byteorder)
+            caplen = _uint(window, positions + 8, 4, self.byteorder)
+            orig = _uint(window, positions + 12, 4, self.byteorder)
+            frac_limit = round(1 / self.ts_resolution)
+            mask = (frac < frac_limit) & (caplen > 0) & (caplen <= orig) & (orig <= MAX_RECORD_LEN)
+            if self.snaplen:
+                mask &= caplen <= self.snaplen
+        else:
+            block_type = _uint(window, positions, 4, self.byteorder)
+            block_len = _uint(window, positions + 4, 4, self.byteorder)
+            mask = np.isin(block_type, PCAPNG_BLOCK_TYPES) & (block_len >= 12) & (block_len % 4 == 0)
+            mask &= block_len <= MAX_RECORD_LEN
+        return positions[mask]
+
+    def _valid_chain(self, pos: int) -> bool:
+        timestamps = []
+        for _ in range(RESYNC_CHAIN):
+            if pos == self.size:
+                break
+            next_pos = self._plausible_record(pos, timestamps)
+            if next_pos is None:
+                return False
+            pos = next_pos
+        # Records of one capture are close in time; misaligned headers are not.
+        # A chain read 4 bytes into real headers follows the real lengths but
+        # takes sub-second fractions for timestamps, so it predates the capture.
+        if not timestamps:
+            return True
+        return (max(timestamps) - min(timestamps) <= RESYNC_MAX_TS_SPREAD
+                and min(timestamps) >= self._first_timestamp() - RESYNC_MAX_TS_SPREAD)
+
+    def _first_timestamp(self) -> int:
+        """Seconds of the first pcap record, or 0 for a capture without records."""
+        head = bytes(self._read(self.data_start, 4))
+        return struct.unpack(f"{self.byteorder}I", head)[0] if len(head) == 4 else 0
+
+    def _plausible_record(self, pos: int, timestamps: List[int]) -> Optional[int]:
+        """Return the offset after the record at pos if its header is plausible."""
+        if self.format == "pcap":
+            head = bytes(self._read(pos, PCAP_RECORD_HEADER_LEN))
+            if len(head) < PCAP_RECORD_HEADER_LEN:
+                return None
+            ts_sec, frac, caplen, orig = struct.unpack(f"{self.byteorder}IIII", head)
+            if frac >= round(1 / self.ts_resolution) or not 0 < caplen <= orig or orig > MAX_RECORD_LEN:
+                return None
+            if self.snaplen and caplen > self.snaplen:
+                return None
+            timestamps.append(ts_sec)
+            next_pos = pos + PCAP_RECORD_HEADER_LEN + caplen
+        else:
+            head = bytes(self._read(pos, 12))
+            if len(head) < 12:
+                return None
+            block_type, block_len = struct.unpack_from(f"{self.byteorder}II", head)
+            if block_type == PCAPNG_SHB:
+                return None  # never start a shard inside another section
+            if block_type not in PCAPNG_BLOCK_TYPES or block_len < 12 or block_len % 4 or block_len > MAX_RECORD_LEN:
+                return None
+            trailer = bytes(self._read(pos + block_len - 4, 4))
+            if len(trailer) < 4 or struct.unpack(f"{self.byteorder}I", trailer)[0] != block_len:
+                return None
+            next_pos = pos + block_len
+        return next_pos if next_pos <= self.size else None
+
+    def _parse_idb(self, block: bytes, byteorder: str) -> Tuple[int, float, float, int]:
+        linktype, _, snaplen = struct.unpack_from(f"{byteorder}HHI", block, 8)
+        ts_resolution, ts_offset = 1e-6, 0.0
+        pos = 16
+        while pos + 4 <= len(block) - 4:
+            code, length = struct.unpack_from(f"{byteorder}HH", block, pos)
+            if code == 0:
+                break
+            value = block[pos + 4:pos + 4 + length]
+            if code == 9 and length >= 1:
+                resol = value[0]
+                ts_resolution = 2.0 ** -(resol & 0x7F) if resol & 0x80 else 10.0 ** -resol
+            elif code == 14 and length >= 8:
+                ts_offset = float(struct.unpack_from(f"{byteorder}q", value)[0])
+            pos += 4 + ((length + 3) & ~3)
+        return linktype, ts_resolution, ts_offset, snaplen
+
+    def _load_pcapng_interfaces(self, start: int) -> None:
+        # Reading from the middle of a file needs the section's interface table
+        self.interfaces = []
+        for block in self._pcapng_preamble():
+            if struct.unpack_from("<I", block)[0] == PCAPNG_SHB:
+                self.byteorder = "<" if struct.unpack_from("<I", block, 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                self.interfaces = []
+            else:
+                self.interfaces.append(self._parse_idb(block, self.byteorder))
+
+    def _scan_pcapng(self, buf, base: int, limit: int, batch_size: int) -> Tuple[Optional[np.ndarray], int]:
+        offsets, types = [], []
+        pos = 0
+        end = len(buf)
+        while pos < limit and pos + 12 <= end and len(offsets) < batch_size:
+            block_type = struct.unpack_from("<I", buf, pos)[0]
+            if block_type == PCAPNG_SHB:
+                if offsets:
+                    break  # a new section starts a new batch
+                bom = struct.unpack_from("<I", buf, pos + 8)[0]
+                self.byteorder = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                self.interfaces = []
+                self.sections_seen += 1
+            else:
+                block_type = struct.unpack_from(f"{self.byteorder}I", buf, pos)[0]
+            block_len = struct.unpack_from(f"{self.byteorder}I", buf, pos + 4)[0]
+            if block_len < 12 or block_len % 4 or block_len > MAX_RECORD_LEN:
+                raise CaptureFormatError(f"Corrupt block length {block_len} at offset {base + pos}")
+            if pos + block_len > end:
+                break
+            if block_type == BLOCK_IDB:
+                self.interfaces.append(self._parse_idb(bytes(buf[pos:pos + block_len]), self.byteorder))
+            elif block_type in (BLOCK_EPB, BLOCK_PB, BLOCK_SPB):
+                offsets.append(pos)
+                types.append(block_type)
+            pos += block_len
+        if not offsets:
+            return None, pos
+
+        byteorder = self.byteorder
+        arr = np.frombuffer(buf, dtype=np.uint8)
+        rec = np.array(offsets, dtype=np.int64)
+        kind = np.array(types, dtype=np.int64)
+        simple = kind == BLOCK_SPB
+        block_len = _uint(arr, rec + 4, 4, byteorder).astype(np.int64)
+        iface = np.where(kind == BLOCK_PB, _uint(arr, rec + 8, 2, byteorder), _uint(arr, rec + 8, 4, byteorder))
+        iface = np.where(simple, 0, iface).astype(np.int64)
+        if not self.interfaces or iface.max() >= len(self.interfaces):
+            raise CaptureFormatError(f"Packet references unknown interface in {self.path}")
+
+        linktypes = np.array([i[0] for i in self.interfaces], dtype=np.int64)[iface]
+        resolution = np.array([i[1] for i in self.interfaces])[iface]
+        ts_offset = np.array([i[2] for i in self.interfaces])[iface]
+        ts_raw = (_uint(arr, rec + 12, 4, byteorder).astype(np.uint64) << np.uint64(32)) | _uint(arr, rec + 16, 4, byteorder)
+        orig = np.where(simple, _uint(arr, rec + 8, 4, byteorder), _uint(arr, rec + 24, 4, byteorder)).astype(np.int64)
+        caplen = np.where(simple, np.minimum(orig, block_len - 16), _uint(arr, rec + 20, 4, byteorder)).astype(np.int64)
+        data_offset = np.where(simple, 12, 28)
+
+        out = np.zeros(rec.size, dtype=PACKET_DTYPE)
+        out["ts"] = np.where(simple, 0.0, ts_raw * resolution + ts_offset)
+        out["length"] = orig
+        out["caplen"] = caplen
+        out["offset"] = base + rec
+        out["record_len"] = block_len
+        out["data_offset"] = data_offset
+        for linktype in np.unique(linktypes):
+            if linktype not in SUPPORTED_LINKTYPES:
+                raise CaptureFormatError(f"Unsupported link type: {linktype}")
+            sel = np.flatnonzero(linktypes == linktype)
+            rows = out[sel]
+            decode_frames(arr, rec[sel] + data_offset[sel], caplen[sel], int(linktype), rows)
+            out[sel] = rows
+        return out, pos
+
+    def close(self) -> None:
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                logger.debug(f"Capture map for {self.path} still referenced; left to GC")
+            self._mm = None
+        if self._compressed is not None:
+            self._compressed.close()
+            self._compressed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,243 @@
+import os
+import json
+import zlib
+import base64
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from utils.vector_hash import hash_columns
+
+logger = logging.getLogger(__name__)
+
+# Fixed-memory summaries used instead of exact per-key dicts. All of them
+# are updated a batch at a time, merge associatively (so capture shards
+# and separate captures can be combined) and round-trip through JSON.
+
+SKETCHES_FILENAME = "sketches.json"
+
+def _hash_keys(keys: np.ndarray, seed: int = 0) -> np.ndarray:
+    if keys.dtype.kind in ("U", "O"):
+        if not len(keys):
+            return np.zeros(0, dtype=np.uint64)
+        keys = np.array([str(k).encode("utf-8") for k in keys.tolist()], dtype=bytes)
+    return hash_columns(keys, seed=seed)
+
+def _encode_array(values: np.ndarray) -> Dict:
+    # Sketch tables are mostly zeros, so they compress well
+    data = zlib.compress(np.ascontiguousarray(values).tobytes())
+    return {"dtype": values.dtype.str, "data": base64.b64encode(data).decode("ascii")}
+
+def _decode_array(encoded: Dict) -> np.ndarray:
+    data = zlib.decompress(base64.b64decode(encoded["data"]))
+    return np.frombuffer(data, dtype=np.dtype(encoded["dtype"])).copy()
+
+def _encode_keys(keys: np.ndarray) -> Dict:
+    if keys.dtype.kind in ("U", "O"):
+        return {"dtype": "str", "values": [str(k) for k in keys.tolist()]}
+    return _encode_array(keys)
+
+def _decode_keys(encoded: Dict) -> np.ndarray:
+    if encoded["dtype"] == "str":
+        return np.array(encoded["values"], dtype=object)
+    return _decode_array(encoded)
+
+class SpaceSaving:
+    """
+    Top-K heavy hitters with bounded error (Space-Saving).
+
+    Keeps at most `capacity` keys with an overestimated count and the
+    maximum overestimation per key. Batches are folded in with the
+    mergeable-summary rule: keys missing from a full summary are assumed
+    to have its minimum count, then the largest `capacity` keys are kept.
+    """
+
+    def __init__(self, capacity: int = 1024, dtype=object):
+        self.capacity = capacity
+        self.keys = np.zeros(0, dtype=dtype)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+
+    def update(self, keys: np.ndarray, weights: Optional[np.ndarray] = None) -> None:
+        """Add a batch of keys with optional per-key weights (default 1)."""
+        if not len(keys):
+            return
+        keys = np.asarray(keys, dtype=self.keys.dtype)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        if weights is None:
+            counts = np.bincount(inverse.ravel(), minlength=unique.size)
+        else:
+            counts = np.bincount(inverse.ravel(), weights=weights, minlength=unique.size)
+        self._combine(unique, counts.astype(np.int64), np.zeros(unique.size, dtype=np.int64), 0)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        self._combine(other.keys, other.counts, other.errors, other._floor())
+
+    def _floor(self) -> int:
+        """Upper bound on the count of any key that is not tracked."""
+        return int(self.counts.min()) if self.keys.size >= self.capacity else 0
+
+    def _combine(self, keys: np.ndarray, counts: np.ndarray, errors: np.ndarray, floor: int) -> None:
+        own_floor = self._floor()
+        all_keys = np.concatenate([self.keys, np.asarray(keys, dtype=self.keys.dtype)])
+        unique, inverse = np.unique(all_keys, return_inverse=True)
+        inverse = inverse.ravel()
+        own, theirs = inverse[:self.keys.size], inverse[self.keys.size:]
+
+        in_own = np.zeros(unique.size, dtype=bool)
+        in_own[own] = True
+        in_theirs = np.zeros(unique.size, dtype=bool)
+        in_theirs[theirs] = True
+
+        merged_counts = np.zeros(unique.size, dtype=np.int64)
+        merged_errors = np.zeros(unique.size, dtype=np.int64)
+        merged_counts[own] += self.counts
+        merged_errors[own] += self.errors
+        merged_counts[theirs] += counts
+        merged_errors[theirs] += errors
+        merged_counts[~in_own] += own_floor
+        merged_errors[~in_own] += own_floor
+        merged_counts[~in_theirs] += floor
+        merged_errors[~in_theirs] += floor
+
+        # Keep the heaviest keys; ties resolve on the key for determinism
+        order = np.lexsort((np.arange(unique.size), -merged_counts))[:self.capacity]
+        self.keys = unique[order]
+        self.counts = merged_counts[order]
+        self.errors = merged_errors[order]
+
+    def top(self, n: int) -> List[Tuple[object, int]]:
+        """Return the n heaviest (key, estimated count) pairs, heaviest first."""
+        return list(zip(self.keys[:n].tolist(), self.counts[:n].tolist()))
+
+    def to_dict(self) -> Dict:
+        return {
+            "type": "space_saving",
+            "capacity": self.capacity,
+            "keys": _encode_keys(self.keys),
+            "counts": self.counts.tolist(),
+            "errors": self.errors.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SpaceSaving":
+        keys = _decode_keys(data["keys"])
+        sketch = cls(data["capacity"], dtype=keys.dtype)
+        sketch.keys = keys
+        sketch.counts = np.array(data["counts"], dtype=np.int64)
+        sketch.errors = np.array(data["errors"], dtype=np.int64)
+        return sketch
+
+class CountMinSketch:
+    """Point estimates of per-key totals in fixed memory (never underestimates)."""
+
+    def __init__(self, width: int = 1 << 14, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, keys: np.ndarray) -> List[np.ndarray]:
+        return [(_hash_keys(keys, seed=row + 1) % np.uint64(self.width)).astype(np.int64) for row in range(self.depth)]
+
+    def update(self, keys: np.ndarray, weights: Optional[np.ndarray] = None) -> None:
+        if not len(keys):
+            return
+        weights = np.ones(len(keys), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        for row, columns in enumerate(self._columns(keys)):
+            self.table[row] += np.bincount(columns, weights=weights, minlength=self.width).astype(np.int64)
+
+    def query(self, keys: np.ndarray) -> np.ndarray:
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        return np.min([self.table[row][columns] for row, columns in enumerate(self._columns(keys))], axis=0)
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches of different shapes")
+        self.table += other.table
+
+    def to_dict(self) -> Dict:
+        return {"type": "count_min", "width": self.width, "depth": self.depth, "table": _encode_array(self.table.ravel())}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CountMinSketch":
+        sketch = cls(data["width"], data["depth"])
+        sketch.table = _decode_array(data["table"]).reshape(sketch.depth, sketch.width)
+        return sketch
+
+class HyperLogLog:
+    """Distinct-count estimate with 2^precision one-byte registers."""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, keys: np.ndarray) -> None:
+        if not len(keys):
+            return
+        hashes = _hash_keys(keys, seed=0x5EED)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest_bits = 64 - self.precision
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # rank = position of the leftmost 1 bit in the remaining bits
+        bit_length = np.zeros(rest.size, dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.frexp(rest[nonzero].astype(np.float64))[1]
+        too_long = nonzero & (np.left_shift(np.uint64(1), (bit_length - 1).clip(0).astype(np.uint64)) > rest)
+        bit_length[too_long] -= 1
+        rank = (rest_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict:
+        return {"type": "hyperloglog", "precision": self.precision, "registers": _encode_array(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        sketch.registers = _decode_array(data["registers"])
+        return sketch
+
+SKETCH_TYPES = {
+    "space_saving": SpaceSaving,
+    "count_min": CountMinSketch,
+    "hyperloglog": HyperLogLog
+}
+
+def sketch_from_dict(data: Dict):
+    return SKETCH_TYPES[data["type"]].from_dict(data)
+
+def save_sketches(path: str, sketches: Dict) -> None:
+    """Write named sketches to a JSON file, replacing it atomically."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({name: sketch.to_dict() for name, sketch in sketches.items()}, f)
+    os.replace(temp_path, path)
+
+def load_sketches(path: str) -> Dict:
+    """Read named sketches written by save_sketches."""
+    with open(path, "r", encoding="utf-8") as f:
+        return {name: sketch_from_dict(data) for name, data in json.load(f).items()}
+
+def merge_sketches(groups: List[Dict]) -> Dict:
+    """Merge several sets of named sketches (e.g. one per capture) into one."""
+    merged: Dict = {}
+    for sketches in groups:
+        for name, sketch in sketches.items():
+            if name in merged:
+                merged[name].merge(sketch)
+            else:
+                merged[name] = sketch_from_dict(sketch.to_dict())
+    return merged
@@ -0,0 +1,332 @@
+import os
+import json
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+from services.pcap_reader import format_ip
+from services.packet_store import PacketStore, QUERY_CHUNK
+
+logger = logging.getLogger(__name__)
+
+# Series are stored sparsely per resolution: a sorted int64 array of
+# non-empty bucket numbers (bucket = floor(ts / resolution)) and a
+# (buckets, series) uint64 matrix of values, each as a plain .npy file so
+# readers can memory-map them and slice out a time window directly.
+TIMESERIES_DIRNAME = "timeseries"
+INDEX_FILENAME = "index.json"
+VERSION = 1
+RESOLUTIONS = (1, 60, 3600)
+
+# Series names: totals, then bytes per protocol and per tracked host
+BASE_SERIES = ("bytes", "packets", "flows")
+PROTOCOL_PREFIX = "protocol:"
+HOST_PREFIX = "host:"
+
+class TimeSeriesError(Exception):
+    """Raised when stored time series are missing or malformed."""
+    pass
+
+class _BucketAccumulator:
+    """
+    Sum weighted events into sparse (bucket, series) cells at the finest
+    resolution. The number of series may grow between calls to add.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self._parts = []
+
+    def add(self, timestamps: np.ndarray, series: np.ndarray, weights: np.ndarray) -> None:
+        if not timestamps.size:
+            return
+        buckets = np.floor(timestamps / RESOLUTIONS[0]).astype(np.int64)
+        first = int(buckets.min())
+        span = int(buckets.max()) - first + 1
+        if span <= 4 * buckets.size:
+            # Captures are mostly time-ordered, so a batch covers few buckets
+            values = np.bincount((buckets - first) * self.width + series, weights=weights,
+                                 minlength=span * self.width).reshape(span, self.width)
+            used = values.any(axis=1)
+            self._parts.append((np.flatnonzero(used) + first, values[used]))
+        else:
+            self._parts.append(_reduce(buckets, series, weights, self.width))
+
+    def result(self):
+        """Return (buckets, values) per resolution, rolled up from the finest one."""
+        if self._parts:
+            buckets = np.concatenate([b for b, _ in self._parts])
+            values = np.concatenate([
+                np.pad(v, ((0, 0), (0, self.width - v.shape[1]))) for _, v in self._parts
+            ])
+        else:
+            buckets = np.zeros(0, dtype=np.int64)
+            values = np.zeros((0, self.width))
+        results = {}
+        previous = RESOLUTIONS[0]
+        for resolution in RESOLUTIONS:
+            # floor(floor(ts / r) / k) == floor(ts / (r * k)), so coarser
+            # buckets are exact sums of finer ones
+            unique, inverse = np.unique(buckets // (resolution // previous), return_inverse=True)
+            merged = np.zeros((unique.size, self.width))
+            np.add.at(merged, inverse.ravel(), values)
+            if resolution == RESOLUTIONS[0]:
+                # Keep the reduced cells so repeated results stay cheap
+                self._parts = [(unique, merged)]
+            results[resolution] = (unique, np.rint(merged).astype(np.uint64))
+            buckets, values, previous = unique, merged, resolution
+        return results
+
+def _reduce(buckets: np.ndarray, series: np.ndarray, weights: np.ndarray, width: int):
+    unique, inverse = np.unique(buckets, return_inverse=True)
+    values = np.bincount(inverse.ravel() * width + series, weights=weights, minlength=unique.size * width)
+    return unique, values.reshape(unique.size, width)
+
+def _series_path(directory: str, resolution: int, kind: str, generation: int) -> str:
+    # Generation 0 keeps the original file names; later generations are
+    # written next to the previous one so open readers are not disturbed
+    if generation:
+        return os.path.join(directory, f"{resolution}.g{generation}.{kind}.npy")
+    return os.path.join(directory, f"{resolution}.{kind}.npy")
+
+def _stored_generation(directory: str) -> Optional[int]:
+    try:
+        with open(os.path.join(directory, INDEX_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f).get("generation", 0)
+    except (OSError, ValueError):
+        return None
+
+class TimeSeriesBuilder:
+    """
+    Bucket packets into series incrementally.
+
+    Protocol series are added as protocols first appear, so a builder can
+    follow a capture whose protocol mix is not known up front; per-host
+    series are fixed to the hosts given at construction. write() may be
+    called repeatedly while packets keep arriving.
+    """
+
+    def __init__(self, protocols: Optional[List[str]] = None, hosts: Optional[np.ndarray] = None):
+        hosts = np.zeros(0, dtype="S16") if hosts is None else np.asarray(hosts, dtype="S16")
+        self.names = list(BASE_SERIES)
+        self._accumulator = _BucketAccumulator(len(self.names))
+        # protocol number -> series column; non-IP traffic goes to "N/A"
+        self._protocol_column = np.full(256, -1, dtype=np.int64)
+        self._non_ip_column = -1
+        for label in protocols or []:
+            if label.isdigit() and int(label) < 256:
+                self._protocol_column[int(label)] = self._add_series(PROTOCOL_PREFIX + label)
+            elif label == "N/A":
+                self._non_ip_column = self._add_series(PROTOCOL_PREFIX + label)
+        host_base = len(self.names)
+        self.names += [HOST_PREFIX + format_ip(host) for host in hosts.tolist()]
+        self._sorted_hosts = np.sort(hosts)
+        self._host_columns = host_base + np.argsort(hosts, kind="stable")
+        self._accumulator.width = len(self.names)
+        self.start, self.end = np.inf, -np.inf
+
+    def _add_series(self, name: str) -> int:
+        self.names.append(name)
+        self._accumulator.width = len(self.names)
+        return len(self.names) - 1
+
+    def _host_column(self, ips: np.ndarray) -> np.ndarray:
+        if not self._sorted_hosts.size:
+            return np.full(ips.size, -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_hosts, ips).clip(max=self._sorted_hosts.size - 1)
+        return np.where(self._sorted_hosts[pos] == ips, self._host_columns[pos], -1)
+
+    def add(
+        self,
+        ts: np.ndarray,
+        lengths: np.ndarray,
+        ip_version: np.ndarray,
+        protocol: np.ndarray,
+        src_ip: np.ndarray,
+        dst_ip: np.ndarray
+    ) -> None:
+        """Add packets given as columns (timestamps, lengths, header fields)."""
+        if not ts.size:
+            return
+        lengths = lengths.astype(np.float64)
+        is_ip = ip_version != 0
+        self.start, self.end = min(self.start, float(ts.min())), max(self.end, float(ts.max()))
+
+        seen = np.unique(protocol[is_ip])
+        for proto in seen[self._protocol_column[seen] < 0].tolist():
+            self._protocol_column[proto] = self._add_series(PROTOCOL_PREFIX + str(proto))
+        if self._non_ip_column < 0 and not is_ip.all():
+            self._non_ip_column = self._add_series(PROTOCOL_PREFIX + "N/A")
+
+        proto = np.where(is_ip, self._protocol_column[protocol], self._non_ip_column)
+        src = np.where(is_ip, self._host_column(src_ip), -1)
+        dst = np.where(is_ip, self._host_column(dst_ip), -1)
+        dst = np.where(dst == src, -1, dst)  # Count traffic to self once
+
+        ones = np.ones(ts.size)
+        event_ts = [ts, ts]
+        event_series = [np.zeros(ts.size, dtype=np.int64), np.ones(ts.size, dtype=np.int64)]
+        event_weights = [lengths, ones]
+        for column in (proto, src, dst):
+            hit = column >= 0
+            event_ts.append(ts[hit])
+            event_series.append(column[hit])
+            event_weights.append(lengths[hit])
+        self._accumulator.add(np.concatenate(event_ts), np.concatenate(event_series), np.concatenate(event_weights))
+
+    def add_batch(self, packets: np.ndarray) -> None:
+        """Add a decoded PACKET_DTYPE batch."""
+        self.add(packets["ts"], packets["length"], packets["ip_version"], packets["protocol"],
+                 packets["src_ip"], packets["dst_ip"])
+
+    def add_flows(self, first_seen: np.ndarray) -> None:
+        """Count flows by the bucket they start in."""
+        if first_seen.size:
+            self._accumulator.add(first_seen, np.full(first_seen.size, 2, dtype=np.int64), np.ones(first_seen.size))
+
+    def write(self, directory: str) -> Dict:
+        """
+        Write the series at every resolution to directory.
+
+        Returns:
+            The stored index (series names, resolutions and time range)
+        """
+        os.makedirs(directory, exist_ok=True)
+        previous = _stored_generation(directory)
+        generation = 0 if previous is None else previous + 1
+        for resolution, (buckets, values) in self._accumulator.result().items():
+            np.save(_series_path(directory, resolution, "buckets", generation), buckets)
+            np.save(_series_path(directory, resolution, "values", generation), values)
+
+        empty = self.start > self.end
+        index = {
+            "version": VERSION,
+            "generation": generation,
+            "resolutions": list(RESOLUTIONS),
+            "series": list(self.names),
+            "start": None if empty else self.start,
+            "end": None if empty else self.end
+        }
+        # The index is written last, so a half-written directory is never read
+        temp_path = os.path.join(directory, f"{INDEX_FILENAME}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(temp_path, os.path.join(directory, INDEX_FILENAME))
+
+        # Readers may still hold the previous index; older files can go
+        keep = {generation, previous}
+        for name in os.listdir(directory):
+            parts = name.split(".")
+            if name.endswith(".npy") and len(parts) == 4 and parts[1].startswith("g"):
+                if int(parts[1][1:]) not in keep:
+                    os.remove(os.path.join(directory, name))
+            elif name.endswith(".npy") and len(parts) == 3 and 0 not in keep:
+                os.remove(os.path.join(directory, name))
+        logger.info(f"Wrote {len(self.names)} time series to {directory}")
+        return index
+
+def build_timeseries(
+    store: PacketStore,
+    flows: np.ndarray,
+    protocols: List[str],
+    hosts: np.ndarray,
+    directory: str
+) -> Dict:
+    """
+    Bucket a finished analysis into series at every resolution and write
+    them to directory.
+
+    Args:
+        store: Packet store of the analysis
+        flows: FLOW_DTYPE rows; "flows" counts flows by the bucket they start in
+        protocols: Protocol labels as in the traffic summary ("6", "17", "N/A", ...)
+        hosts: Packed addresses of the hosts to keep per-host series for
+
+    Returns:
+        The stored index (series names, resolutions and time range)
+    """
+    builder = TimeSeriesBuilder(protocols, hosts)
+    for offset in range(0, store.rows, QUERY_CHUNK):
+        stop = min(offset + QUERY_CHUNK, store.rows)
+        builder.add(*(
+            np.asarray(store.column(name)[offset:stop])
+            for name in ("timestamp", "length", "ip_version", "protocol", "src_ip", "dst_ip")
+        ))
+    if flows.size:
+        builder.add_flows(flows["first_seen"])
+    return builder.write(directory)
+
+class TimeSeriesStore:
+    """Read-only access to the series written by build_timeseries."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        path = os.path.join(directory, INDEX_FILENAME)
+        if not os.path.exists(path):
+            raise TimeSeriesError(f"Time series not found: {directory}")
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != VERSION:
+            raise TimeSeriesError(f"Unsupported time series version: {index.get('version')}")
+        self.generation: int = index.get("generation", 0)
+        self.resolutions: List[int] = index["resolutions"]
+        self.series: List[str] = index["series"]
+        self.start: Optional[float] = index["start"]
+        self.end: Optional[float] = index["end"]
+
+    def _load(self, resolution: int):
+        buckets = np.load(_series_path(self.directory, resolution, "buckets", self.generation), mmap_mode="r")
+        values = np.load(_series_path(self.directory, resolution, "values", self.generation), mmap_mode="r")
+        return buckets, values
+
+    def choose_resolution(self, start: float, end: float, max_points: int) -> int:
+        """Finest stored resolution whose bucket count over [start, end] fits max_points."""
+        for resolution in sorted(self.resolutions):
+            if np.floor(end / resolution) - np.floor(start / resolution) + 1 <= max_points:
+                return resolution
+        return max(self.resolutions)
+
+    def query(
+        self,
+        metric: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        max_points: int = 1000
+    ) -> Dict:
+        """
+        Return one series over [start, end] with at most max_points points.
+
+        The window defaults to the whole capture. When even the coarsest
+        resolution has too many buckets, consecutive buckets are summed.
+
+        Returns:
+            Dictionary with bucket start times (epoch seconds), values and
+            the effective bucket width in seconds
+        """
+        if metric not in self.series:
+            raise ValueError(f"Unknown metric: {metric}")
+        if max_points < 1:
+            raise ValueError("max_points must be positive")
+        if self.start is None:
+            return {"timestamps": [], "values": [], "resolution": min(self.resolutions)}
+        start = self.start if start is None else start
+        end = self.end if end is None else end
+        if end < start:
+            raise ValueError("end must not be before start")
+
+        resolution = self.choose_resolution(start, end, max_points)
+        first = int(np.floor(start / resolution))
+        count = int(np.floor(end / resolution)) - first + 1
+        step = -(-count // max_points)  # Buckets summed per point
+        points = -(-count // step)
+
+        buckets, values = self._load(resolution)
+        lo, hi = np.searchsorted(buckets, [first, first + count])
+        column = values[lo:hi, self.series.index(metric)].astype(np.float64)
+        slots = (np.asarray(buckets[lo:hi]) - first) // step
+        dense = np.bincount(slots, weights=column, minlength=points)
+
+        times = (first + np.arange(points) * step) * resolution
+        return {"timestamps": times.tolist(), "values": dense.tolist(), "resolution": resolution * step}
+
+def timeseries_dir(analysis_dir: str) -> str:
+    return os.path.join(analysis_dir, TIMESERIES_DIRNAME)
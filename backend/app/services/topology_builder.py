@@ -0,0 +1,169 @@
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert, delete
+from sqlalchemy.orm import Session
+from models.network import NetworkNode, NetworkConnection, NodeType, NodeStatus, ConnectionType
+from services.pcap_reader import PROTOCOL_NAMES, format_ips
+from services.flow_table import flow_channels
+
+logger = logging.getLogger(__name__)
+
+# Topology edge: all sessions from one client to one server port, with
+# traffic summed over both directions.
+EDGE_DTYPE = np.dtype([
+    ("src", "<i8"),         # Index into the node addresses
+    ("dst", "<i8"),
+    ("protocol", "u1"),
+    ("port", "<u2"),        # Server port, 0 for protocols without ports
+    ("flows", "<u8"),
+    ("packets", "<u8"),
+    ("bytes", "<u8"),
+    ("first_seen", "<f8"),
+    ("last_seen", "<f8"),
+])
+
+TOPOLOGY_INSERT_BATCH = 10_000
+HTTP_PORTS = (80, 8000, 8080)
+HTTPS_PORTS = (443, 8443)
+
+class TopologyEdges:
+    """Distinct packed node addresses and the EDGE_DTYPE rows between them."""
+
+    def __init__(self, addresses: np.ndarray, edges: np.ndarray):
+        self.addresses = addresses
+        self.edges = edges
+
+    def node_types(self) -> List[NodeType]:
+        """Services accept connections, clients open them, hosts do both."""
+        serves = np.zeros(self.addresses.size, dtype=bool)
+        opens = np.zeros(self.addresses.size, dtype=bool)
+        serves[self.edges["dst"]] = True
+        opens[self.edges["src"]] = True
+        types = np.where(serves & opens, 0, np.where(serves, 1, 2))
+        return [(NodeType.HOST, NodeType.SERVICE, NodeType.CLIENT)[t] for t in types.tolist()]
+
+    def last_seen(self) -> np.ndarray:
+        """Latest activity of each node over all its edges."""
+        last = np.full(self.addresses.size, -np.inf)
+        np.maximum.at(last, self.edges["src"], self.edges["last_seen"])
+        np.maximum.at(last, self.edges["dst"], self.edges["last_seen"])
+        return last
+
+def aggregate_edges(flows: np.ndarray) -> TopologyEdges:
+    """
+    Collapse FLOW_DTYPE rows into directed topology edges keyed by
+    (client, server, protocol, server port) in one sort over the table.
+    """
+    flows = flows[flows["protocol"] != 0]
+    if not flows.size:
+        return TopologyEdges(np.zeros(0, dtype="S16"), np.zeros(0, dtype=EDGE_DTYPE))
+    channels = flow_channels(flows)
+    order = np.argsort(channels["channel"], kind="stable")
+    starts = np.flatnonzero(np.diff(channels["channel"][order], prepend=-1))
+    heads = order[starts]
+
+    edges = np.zeros(starts.size, dtype=EDGE_DTYPE)
+    edges["src"] = channels["client"][heads]
+    edges["dst"] = channels["server"][heads]
+    edges["protocol"] = channels["protocol"][heads]
+    edges["port"] = channels["port"][heads]
+    edges["flows"] = np.diff(np.append(starts, order.size))
+    edges["packets"] = np.add.reduceat((flows["packets_ab"] + flows["packets_ba"])[order], starts)
+    edges["bytes"] = np.add.reduceat((flows["bytes_ab"] + flows["bytes_ba"])[order], starts)
+    edges["first_seen"] = np.minimum.reduceat(flows["first_seen"][order], starts)
+    edges["last_seen"] = np.maximum.reduceat(flows["last_seen"][order], starts)
+    logger.info(f"Aggregated {flows.size} flows into {edges.size} edges between {channels['addresses'].size} nodes")
+    return TopologyEdges(channels["addresses"], edges)
+
+def connection_types(edges: np.ndarray) -> List[Optional[ConnectionType]]:
+    tcp = edges["protocol"] == 6
+    kinds = np.where(
+        tcp & np.isin(edges["port"], HTTPS_PORTS), 0,
+        np.where(tcp & np.isin(edges["port"], HTTP_PORTS), 1,
+                 np.where(tcp, 2, np.where(edges["protocol"] == 17, 3, 4)))
+    )
+    table = (ConnectionType.HTTPS, ConnectionType.HTTP, ConnectionType.TCP, ConnectionType.UDP, None)
+    return [table[kind] for kind in kinds.tolist()]
+
+def _timestamp(value: float) -> Optional[datetime]:
+    return datetime.utcfromtimestamp(value) if np.isfinite(value) else None
+
+def persist_topology(
+    db: Session,
+    analysis_id: int,
+    topology: TopologyEdges,
+    metadata: Optional[Dict[bytes, Dict]] = None,
+    labels: Optional[Dict[bytes, str]] = None
+) -> Tuple[int, int]:
+    """
+    Replace the topology of an analysis with bulk inserts.
+
+    Node ids come back from the node insert and are kept in an in-memory
+    address -> id map, so edges are written without any per-row query.
+    metadata and labels are keyed by packed address; nodes without a
+    label are labelled with their address.
+
+    Returns:
+        Tuple of (node count, connection count)
+    """
+    metadata = metadata or {}
+    labels = labels or {}
+    db.execute(delete(NetworkConnection).where(NetworkConnection.analysis_id == analysis_id))
+    db.execute(delete(NetworkNode).where(NetworkNode.analysis_id == analysis_id))
+
+    addresses = topology.addresses.tolist()
+    ips = format_ips(topology.addresses)
+    node_rows = [
+        {
+            "analysis_id": analysis_id,
+            "node_id": ip,
+            "label": labels.get(address) or ip,
+            "type": node_type,
+            "status": NodeStatus.ACTIVE,
+            "ip_address": ip,
+            "last_seen": _timestamp(last),
+            "node_metadata": metadata.get(address)
+        }
+        for address, ip, node_type, last in zip(addresses, ips, topology.node_types(), topology.last_seen().tolist())
+    ]
+    node_ids = np.zeros(len(node_rows), dtype=np.int64)
+    index = {ip: i for i, ip in enumerate(ips)}
+    for start in range(0, len(node_rows), TOPOLOGY_INSERT_BATCH):
+        result = db.execute(
+            insert(NetworkNode).returning(NetworkNode.id, NetworkNode.node_id),
+            node_rows[start:start + TOPOLOGY_INSERT_BATCH]
+        )
+        for node_id, ip in result:
+            node_ids[index[ip]] = node_id
+
+    edges = topology.edges
+    columns = zip(
+        node_ids[edges["src"]].tolist(), node_ids[edges["dst"]].tolist(), connection_types(edges),
+        edges["protocol"].tolist(), edges["port"].tolist(), edges["flows"].tolist(),
+        edges["packets"].tolist(), edges["bytes"].tolist(),
+        edges["first_seen"].tolist(), edges["last_seen"].tolist()
+    )
+    edge_rows = [
+        {
+            "analysis_id": analysis_id,
+            "source_id": source,
+            "target_id": target,
+            "connection_type": kind,
+            "status": NodeStatus.ACTIVE,
+            "protocol": PROTOCOL_NAMES.get(proto, str(proto)),
+            "port": port if proto in (6, 17) else None,
+            "flow_count": flow_count,
+            "packets_transferred": packets,
+            "bytes_transferred": size,
+            "first_activity": _timestamp(first),
+            "last_activity": _timestamp(last)
+        }
+        for source, target, kind, proto, port, flow_count, packets, size, first, last in columns
+    ]
+    for start in range(0, len(edge_rows), TOPOLOGY_INSERT_BATCH):
+        db.execute(insert(NetworkConnection), edge_rows[start:start + TOPOLOGY_INSERT_BATCH])
+    db.commit()
+    logger.info(f"Stored {len(node_rows)} nodes and {len(edge_rows)} connections for analysis {analysis_id}")
+    return len(node_rows), len(edge_rows)
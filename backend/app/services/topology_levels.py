@@ -0,0 +1,277 @@
+import os
+import logging
+import threading
+import numpy as np
+import networkx as nx
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from services.pcap_reader import format_ips
+from services.indicators import V4_MAPPED_PREFIX
+from services.topology_builder import TopologyEdges
+from services.graph_analytics import TopologyGraph
+from utils.analysis_storage import get_analysis_dir
+
+logger = logging.getLogger(__name__)
+
+TOPOLOGY_LEVELS_FILENAME = "topology_levels.npz"
+
+# Group levels of each hierarchy, coarsest first; below the last level
+# are the hosts. Subnet levels are (IPv4, IPv6) prefix lengths.
+HIERARCHIES = {
+    "subnet": ("network", "subnet"),
+    "community": ("community",),
+}
+SUBNET_PREFIXES = {"network": (16, 32), "subnet": (24, 48)}
+HOST_LEVEL = "host"
+
+# Edge between two nodes of one level, summed over the host edges below it
+GROUP_EDGE_DTYPE = np.dtype([
+    ("src", "<i8"),
+    ("dst", "<i8"),
+    ("bytes", "<u8"),
+    ("packets", "<u8"),
+    ("flows", "<u8"),
+    ("connections", "<u8"),  # Protocol/port edges aggregated
+])
+
+def topology_levels_path(analysis_dir: str) -> str:
+    return os.path.join(analysis_dir, TOPOLOGY_LEVELS_FILENAME)
+
+def _aggregate(src: np.ndarray, dst: np.ndarray, edges: np.ndarray, width: int) -> np.ndarray:
+    """Sum edges by (src, dst), dropping edges inside one node."""
+    keep = src != dst
+    key = src[keep] * width + dst[keep]
+    unique, inverse = np.unique(key, return_inverse=True)
+    grouped = np.zeros(unique.size, dtype=GROUP_EDGE_DTYPE)
+    grouped["src"], grouped["dst"] = unique // width, unique % width
+    for field in ("bytes", "packets", "flows", "connections"):
+        grouped[field] = np.bincount(inverse, weights=edges[field][keep], minlength=unique.size)
+    return grouped
+
+def _prefix_mask(length: int) -> np.ndarray:
+    bits = np.zeros(128, dtype=np.uint8)
+    bits[:length] = 1
+    return np.packbits(bits)
+
+def _subnets(addresses: np.ndarray, level: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Group of each packed address at a subnet level and the group labels."""
+    v4_length, v6_length = SUBNET_PREFIXES[level]
+    raw = addresses.view(np.uint8).reshape(-1, 16)
+    is_v4 = (raw[:, :12] == V4_MAPPED_PREFIX).all(axis=1)
+    masked = np.where(is_v4[:, None], raw & _prefix_mask(96 + v4_length), raw & _prefix_mask(v6_length))
+    networks, members = np.unique(np.ascontiguousarray(masked).view("S16").ravel(), return_inverse=True)
+    lengths = np.where((networks.view(np.uint8).reshape(-1, 16)[:, :12] == V4_MAPPED_PREFIX).all(axis=1), v4_length, v6_length)
+    labels = [f"{network}/{length}" for network, length in zip(format_ips(networks), lengths.tolist())]
+    return members.ravel(), np.array(labels, dtype=str)
+
+def _communities(count: int, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(count))
+    graph.add_edges_from(
+        (source, target, {"bytes": size})
+        for source, target, size in zip(edges["src"].tolist(), edges["dst"].tolist(), edges["bytes"].tolist())
+    )
+    members = np.zeros(count, dtype=np.int64)
+    communities = TopologyGraph(graph, (0, 0)).communities()
+    for community, nodes in enumerate(communities):
+        members[nodes] = community
+    return members, np.array([f"community:{community}" for community in range(len(communities))], dtype=str)
+
+class TopologyLevels:
+    """
+    Precomputed level-of-detail view of a topology.
+
+    Every host has a group at each level of each hierarchy and the edges
+    of every level are stored pre-aggregated, so the top level of a
+    hierarchy is a lookup and expanding a group only filters the edges of
+    the level below it.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.node_ids: List[str] = arrays["node_ids"].tolist()
+        self.labels = {level: arrays[f"labels:{level}"].tolist() for levels in HIERARCHIES.values() for level in levels}
+        self.index = {level: {label: i for i, label in enumerate(labels)} for level, labels in self.labels.items()}
+
+    @classmethod
+    def build(cls, topology: TopologyEdges) -> "TopologyLevels":
+        count = topology.addresses.size
+        hosts = np.zeros(topology.edges.size, dtype=GROUP_EDGE_DTYPE)
+        for field in ("bytes", "packets", "flows"):
+            hosts[field] = topology.edges[field]
+        hosts["connections"] = 1
+        host_edges = _aggregate(topology.edges["src"], topology.edges["dst"], hosts, max(count, 1))
+        node_bytes = (np.bincount(host_edges["src"], weights=host_edges["bytes"], minlength=count)
+                      + np.bincount(host_edges["dst"], weights=host_edges["bytes"], minlength=count))
+        arrays = {
+            "node_ids": np.array(format_ips(topology.addresses), dtype=str),
+            "node_bytes": node_bytes.astype(np.uint64),
+            f"edges:{HOST_LEVEL}": host_edges
+        }
+        for hierarchy, levels in HIERARCHIES.items():
+            parents = None
+            for level in levels:
+                if hierarchy == "subnet":
+                    members, labels = _subnets(topology.addresses, level)
+                else:
+                    members, labels = _communities(count, host_edges)
+                arrays[f"member:{level}"] = members
+                arrays[f"labels:{level}"] = labels
+                arrays[f"edges:{level}"] = _aggregate(members[host_edges["src"]], members[host_edges["dst"]], host_edges, max(labels.size, 1))
+                arrays[f"size:{level}"] = np.bincount(members, minlength=labels.size)
+                arrays[f"bytes:{level}"] = np.bincount(members, weights=node_bytes, minlength=labels.size).astype(np.uint64)
+                if parents is not None:
+                    # Groups nest, so any host of a group gives its parent
+                    parent = np.zeros(labels.size, dtype=np.int64)
+                    parent[members] = parents
+                    arrays[f"parent:{level}"] = parent
+                parents = members
+        logger.info(f"Built topology levels for {count} hosts and {host_edges.size} host pairs")
+        return cls(arrays)
+
+    def save(self, path: str) -> None:
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, **self.arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TopologyLevels":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def _ancestors(self, levels: Tuple[str, ...], depth: int) -> List[np.ndarray]:
+        """Group at each level above `depth` of every node at `depth` (len(levels) for hosts)."""
+        if depth == len(levels):
+            return [self.arrays[f"member:{level}"] for level in levels]
+        ancestors = [np.arange(len(self.labels[levels[depth]]))]
+        for level in reversed(levels[1:depth + 1]):
+            ancestors.insert(0, self.arrays[f"parent:{level}"][ancestors[0]])
+        return ancestors[:-1]
+
+    def _node(self, level: str, index: int) -> Dict:
+        if level == HOST_LEVEL:
+            return {
+                "id": self.node_ids[index],
+                "level": level,
+                "size": 1,
+                "bytes": int(self.arrays["node_bytes"][index]),
+                "expandable": False
+            }
+        return {
+            "id": self.labels[level][index],
+            "level": level,
+            "size": int(self.arrays[f"size:{level}"][index]),
+            "bytes": int(self.arrays[f"bytes:{level}"][index]),
+            "expandable": True
+        }
+
+    @staticmethod
+    def _edges(edges: np.ndarray, names: List[str]) -> List[Dict]:
+        return [
+            {
+                "source": names[source],
+                "target": names[target],
+                "bytes": size,
+                "packets": packets,
+                "flows": flows,
+                "connections": connections
+            }
+            for source, target, size, packets, flows, connections in zip(
+                edges["src"].tolist(), edges["dst"].tolist(), edges["bytes"].tolist(),
+                edges["packets"].tolist(), edges["flows"].tolist(), edges["connections"].tolist()
+            )
+        ]
+
+    def top(self, hierarchy: str) -> Dict:
+        """Super-nodes of the coarsest level of a hierarchy and the edges between them."""
+        level = HIERARCHIES[hierarchy][0]
+        return {
+            "hierarchy": hierarchy,
+            "group": None,
+            "level": level,
+            "nodes": [self._node(level, i) for i in range(len(self.labels[level]))],
+            "edges": self._edges(self.arrays[f"edges:{level}"], self.labels[level])
+        }
+
+    def expand(self, hierarchy: str, group: str) -> Dict:
+        """
+        Children of a group and their edges.
+
+        Edges leaving the group end at the node the client shows for the
+        other side with the group's ancestors expanded: the first group
+        on the other side's path that differs from the expanded group's.
+        """
+        levels = HIERARCHIES[hierarchy]
+        depth = next((d for d, level in enumerate(levels) if group in self.index[level]), None)
+        if depth is None:
+            raise KeyError(group)
+        index = self.index[levels[depth]][group]
+        child_depth = depth + 1
+        child_level = levels[child_depth] if child_depth < len(levels) else HOST_LEVEL
+        ancestors = self._ancestors(levels, child_depth)
+        path = [ancestor[index] for ancestor in self._ancestors(levels, depth)] + [index]
+
+        edges = self.arrays[f"edges:{child_level}"]
+        inside_src = ancestors[depth][edges["src"]] == index
+        inside_dst = ancestors[depth][edges["dst"]] == index
+        edges = edges[inside_src | inside_dst]
+        children = np.flatnonzero(ancestors[depth] == index)
+
+        # Node ids: children first, then every group of every ancestor level
+        names = [self._node(child_level, i)["id"] for i in children.tolist()]
+        position = np.full(ancestors[depth].size, -1, dtype=np.int64)
+        position[children] = np.arange(children.size)
+        offsets = []
+        for level in levels[:child_depth]:
+            offsets.append(len(names))
+            names += self.labels[level]
+
+        def shown(nodes: np.ndarray) -> np.ndarray:
+            result = position[nodes].copy()
+            unresolved = result < 0
+            for d in range(depth + 1):
+                groups = ancestors[d][nodes]
+                diverged = unresolved & (groups != path[d])
+                result[diverged] = offsets[d] + groups[diverged]
+                unresolved &= ~diverged
+            return result
+
+        return {
+            "hierarchy": hierarchy,
+            "group": group,
+            "level": child_level,
+            "nodes": [self._node(child_level, i) for i in children.tolist()],
+            "edges": self._edges(_aggregate(shown(edges["src"]), shown(edges["dst"]), edges, len(names)), names)
+        }
+
+class TopologyLevelsCache:
+    """
+    Per-process LRU of loaded topology levels.
+
+    get() stats the stored levels and reloads them when they were
+    rewritten since they were cached, e.g. by a topology rebuild.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.GRAPH_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._levels: "OrderedDict[int, Tuple[int, TopologyLevels]]" = OrderedDict()
+
+    def get(self, analysis_id: int) -> TopologyLevels:
+        """Topology levels of an analysis; FileNotFoundError if none were stored."""
+        path = topology_levels_path(get_analysis_dir(analysis_id, create=False))
+        version = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._levels.get(analysis_id)
+            if cached is not None and cached[0] == version:
+                self._levels.move_to_end(analysis_id)
+                return cached[1]
+
+        levels = TopologyLevels.load(path)
+        with self._lock:
+            self._levels[analysis_id] = (version, levels)
+            self._levels.move_to_end(analysis_id)
+            while len(self._levels) > self.size:
+                self._levels.popitem(last=False)
+        return levels
@@ -1,8 +1,11 @@
 import logging
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
 from models import File, NetworkAnalysis, MemoryAnalysis
 from core.enums import AnalysisStatus
+from utils.analysis_storage import get_analysis_dir
+from services.timeseries import TimeSeriesStore, timeseries_dir
 
 logger = logging.getLogger(__name__)
 
@@ -72,4 +75,55 @@ class VisualizationService:
             
         except Exception as e:
             logger.error(f"Failed to get analysis timeline: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+
+    def generate_timeseries_data(
+        self,
+        analysis_id: int,
+        metric: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        max_points: int = 1000
+    ) -> Optional[Dict]:
+        """
+        Get a traffic series from the buckets stored at analysis time.
+
+        Analyses still in progress are served too: a followed capture has
+        its series written as it grows.
+
+        Returns None if the analysis does not exist.
+
+        Raises:
+            TimeSeriesError: If no series were stored for the analysis (yet)
+            ValueError: If the metric or window is invalid
+        """
+        analysis = self.db.query(NetworkAnalysis).filter(
+            NetworkAnalysis.id == analysis_id
+        ).first()
+        if not analysis:
+            return None
+
+        series = TimeSeriesStore(timeseries_dir(get_analysis_dir(analysis_id, create=False)))
+        data = series.query(
+            metric,
+            start=_epoch(start_time),
+            end=_epoch(end_time),
+            max_points=max_points
+        )
+        return {
+            "timestamps": [datetime.fromtimestamp(t, tz=timezone.utc) for t in data["timestamps"]],
+            "values": data["values"],
+            "metadata": {
+                "metric": metric,
+                "resolution": data["resolution"],
+                "series": series.series
+            }
+        }
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    """Epoch seconds of a datetime; naive values are taken as UTC like capture timestamps."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
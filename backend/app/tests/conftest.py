@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Modules import each other from the app directory, as when it is served
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.auth import get_current_user, TokenData
+from core.db import get_db
+from models import Base, User, File, NetworkAnalysis
+from core.enums import AnalysisStatus
+from api import network
+from services.network_metrics import MetricsCache
+
+@pytest.fixture
+def db():
+    """Session on an in-memory database with every table created."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """Client for the network API, authenticated and bound to db."""
+    # Cached metrics must not leak from one test's database into the next
+    monkeypatch.setattr(network.network_service, "metrics", MetricsCache(ttl=0))
+    app = FastAPI()
+    app.include_router(network.router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="analyst")
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def analysis(db):
+    """A completed network analysis of an uploaded capture."""
+    user = User(username="analyst", email="analyst@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    capture = File(filename="capture.pcap", file_type="network_capture", size=0, user_id=user.id)
+    db.add(capture)
+    db.flush()
+    analysis = NetworkAnalysis(file_id=capture.id, status=AnalysisStatus.COMPLETED)
+    db.add(analysis)
+    db.commit()
+    return analysis
@@ -0,0 +1,28 @@
+import pytest
+from models import NetworkArtifact
+from services.artifacts import artifact_match
+
+@pytest.fixture
+def artifacts(db, analysis):
+    for artifact_type, value in (("dns_query", "www.example.com"), ("http_uri", "/Login.PHP")):
+        db.add(NetworkArtifact(
+            analysis_id=analysis.id, artifact_type=artifact_type, value=value,
+            value_reversed=value[::-1] if artifact_type == "dns_query" else None,
+            src_ip="10.0.0.1", dst_ip="10.0.0.2", protocol=6
+        ))
+    db.commit()
+
+def _values(db, q, match):
+    return sorted(a.value for a in db.query(NetworkArtifact).filter(artifact_match(q, match)))
+
+@pytest.mark.parametrize("q, match, expected", [
+    ("WWW.Example.COM.", "exact", ["www.example.com"]),
+    (" www.example.com", "exact", ["www.example.com"]),
+    ("/Login.PHP", "exact", ["/Login.PHP"]),
+    ("/login.php", "exact", []),
+    ("WWW.EXAMPLE", "prefix", ["www.example.com"]),
+    ("/Login", "prefix", ["/Login.PHP"]),
+    ("Example.com.", "suffix", ["www.example.com"]),
+])
+def test_domain_queries_are_normalized(db, artifacts, q, match, expected):
+    assert _values(db, q, match) == expected
@@ -0,0 +1,48 @@
+import io
+import asyncio
+import pytest
+from starlette.datastructures import UploadFile
+from core.config import settings
+from api import endpoint
+
+def test_unexpected_item_error_fails_only_that_item(monkeypatch):
+    def broken(content):
+        raise RuntimeError("libmagic is unavailable")
+
+    monkeypatch.setattr(endpoint, "inspect_content", broken)
+    stored = []
+    item = asyncio.run(endpoint.validate_batch_item(
+        UploadFile(io.BytesIO(b"data"), filename="capture.pcap"), asyncio.Semaphore(1), stored
+    ))
+    assert item == {"filename": "capture.pcap", "status": "failed", "detail": "Failed to process file"}
+    assert stored == []
+
+def test_oversized_item_rejected_before_reading(monkeypatch):
+    class Unreadable(io.BytesIO):
+        def read(self, *args):
+            raise AssertionError("oversized upload was read")
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 16)
+    stored = []
+    item = asyncio.run(endpoint.validate_batch_item(
+        UploadFile(Unreadable(), size=17, filename="capture.pcap"), asyncio.Semaphore(1), stored
+    ))
+    assert item == {"filename": "capture.pcap", "status": "rejected", "detail": "File size 17 exceeds limit of 16"}
+    assert stored == []
+
+def test_stored_files_removed_when_batch_fails(monkeypatch, tmp_path):
+    evidence = tmp_path / "capture.pcap"
+    evidence.write_bytes(b"data")
+
+    async def store_then_fail(file, semaphore, stored):
+        if file.filename == "capture.pcap":
+            stored.append(str(evidence))
+            return {"filename": file.filename, "status": "accepted", "path": str(evidence)}
+        await asyncio.sleep(0)
+        raise RuntimeError("worker lost")
+
+    monkeypatch.setattr(endpoint, "validate_batch_item", store_then_fail)
+    files = [UploadFile(io.BytesIO(b"data"), filename=name) for name in ("capture.pcap", "memory.raw")]
+    with pytest.raises(RuntimeError):
+        asyncio.run(endpoint.upload_batch(files=files, current_user=None, db=None))
+    assert not evidence.exists()
@@ -0,0 +1,127 @@
+import random
+import numpy as np
+from models import NetworkFlow
+from services import flow_table
+from services.flow_table import FlowTable, persist_flows
+from services.pcap_reader import PACKET_DTYPE, format_ip, pack_ip
+
+def make_packets(rows):
+    """PACKET_DTYPE array from (ts, src, dst, sport, dport, protocol, length, flags) tuples."""
+    packets = np.zeros(len(rows), dtype=PACKET_DTYPE)
+    for i, (ts, src, dst, sport, dport, protocol, length, flags) in enumerate(rows):
+        packets[i] = (ts, pack_ip(src), pack_ip(dst), sport, dport, protocol, 6 if ":" in src else 4,
+                      flags, length, length, 0, 0, 0, 0)
+    return packets
+
+def random_packets(count, seed=1):
+    """Traffic between a few hosts and services, in both directions and out of time order."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        client, server = f"10.0.0.{rng.randint(1, 30)}", rng.choice(["10.0.1.1", "10.0.1.2", "2001:db8::1"])
+        if ":" in server:
+            client = f"2001:db8::{rng.randint(2, 30):x}"
+        sport, dport = rng.randint(40000, 40020), rng.choice([53, 80, 443])
+        protocol = 17 if dport == 53 else 6
+        row = (rng.uniform(0, 100), client, server, sport, dport, protocol, rng.randint(60, 1500), rng.choice([2, 16, 24]))
+        if rng.random() < 0.5:
+            row = (row[0], server, client, dport, sport) + row[5:]
+        rows.append(row)
+    return make_packets(rows)
+
+def brute_force_flows(packets):
+    """Per-session totals keyed by unordered endpoints, computed packet by packet."""
+    flows = {}
+    for pkt in packets:
+        ends = sorted([(pkt["src_ip"], int(pkt["src_port"])), (pkt["dst_ip"], int(pkt["dst_port"]))])
+        key = (ends[0][0], ends[1][0], ends[0][1], ends[1][1], int(pkt["protocol"]))
+        flow = flows.setdefault(key, [0, 0, 0, 0])
+        forward = (pkt["src_ip"], int(pkt["src_port"])) == ends[0]
+        flow[0 if forward else 1] += 1
+        flow[2 if forward else 3] += int(pkt["length"])
+    return flows
+
+def table_totals(table):
+    return {
+        (f["a_ip"], f["b_ip"], int(f["a_port"]), int(f["b_port"]), int(f["protocol"])):
+            [int(f["packets_ab"]), int(f["packets_ba"]), int(f["bytes_ab"]), int(f["bytes_ba"])]
+        for f in table.flows
+    }
+
+def test_both_directions_aggregate_into_one_flow():
+    table = FlowTable()
+    table.add_batch(make_packets([
+        (1.0, "10.0.0.1", "10.0.1.1", 40000, 443, 6, 100, 0x02),
+        (1.1, "10.0.1.1", "10.0.0.1", 443, 40000, 6, 200, 0x12),
+        (1.2, "10.0.0.1", "10.0.1.1", 40000, 443, 6, 300, 0x10),
+        (1.3, "10.0.0.1", "10.0.1.1", 40001, 443, 6, 50, 0x02),
+    ]))
+    assert len(table) == 2
+    [row] = [r for r in flow_table.flow_rows(table.to_array(), 1) if r["src_port"] == 40000]
+    assert (row["src_ip"], row["dst_ip"], row["dst_port"]) == ("10.0.0.1", "10.0.1.1", 443)
+    assert (row["packets_sent"], row["packets_received"]) == (2, 1)
+    assert (row["bytes_sent"], row["bytes_received"]) == (400, 200)
+    assert row["tcp_flags"] == 0x12
+    assert (row["first_seen"], row["last_seen"]) == (1.0, 1.2)
+
+def test_aggregates_match_a_packet_by_packet_count():
+    packets = random_packets(5000)
+    # A small table grows and probes past collisions along the way
+    table = FlowTable(capacity=16)
+    for start in range(0, packets.size, 700):
+        table.add_batch(packets[start:start + 700])
+    assert table_totals(table) == brute_force_flows(packets)
+
+def test_initiator_is_the_sender_of_the_earliest_packet():
+    table = FlowTable()
+    # The server's reply arrives in an earlier batch but carries a later timestamp
+    table.add_batch(make_packets([(5.0, "10.0.1.1", "10.0.0.9", 443, 40000, 6, 60, 0x12)]))
+    table.add_batch(make_packets([(4.0, "10.0.0.9", "10.0.1.1", 40000, 443, 6, 60, 0x02)]))
+    # Within a batch, order by timestamp rather than position
+    table.add_batch(make_packets([
+        (7.0, "10.0.0.1", "10.0.0.2", 5000, 6000, 17, 80, 0),
+        (6.0, "10.0.0.2", "10.0.0.1", 6000, 5000, 17, 80, 0),
+    ]))
+    rows = {(r["src_ip"], r["src_port"]): r for r in flow_table.flow_rows(table.to_array(), 1)}
+    assert set(rows) == {("10.0.0.9", 40000), ("10.0.0.2", 6000)}
+    assert rows[("10.0.0.9", 40000)]["first_seen"] == 4.0
+
+def test_merged_shards_equal_one_table():
+    packets = random_packets(4000, seed=2)
+    whole = FlowTable()
+    whole.add_batch(packets)
+
+    merged = FlowTable(capacity=16)
+    for start in range(0, packets.size, 1000):
+        shard = FlowTable(capacity=16)
+        shard.add_batch(packets[start:start + 1000])
+        merged.merge(shard)
+    merged.merge(FlowTable())
+    assert merged.to_array().tolist() == whole.to_array().tolist()
+
+def test_flows_persist_in_canonical_order_across_insert_batches(db, analysis, monkeypatch):
+    monkeypatch.setattr(flow_table, "FLOW_INSERT_BATCH", 3)
+    executed = []
+    execute = db.execute
+
+    def counting_execute(statement, *args, **kwargs):
+        if args and isinstance(args[0], list):
+            executed.append(len(args[0]))
+        return execute(statement, *args, **kwargs)
+    monkeypatch.setattr(db, "execute", counting_execute)
+
+    table = FlowTable()
+    table.add_batch(make_packets([
+        (float(10 - i), f"10.0.0.{i + 1}", "10.0.1.1", 40000 + i, 443, 6, 100, 0x02) for i in range(8)
+    ]))
+    # Matches are given per row of table.flows, in insertion order
+    indicators = [[{"indicator": format_ip(f["a_ip"])}] if i % 2 else None for i, f in enumerate(table.flows)]
+    assert persist_flows(db, analysis.id, table, indicators=indicators) == 8
+    assert executed == [3, 3, 2]
+
+    stored = db.query(NetworkFlow).order_by(NetworkFlow.id).all()
+    assert [flow.first_seen for flow in stored] == [float(t) for t in range(3, 11)]
+    for flow in stored:
+        if flow.indicators:
+            assert flow.indicators == [{"indicator": flow.src_ip}] and flow.indicator_count == 1
+    assert sum(1 for flow in stored if flow.indicators) == 4
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from core.config import settings
+from models import NetworkConnection, NetworkNode
+from services import graph_layout
+from services.graph_layout import _repulsion_exact, _repulsion_grid, force_layout, layout_topology
+
+def clustered_points(count, seed):
+    """Dense clusters, so the grid has crowded and empty cells at every level."""
+    rng = np.random.default_rng(seed)
+    centres = np.array([[0.2, 0.2], [0.8, 0.3], [0.5, 0.8], [0.1, 0.9]])
+    return np.concatenate([rng.normal(centre, 0.03, (count // 4, 2)) for centre in centres])
+
+@pytest.mark.parametrize("points", [
+    lambda: np.random.default_rng(1).random((2000, 2)),
+    lambda: clustered_points(3000, 2),
+])
+def test_grid_repulsion_approximates_every_pair(points):
+    pos = points()
+    k2 = 1 / pos.shape[0]
+    exact, approximate = _repulsion_exact(pos, k2), _repulsion_grid(pos, k2)
+    error = np.linalg.norm(exact - approximate, axis=1) / np.linalg.norm(exact, axis=1)
+    # A cell counted twice or missed would be off by far more than the centroid error
+    assert np.median(error) < 0.01
+    assert np.linalg.norm(exact - approximate) / np.linalg.norm(exact) < 0.01
+
+def two_cliques(size=10):
+    """Two cliques joined by a single edge."""
+    pairs = [(a, b) for offset in (0, size) for a in range(offset, offset + size) for b in range(a + 1, offset + size)]
+    pairs.append((0, size))
+    sources, targets = np.array(pairs).T
+    return 2 * size, sources, targets
+
+def test_force_layout_separates_communities():
+    count, sources, targets = two_cliques()
+    steps = list(force_layout(count, sources, targets, iterations=60, every=25))
+    assert [iteration for iteration, _ in steps] == [25, 50, 60]
+    positions = steps[-1][1]
+    assert positions.min() >= 0 and positions.max() <= 1 + 1e-9
+    assert np.isclose(positions.max(axis=0).max(), 1)
+
+    first, second = positions[:10].mean(axis=0), positions[10:].mean(axis=0)
+    spread = max(np.linalg.norm(positions[:10] - first, axis=1).max(), np.linalg.norm(positions[10:] - second, axis=1).max())
+    assert np.linalg.norm(first - second) > spread
+
+    # The same seed gives the same layout
+    again = list(force_layout(count, sources, targets, iterations=60, every=25))[-1][1]
+    assert (again == positions).all()
+
+def test_seeded_positions_are_kept_where_given():
+    count, sources, targets = two_cliques()
+    settled = list(force_layout(count, sources, targets, iterations=60))[-1][1]
+    seeded = settled.copy()
+    seeded[3] = np.nan
+    # Starting from a settled layout the picture barely moves
+    relaid = list(force_layout(count, sources, targets, positions=seeded, iterations=5, seed=9))[-1][1]
+    moved = np.linalg.norm(relaid - settled, axis=1)
+    assert np.median(moved) < 0.1
+    assert not np.isnan(relaid).any()
+
+def test_single_node_sits_in_the_centre():
+    [(iteration, positions)] = force_layout(1, np.array([], dtype=np.int64), np.array([], dtype=np.int64), iterations=5)
+    assert iteration == 5 and positions.tolist() == [[0.5, 0.5]]
+
+def test_layout_topology_stores_every_intermediate_result(db, analysis, monkeypatch):
+    monkeypatch.setattr(settings, "LAYOUT_ITERATIONS", 20)
+    monkeypatch.setattr(settings, "LAYOUT_PUBLISH_INTERVAL", 10)
+    nodes = [
+        NetworkNode(node_id=f"10.0.0.{i}", label=f"10.0.0.{i}", analysis_id=analysis.id,
+                    coordinates=[0.5, 0.5] if i == 1 else None)
+        for i in range(1, 5)
+    ]
+    db.add_all(nodes)
+    db.flush()
+    # A parallel edge, a reverse edge and a self loop add no pull of their own
+    db.add_all([
+        NetworkConnection(analysis_id=analysis.id, source_id=nodes[a].id, target_id=nodes[b].id, port=port)
+        for a, b, port in [(0, 1, 80), (0, 1, 443), (1, 0, 53), (2, 3, 80), (2, 2, 80)]
+    ])
+    db.commit()
+
+    progress, stored = [], []
+    def on_progress(iteration, iterations, node_ids, positions):
+        progress.append((iteration, iterations, node_ids))
+        stored.append([node.coordinates for node in db.query(NetworkNode).order_by(NetworkNode.id)])
+        assert stored[-1] == positions.tolist()
+
+    layout = []
+    force = graph_layout.force_layout
+    def recording_layout(count, sources, targets, **kwargs):
+        layout.append((sources.tolist(), targets.tolist(), kwargs["positions"].tolist()))
+        return force(count, sources, targets, **kwargs)
+    monkeypatch.setattr(graph_layout, "force_layout", recording_layout)
+
+    assert layout_topology(db, analysis.id, on_progress=on_progress) == 4
+    assert [(i, n) for i, n, _ in progress] == [(10, 20), (20, 20)]
+    assert progress[0][2] == [node.node_id for node in nodes]
+    [(sources, targets, seeded)] = layout
+    assert list(zip(sources, targets)) == [(0, 1), (2, 3)]
+    assert seeded[0] == [0.5, 0.5] and np.isnan(seeded[1]).all()
+    assert all(round(value, graph_layout.LAYOUT_PRECISION) == value for row in stored[-1] for value in row)
+    assert layout_topology(db, analysis.id + 1) == 0
@@ -0,0 +1,156 @@
+import os
+import random
+import networkx as nx
+import numpy as np
+import pytest
+from core.config import settings
+from services.graph_queries import GraphIndex, GraphIndexCache, graph_index_path
+from services.pcap_reader import pack_ip
+from services.topology_builder import EDGE_DTYPE, TopologyEdges
+
+NODES = 40
+
+def random_topology(seed, edge_count=90):
+    """Sparse random host graph with parallel protocol edges, self loops and activity windows."""
+    rng = random.Random(seed)
+    addresses = np.array(sorted(pack_ip(f"10.0.0.{i + 1}") for i in range(NODES)), dtype="S16")
+    edges = np.zeros(edge_count, dtype=EDGE_DTYPE)
+    for i in range(edge_count):
+        src, dst = rng.randrange(NODES), rng.randrange(NODES)
+        first = rng.uniform(0, 1000)
+        edges[i] = (src, dst, rng.choice([6, 17]), rng.choice([53, 80, 443]), 1, 1,
+                    rng.randint(100, 10_000), first, first + rng.uniform(0, 200))
+    return TopologyEdges(addresses, edges)
+
+def host_graph(index):
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(len(index.node_ids)))
+    graph.add_edges_from(zip(index.src.tolist(), index.dst.tolist()))
+    return graph
+
+def search_graph(graph, direction):
+    return {"out": graph, "in": graph.reverse(copy=True), "both": graph.to_undirected()}[direction]
+
+def brute_force_arrival(index, origin, target, start):
+    """Earliest arrival by relaxing every edge until nothing improves."""
+    arrival = [np.inf] * len(index.node_ids)
+    arrival[origin] = -np.inf if start is None else start
+    first_seen, last_seen = index.arrays["first_seen"].tolist(), index.arrays["last_seen"].tolist()
+    changed = True
+    while changed:
+        changed = False
+        for edge, (u, v) in enumerate(zip(index.src.tolist(), index.dst.tolist())):
+            if arrival[u] < np.inf and last_seen[edge] >= arrival[u]:
+                at = max(arrival[u], first_seen[edge])
+                if at < arrival[v]:
+                    arrival[v], changed = at, True
+    return arrival[target]
+
+@pytest.fixture(params=[1, 2, 3])
+def index(request):
+    return GraphIndex.build(random_topology(request.param))
+
+def test_parallel_edges_merge_into_one_host_pair():
+    topology = random_topology(1)
+    index = GraphIndex.build(topology)
+    edges = topology.edges[topology.edges["src"] != topology.edges["dst"]]
+    pairs = {}
+    for edge in edges:
+        pair = pairs.setdefault((int(edge["src"]), int(edge["dst"])), [0, np.inf, -np.inf])
+        pair[0] += int(edge["bytes"])
+        pair[1], pair[2] = min(pair[1], edge["first_seen"]), max(pair[2], edge["last_seen"])
+    built = {
+        (s, d): [b, f, l] for s, d, b, f, l in zip(
+            index.src.tolist(), index.dst.tolist(), index.arrays["bytes"].tolist(),
+            index.arrays["first_seen"].tolist(), index.arrays["last_seen"].tolist()
+        )
+    }
+    assert built == pairs
+
+@pytest.mark.parametrize("direction", ["out", "in", "both"])
+def test_shortest_path_matches_networkx(index, direction):
+    graph = search_graph(host_graph(index), direction)
+    for source in range(0, NODES, 3):
+        lengths = nx.single_source_shortest_path_length(graph, source)
+        for target in range(NODES):
+            path = index.shortest_path(index.node_ids[source], index.node_ids[target], direction)
+            if target not in lengths:
+                assert path is None
+                continue
+            assert path["hops"] == lengths[target]
+            nodes = [index.node(node) for node in path["nodes"]]
+            assert nodes[0] == source and nodes[-1] == target
+            assert all(graph.has_edge(u, v) for u, v in zip(nodes, nodes[1:]))
+            limited = index.shortest_path(index.node_ids[source], index.node_ids[target], direction, max_hops=1)
+            assert (limited is not None) == (lengths[target] <= 1)
+
+@pytest.mark.parametrize("direction", ["out", "in", "both"])
+def test_reachable_matches_networkx(index, direction):
+    graph = search_graph(host_graph(index), direction)
+    for source in range(0, NODES, 5):
+        for hops in (1, 2, 4):
+            lengths = nx.single_source_shortest_path_length(graph, source, cutoff=hops)
+            expected = sorted(lengths.items(), key=lambda item: (item[1], item[0]))
+            reached = index.reachable(index.node_ids[source], hops, direction)
+            assert [(index.node(item["node"]), item["hops"]) for item in reached] == expected
+
+@pytest.mark.parametrize("start", [None, 300.0])
+def test_temporal_path_arrives_earliest(index, start):
+    first_seen, last_seen = index.arrays["first_seen"], index.arrays["last_seen"]
+    for source in range(0, NODES, 4):
+        for target in range(NODES):
+            expected = brute_force_arrival(index, source, target, start)
+            path = index.temporal_path(index.node_ids[source], index.node_ids[target], start=start)
+            if source == target:
+                assert path["hops"] == 0
+                continue
+            if not np.isfinite(expected):
+                assert path is None
+                continue
+            assert path["arrival"] == pytest.approx(expected)
+            # Each hop is taken while its edge is active and no earlier than the last
+            at = -np.inf if start is None else start
+            nodes = [index.node(node) for node in path["nodes"]]
+            for u, v, edge in zip(nodes, nodes[1:], path["edges"]):
+                [edge_id] = np.flatnonzero((index.src == u) & (index.dst == v))
+                assert last_seen[edge_id] >= at
+                at = max(at, first_seen[edge_id])
+                assert edge["at"] == pytest.approx(at)
+            assert at == pytest.approx(expected)
+
+def test_shared_peers_match_a_brute_force_count(index):
+    graph = host_graph(index).to_undirected()
+    graph.remove_edges_from(nx.selfloop_edges(graph))
+    for node in range(0, NODES, 3):
+        for max_degree in (2, 4):
+            rare = sorted(peer for peer in graph[node] if graph.degree(peer) <= max_degree)
+            shared = {}
+            for peer in rare:
+                for host in graph[peer]:
+                    if host != node:
+                        shared.setdefault(host, []).append(peer)
+            ranked = sorted(shared, key=lambda host: (-len(shared[host]), host))[:5]
+            result = index.shared_peers(index.node_ids[node], max_degree, limit=5)
+            assert [index.node(peer) for peer in result["peers"]] == rare
+            assert [
+                (index.node(item["node"]), item["shared"], [index.node(peer) for peer in item["peers"]])
+                for item in result["nodes"]
+            ] == [(host, len(shared[host]), shared[host]) for host in ranked]
+
+def test_cache_reloads_rewritten_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_DATA_DIR", str(tmp_path))
+    path = graph_index_path(str(tmp_path / "7"))
+    (tmp_path / "7").mkdir()
+    cache = GraphIndexCache(size=1)
+    with pytest.raises(FileNotFoundError):
+        cache.get(7)
+
+    GraphIndex.build(random_topology(1)).save(path)
+    first = cache.get(7)
+    assert cache.get(7) is first
+    GraphIndex.build(random_topology(2)).save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = cache.get(7)
+    assert second is not first
+    assert second.src.tolist() == GraphIndex.load(path).src.tolist()
@@ -0,0 +1,126 @@
+import os
+import random
+import numpy as np
+from services.flow_table import FLOW_DTYPE
+from services.indicators import IndicatorMatcher, IndicatorSet, match_flows
+from services.pcap_reader import pack_ip
+
+def write_set(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+def brute_force_lookup(indicators, address):
+    """Id of the longest indicator covering address, first on ties, by 128-bit arithmetic."""
+    value = int.from_bytes(address.ljust(16, b"\0"), "big")
+    best = -1
+    for i, (network, length) in enumerate(zip(indicators.networks.tolist(), indicators.lengths.tolist())):
+        mask = ((1 << 128) - 1) ^ ((1 << (128 - length)) - 1)
+        if value & mask == int.from_bytes(network.ljust(16, b"\0"), "big") & mask:
+            if best < 0 or length > indicators.lengths[best]:
+                best = i
+    return best
+
+def random_table(rng, default_route):
+    lines = ["# mixed IPv4/IPv6 feed", "", "not-an-address", "10.0.0.0/33"]
+    for _ in range(60):
+        if rng.random() < 0.6:
+            prefix = rng.choice([8, 12, 16, 20, 24, 28, 32])
+            lines.append(f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}/{prefix},v4")
+        else:
+            prefix = rng.choice([16, 32, 48, 64, 96, 112, 128])
+            lines.append(f"2001:db8:{rng.randint(0, 3):x}::{rng.randint(0, 0xffff):x}/{prefix},v6")
+    if default_route:
+        lines.append("::/0,everything")
+    return lines
+
+def random_addresses(rng, count=2000):
+    addresses = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            addresses.append(pack_ip(f"10.{rng.randint(0, 4)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"))
+        else:
+            addresses.append(pack_ip(f"2001:db8:{rng.randint(0, 4):x}::{rng.randint(0, 0xffff):x}"))
+    return np.array(addresses, dtype="S16")
+
+def test_longest_prefix_match_over_mixed_tables(tmp_path):
+    rng = random.Random(11)
+    for default_route in (False, True):
+        indicators = IndicatorSet.from_file(write_set(tmp_path / "feed.txt", random_table(rng, default_route)))
+        assert len(indicators) == (61 if default_route else 60)
+        addresses = random_addresses(rng)
+        # Addresses equal to the networks themselves hit the longest prefixes
+        addresses = np.concatenate([addresses, indicators.networks])
+        expected = [brute_force_lookup(indicators, address) for address in addresses.tolist()]
+        assert indicators.lookup(addresses).tolist() == expected
+        order = np.argsort(addresses)
+        assert indicators.lookup(addresses[order]).tolist() == np.array(expected)[order].tolist()
+
+def test_default_route_covers_ipv4_only_when_nothing_longer_matches(tmp_path):
+    indicators = IndicatorSet.from_file(write_set(tmp_path / "feed.txt", [
+        "::/0,any", "10.0.0.0/8,internal", "2001:db8::/32,docs", "10.1.2.3/8,host bits ignored"
+    ]))
+    ids = indicators.lookup(np.array([
+        pack_ip("10.9.9.9"), pack_ip("192.0.2.1"), pack_ip("2001:db8::1"), pack_ip("2600::1")
+    ], dtype="S16")).tolist()
+    assert [indicators.indicator(i) for i in ids] == ["10.0.0.0/8", "::/0", "2001:db8::/32", "::/0"]
+    assert [indicators.label(i) for i in ids] == ["internal", "any", "docs", "any"]
+
+    # Without the default route unmatched IPv4 stays clean
+    indicators = IndicatorSet.from_file(write_set(tmp_path / "feed.txt", ["2001:db8::/32", "10.0.0.5"]))
+    ids = indicators.lookup(np.array([pack_ip("192.0.2.1"), pack_ip("10.0.0.5")], dtype="S16")).tolist()
+    assert ids[0] == -1 and indicators.indicator(ids[1]) == "10.0.0.5"
+
+def test_refresh_reloads_changed_sets_only(tmp_path):
+    matcher = IndicatorMatcher(str(tmp_path))
+    feed = write_set(tmp_path / "feed.txt", ["10.0.0.0/8,internal"])
+    write_set(tmp_path / "notes.md", ["192.0.2.1"])
+    address = np.array([pack_ip("192.0.2.1")], dtype="S16")
+
+    assert matcher.refresh()
+    assert set(matcher.sets) == {"feed"}
+    assert not matcher.refresh()
+    assert matcher.match(address)["feed"].tolist() == [-1]
+
+    loaded = matcher.sets["feed"]
+    write_set(tmp_path / "feed.txt", ["10.0.0.0/8,internal", "192.0.2.0/24,scanner"])
+    stat = os.stat(feed)
+    os.utime(feed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    write_set(tmp_path / "extra.csv", ["2001:db8::/32"])
+    assert matcher.refresh()
+    assert set(matcher.sets) == {"feed", "extra"}
+    assert matcher.sets["feed"] is not loaded
+    assert matcher.sets["feed"].label(matcher.match(address)["feed"][0]) == "scanner"
+
+    extra = matcher.sets["extra"]
+    os.remove(feed)
+    assert matcher.refresh()
+    assert set(matcher.sets) == {"extra"} and matcher.sets["extra"] is extra
+
+def make_flows(rows):
+    flows = np.zeros(len(rows), dtype=FLOW_DTYPE)
+    for i, (a, b, initiator, total) in enumerate(rows):
+        flows[i]["a_ip"], flows[i]["b_ip"] = pack_ip(a), pack_ip(b)
+        flows[i]["initiator"] = initiator
+        flows[i]["bytes_ab"] = total
+    return flows
+
+def test_match_flows_tags_endpoints_and_summarizes(tmp_path):
+    write_set(tmp_path / "feed.txt", ["10.0.0.0/8,internal", "192.0.2.7,c2"])
+    matcher = IndicatorMatcher(str(tmp_path))
+    matcher.refresh()
+    flows = make_flows([
+        ("10.0.0.1", "192.0.2.7", 0, 100),   # both endpoints match, different indicators
+        ("10.0.0.2", "10.0.0.3", 1, 50),     # both endpoints match the same indicator
+        ("172.16.0.1", "192.0.2.7", 1, 500),  # b initiated, so it is stored as src
+        ("172.16.0.1", "172.16.0.2", 0, 10),
+    ])
+    tags, summary = match_flows(matcher, flows)
+    assert tags[3] is None
+    assert [(t["indicator"], t["endpoint"]) for t in tags[0]] == [("10.0.0.0/8", "src"), ("192.0.2.7", "dst")]
+    assert [t["endpoint"] for t in tags[1]] == ["dst", "src"]
+    assert tags[2] == [{"set": "feed", "indicator": "192.0.2.7", "label": "c2", "endpoint": "src"}]
+    assert summary == [
+        {"set": "feed", "indicator": "192.0.2.7", "label": "c2", "flows": 2, "bytes": 600, "addresses": ["192.0.2.7"]},
+        {"set": "feed", "indicator": "10.0.0.0/8", "label": "internal", "flows": 2, "bytes": 150,
+         "addresses": ["10.0.0.1", "10.0.0.2", "10.0.0.3"]},
+    ]
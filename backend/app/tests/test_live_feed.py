@@ -0,0 +1,59 @@
+import json
+import asyncio
+from services.live_feed import LiveFeedHub
+
+METRICS = {"total_bytes": 4096, "unique_ips": 3, "protocols": {"TCP": 10}}
+
+def test_first_message_is_snapshot_of_stored_metrics():
+    async def scenario():
+        hub = LiveFeedHub()
+        async with hub.subscribe(7, {"metrics": METRICS}) as subscriber:
+            snapshot = json.loads(await asyncio.wait_for(subscriber.next(), 1))
+            assert snapshot == {"analysis_id": 7, "snapshot": True, "metrics": METRICS}
+
+            hub.feeds[7].publish({"analysis_id": 7, "metrics": {**METRICS, "protocols": {"TCP": 12}}})
+            delta = json.loads(await asyncio.wait_for(subscriber.next(), 1))
+            assert delta == {"analysis_id": 7, "metrics": {"protocols": {"TCP": 12}}}
+        assert not hub.feeds
+
+    asyncio.run(scenario())
+    # The feed merged the update into its own copy
+    assert METRICS["protocols"] == {"TCP": 10}
+
+def test_live_state_wins_over_stored_metrics():
+    async def scenario():
+        hub = LiveFeedHub()
+        async with hub.subscribe(7) as first:
+            hub.feeds[7].publish({"metrics": {"unique_ips": 5}})
+            await asyncio.wait_for(first.next(), 1)
+            async with hub.subscribe(7, {"metrics": METRICS}) as second:
+                snapshot = json.loads(await asyncio.wait_for(second.next(), 1))
+                assert snapshot["metrics"] == {"unique_ips": 5}
+
+    asyncio.run(scenario())
+
+def test_layout_is_forwarded_but_kept_out_of_the_state():
+    def layout(iteration):
+        return {"analysis_id": 7, "layout": {"iteration": iteration, "positions": {"10.0.0.1": [0.1 * iteration, 0.5]}}}
+
+    async def scenario():
+        hub = LiveFeedHub()
+        async with hub.subscribe(7, {"metrics": METRICS}) as subscriber:
+            feed = hub.feeds[7]
+            await asyncio.wait_for(subscriber.next(), 1)
+            feed.publish_layout(layout(1))
+            assert json.loads(await asyncio.wait_for(subscriber.next(), 1)) == layout(1)
+
+            # A client that is behind gets the latest layout after the state
+            feed.publish_layout(layout(2))
+            feed.publish({"metrics": {"unique_ips": 4}})
+            feed.publish_layout(layout(3))
+            assert json.loads(await asyncio.wait_for(subscriber.next(), 1)) == {"analysis_id": 7, "metrics": {"unique_ips": 4}}
+            assert json.loads(await asyncio.wait_for(subscriber.next(), 1)) == layout(3)
+            assert "layout" not in feed.state
+
+            async with hub.subscribe(7) as late:
+                snapshot = json.loads(await asyncio.wait_for(late.next(), 1))
+                assert snapshot == {"analysis_id": 7, "snapshot": True, "metrics": {**METRICS, "unique_ips": 4}}
+
+    asyncio.run(scenario())
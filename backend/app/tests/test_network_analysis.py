@@ -0,0 +1,117 @@
+import json
+import os
+import pytest
+from scapy.all import DNS, DNSQR, Ether, IP, TCP, UDP, wrpcap
+from sqlalchemy.orm import sessionmaker
+from core.config import settings
+from core.enums import AnalysisStatus
+from models import NetworkAnalysis, NetworkFlow
+from services import network_analysis
+
+# Explicit addresses keep scapy from looking up routes and MACs
+ETHER = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02")
+
+def write_capture(path, count=1200):
+    """Timestamped TCP, UDP and DNS traffic between a few dozen hosts."""
+    packets = []
+    for i in range(count):
+        src, dst = f"10.0.{i % 7}.{i % 31 + 1}", f"192.168.1.{i % 13 + 1}"
+        if i % 5 == 0:
+            pkt = ETHER / IP(src=src, dst="10.0.0.53") / UDP(sport=40000 + i % 50, dport=53) / DNS(
+                qd=DNSQR(qname=f"host{i % 17}.example.com")
+            )
+        elif i % 3 == 0:
+            pkt = ETHER / IP(src=dst, dst=src) / TCP(sport=443, dport=50000 + i % 40, flags="A")
+        else:
+            pkt = ETHER / IP(src=src, dst=dst) / TCP(sport=50000 + i % 40, dport=443, flags="S" if i < 40 else "A")
+        pkt.time = 1_700_000_000 + i * 0.01
+        packets.append(pkt)
+    wrpcap(str(path), packets)
+    return str(path)
+
+@pytest.fixture
+def file_id(db, analysis, monkeypatch, tmp_path):
+    """Uploaded capture file, with network tasks run eagerly against db and derived data under tmp_path."""
+    monkeypatch.setattr(network_analysis, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(network_analysis, "queue_layout", lambda analysis_id: None)
+    monkeypatch.setattr(settings, "ANALYSIS_DATA_DIR", str(tmp_path / "analysis_data"))
+    monkeypatch.setattr(network_analysis.app_celery.conf, "task_always_eager", True)
+    monkeypatch.setattr(network_analysis.app_celery.conf, "task_eager_propagates", True)
+    return analysis.file_id
+
+def test_layout_queue_failure_is_not_raised(monkeypatch, caplog):
+    def unreachable(analysis_id):
+        raise ConnectionError("broker unreachable")
+
+    monkeypatch.setattr(network_analysis.layout_network_task, "delay", unreachable)
+    network_analysis.queue_layout(3)
+    assert "Failed to queue topology layout for analysis 3" in caplog.text
+
+def test_large_captures_are_analyzed_by_shard_subtasks(db, file_id, monkeypatch, tmp_path):
+    pcap = write_capture(tmp_path / "capture.pcap")
+    monkeypatch.setattr(settings, "NETWORK_SHARD_MIN_SIZE", 1)
+    monkeypatch.setattr(settings, "NETWORK_ANALYSIS_WORKERS", 3)
+    merged = []
+    merge_shards = network_analysis.merge_shards
+
+    def record(shards, ranges, *args, **kwargs):
+        merged.append((shards, ranges))
+        return merge_shards(shards, ranges, *args, **kwargs)
+    monkeypatch.setattr(network_analysis, "merge_shards", record)
+
+    queued = network_analysis.analyze_network_task.delay(pcap, file_id).get()
+    assert queued["shards"] == 3
+    [(shards, ranges)] = merged
+    assert [shard["position"] for shard in shards] == [end for _, end in ranges]
+
+    analysis = db.get(NetworkAnalysis, queued["analysis_id"])
+    db.refresh(analysis)
+    assert analysis.status == AnalysisStatus.COMPLETED
+    assert analysis.packet_count == 1200
+    assert json.loads(analysis.result_json)["summary"]["packet_count"] == 1200
+    assert analysis.flow_count == db.query(NetworkFlow).filter_by(analysis_id=analysis.id).count()
+
+def analyze(db, pcap, file_id):
+    """Run analyze_network_task and return its analysis' results and flow rows."""
+    network_analysis.analyze_network_task.delay(pcap, file_id).get()
+    analysis_id = db.query(NetworkAnalysis).order_by(NetworkAnalysis.id.desc()).first().id
+    results = json.loads(db.get(NetworkAnalysis, analysis_id).result_json)
+    del results["timings"], results["metrics"]["timestamp"]
+    flows = [
+        tuple(getattr(flow, column.name) for column in NetworkFlow.__table__.columns if column.name not in ("id", "analysis_id"))
+        for flow in db.query(NetworkFlow).filter_by(analysis_id=analysis_id).order_by(NetworkFlow.id)
+    ]
+    return results, flows
+
+def test_sharded_analysis_matches_a_single_pass(db, file_id, monkeypatch, tmp_path):
+    pcap = write_capture(tmp_path / "capture.pcap", count=3000)
+    # Few sketch slots, so heavy hitters are evicted differently per shard
+    monkeypatch.setattr(settings, "SKETCH_CAPACITY", 8)
+    monkeypatch.setattr(settings, "PACKET_BATCH_SIZE", 256)
+    single = analyze(db, pcap, file_id)
+
+    monkeypatch.setattr(settings, "NETWORK_SHARD_MIN_SIZE", 1)
+    monkeypatch.setattr(settings, "NETWORK_ANALYSIS_WORKERS", 4)
+    sharded = analyze(db, pcap, file_id)
+    assert sharded[0] == single[0]
+    assert sharded[1] == single[1]
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_failed_analysis_leaves_no_derived_data(db, file_id, monkeypatch, tmp_path, shards):
+    pcap = write_capture(tmp_path / "capture.pcap", count=300)
+    monkeypatch.setattr(settings, "NETWORK_SHARD_MIN_SIZE", 1)
+    monkeypatch.setattr(settings, "NETWORK_ANALYSIS_WORKERS", shards)
+    written = []
+
+    def fail(db, analysis, analysis_dir, *args):
+        written.extend(os.listdir(analysis_dir))
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(network_analysis, "_complete_analysis", fail)
+
+    with pytest.raises(RuntimeError):
+        network_analysis.analyze_network_task.delay(pcap, file_id).get()
+    analysis = db.query(NetworkAnalysis).order_by(NetworkAnalysis.id.desc()).first()
+    db.refresh(analysis)
+    assert (analysis.status, analysis.error_message) == (AnalysisStatus.FAILED, "disk full")
+    assert written
+    assert not os.path.exists(os.path.join(settings.ANALYSIS_DATA_DIR, str(analysis.id)))
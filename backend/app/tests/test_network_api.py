@@ -0,0 +1,89 @@
+import os
+import json
+import numpy as np
+from api import network
+from models import NetworkNode, NetworkConnection
+from models.network import NodeType, NodeStatus
+from services.network_analysis import TrafficSummary
+from services.pcap_reader import PACKET_DTYPE, pack_ip
+from services.sketches import SKETCHES_FILENAME, save_sketches
+
+METRICS = {
+    "total_bytes": 4096,
+    "packets_per_second": 3.0,
+    "active_connections": 2,
+    "unique_ips": 3,
+    "protocols": {"TCP": 10, "UDP": 2},
+    "top_talkers": [{"ip": "10.0.0.1", "bytes": 3072}, {"ip": "10.0.0.2", "bytes": 1024}],
+    "timestamp": "2024-01-01T00:00:00"
+}
+
+def test_router_serves_network_endpoints():
+    paths = {route.path for route in network.router.routes}
+    assert "/api/v1/network/topology/{analysis_id}" in paths
+    assert "/api/v1/network/metrics/{analysis_id}" in paths
+
+def test_metrics_from_stored_results(client, db, analysis):
+    analysis.result_json = json.dumps({"metrics": METRICS})
+    db.commit()
+
+    response = client.get(f"/api/v1/network/metrics/{analysis.id}")
+    assert response.status_code == 200
+    assert response.json()["top_talkers"] == METRICS["top_talkers"]
+    assert response.json()["unique_ips"] == 3
+
+def test_metrics_not_recorded(client, analysis):
+    response = client.get(f"/api/v1/network/metrics/{analysis.id}")
+    assert response.status_code == 404
+
+def test_topology_of_stored_nodes(client, db, analysis):
+    nodes = [
+        NetworkNode(
+            analysis_id=analysis.id, node_id=ip, label=label, type=NodeType.HOST, status=NodeStatus.ACTIVE,
+            ip_address=ip, node_metadata={"hostnames": [label]}
+        )
+        for ip, label in (("10.0.0.1", "workstation"), ("10.0.0.2", "fileserver"))
+    ]
+    db.add_all(nodes)
+    db.flush()
+    db.add(NetworkConnection(
+        analysis_id=analysis.id, source_id=nodes[0].id, target_id=nodes[1].id,
+        protocol="TCP", port=445, bytes_transferred=1024, packets_transferred=8, flow_count=1
+    ))
+    db.commit()
+
+    response = client.get(f"/api/v1/network/topology/{analysis.id}")
+    assert response.status_code == 200
+    topology = response.json()
+    assert {node["id"] for node in topology["nodes"]} == {"10.0.0.1", "10.0.0.2"}
+    assert topology["nodes"][0]["metadata"] == {"hostnames": ["workstation"]}
+    assert topology["connections"][0]["source"] == "10.0.0.1"
+    assert topology["connections"][0]["target"] == "10.0.0.2"
+
+def test_topology_of_unknown_analysis(client):
+    assert client.get("/api/v1/network/topology/1").status_code == 404
+
+def test_packets_reject_invalid_address(client, analysis):
+    response = client.get(f"/api/v1/network/packets/{analysis.id}", params={"ip": "10.0.0.300"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid IP address: 10.0.0.300"
+
+def test_heavy_hitters_need_an_analysis(client):
+    response = client.get("/api/v1/network/heavy-hitters", params={"analysis_ids": ","})
+    assert response.status_code == 400
+
+def test_heavy_hitters_report_top_talkers(client, analysis, tmp_path, monkeypatch):
+    monkeypatch.setattr(network, "get_analysis_dir", lambda analysis_id, create=True: str(tmp_path))
+    packets = np.zeros(3, dtype=PACKET_DTYPE)
+    packets["ip_version"] = 4
+    packets["protocol"] = 6
+    packets["length"] = [100, 300, 50]
+    packets["src_ip"] = [pack_ip("10.0.0.1"), pack_ip("10.0.0.2"), pack_ip("10.0.0.1")]
+    packets["dst_ip"] = pack_ip("10.0.0.3")
+    summary = TrafficSummary()
+    summary.add_batch(packets)
+    save_sketches(os.path.join(str(tmp_path), SKETCHES_FILENAME), summary.sketches())
+
+    response = client.get("/api/v1/network/heavy-hitters", params={"analysis_ids": str(analysis.id)})
+    assert response.status_code == 200
+    assert response.json()["top_talkers"] == [{"ip": "10.0.0.2", "bytes": 300}, {"ip": "10.0.0.1", "bytes": 150}]
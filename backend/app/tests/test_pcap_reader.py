@@ -0,0 +1,152 @@
+import random
+import numpy as np
+import pytest
+from scapy.all import ARP, Ether, ICMP, IP, IPv6, Raw, TCP, UDP, wrpcap, wrpcapng
+from services.pcap_reader import (
+    CaptureFormatError, PcapReader, PCAP_HEADER_LEN, PCAP_RECORD_HEADER_LEN, format_ip, pack_ip
+)
+
+START = 1_700_000_000
+# Explicit addresses keep scapy from looking up routes and MACs
+ETHER = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02")
+
+def sample_packets():
+    packets = [
+        ETHER / IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=51000, dport=443, flags="SA") / Raw(b"hello"),
+        ETHER / IPv6(src="2001:db8::1", dst="2001:db8::2") / UDP(sport=5353, dport=53) / Raw(b"query"),
+        ETHER / IP(src="192.168.1.5", dst="8.8.8.8") / ICMP(),
+        ETHER / ARP(psrc="10.0.0.1", pdst="10.0.0.2"),
+    ]
+    for i, pkt in enumerate(packets):
+        pkt.time = START + i + 0.25
+    return packets
+
+def read_all(path, **options):
+    with PcapReader(path) as reader:
+        batches = list(reader.iter_batches(**options))
+        return (np.concatenate(batches) if batches else np.zeros(0)), reader.position
+
+def record_offsets(packets):
+    """Record offsets of packets written with wrpcap, and the file size."""
+    offsets = [PCAP_HEADER_LEN]
+    for pkt in packets:
+        offsets.append(offsets[-1] + PCAP_RECORD_HEADER_LEN + len(bytes(pkt)))
+    return offsets[:-1], offsets[-1]
+
+def test_addresses_round_trip_in_packed_form():
+    assert pack_ip("10.0.0.1") == b"\x00" * 10 + b"\xff\xff\x0a\x00\x00\x01"
+    assert format_ip(pack_ip("10.0.0.1")) == "10.0.0.1"
+    assert format_ip(pack_ip("2001:db8::1")) == "2001:db8::1"
+
+def test_packet_fields_are_decoded(tmp_path):
+    packets = sample_packets()
+    path = str(tmp_path / "sample.pcap")
+    wrpcap(path, packets)
+    decoded, _ = read_all(path)
+    offsets, _ = record_offsets(packets)
+
+    assert decoded.size == 4
+    assert decoded["ts"].tolist() == pytest.approx([START + i + 0.25 for i in range(4)])
+    assert decoded["offset"].tolist() == offsets
+    assert decoded["length"].tolist() == decoded["caplen"].tolist() == [len(bytes(pkt)) for pkt in packets]
+
+    tcp, udp, icmp, arp = decoded
+    assert (format_ip(tcp["src_ip"]), format_ip(tcp["dst_ip"])) == ("10.0.0.1", "10.0.0.2")
+    assert (tcp["src_port"], tcp["dst_port"], tcp["protocol"], tcp["ip_version"]) == (51000, 443, 6, 4)
+    assert tcp["tcp_flags"] == 0x12
+    assert (format_ip(udp["src_ip"]), format_ip(udp["dst_ip"])) == ("2001:db8::1", "2001:db8::2")
+    assert (udp["src_port"], udp["dst_port"], udp["protocol"], udp["ip_version"]) == (5353, 53, 17, 6)
+    assert (icmp["protocol"], icmp["ip_version"], icmp["src_port"]) == (1, 4, 0)
+    assert (arp["protocol"], arp["ip_version"]) == (0, 0)
+    with PcapReader(path) as reader:
+        assert reader.payloads(decoded[:2]) == [b"hello", b"query"]
+
+def test_pcap_and_pcapng_decode_alike(tmp_path):
+    packets = sample_packets()
+    pcap, pcapng = str(tmp_path / "sample.pcap"), str(tmp_path / "sample.pcapng")
+    wrpcap(pcap, packets)
+    wrpcapng(pcapng, packets)
+    with PcapReader(pcap) as reader:
+        assert reader.format == "pcap"
+    with PcapReader(pcapng) as reader:
+        assert reader.format == "pcapng"
+
+    from_pcap, _ = read_all(pcap)
+    from_pcapng, _ = read_all(pcapng)
+    # Only the record layout differs between the formats
+    fields = [name for name in from_pcap.dtype.names if name not in ("offset", "record_len", "data_offset")]
+    for name in fields:
+        assert from_pcapng[name].tolist() == pytest.approx(from_pcap[name].tolist()), name
+    with PcapReader(pcapng) as reader:
+        assert reader.payloads(from_pcapng[:2]) == [b"hello", b"query"]
+
+def test_truncated_record_stops_the_read(tmp_path, caplog):
+    packets = sample_packets()
+    path = tmp_path / "sample.pcap"
+    wrpcap(str(path), packets)
+    offsets, size = record_offsets(packets)
+    path.write_bytes(path.read_bytes()[:size - 3])
+
+    decoded, position = read_all(str(path))
+    assert decoded.size == 3
+    assert position == offsets[-1]
+    assert "Truncated record" in caplog.text
+
+    caplog.clear()
+    decoded, position = read_all(str(path), allow_truncated=True)
+    assert decoded.size == 3 and position == offsets[-1]
+    assert "Truncated record" not in caplog.text
+
+def test_corrupt_and_foreign_files_are_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a capture at all, just text")
+    with pytest.raises(CaptureFormatError):
+        PcapReader(str(path))
+
+    capture = tmp_path / "corrupt.pcap"
+    wrpcap(str(capture), sample_packets())
+    data = bytearray(capture.read_bytes())
+    data[PCAP_HEADER_LEN + 8:PCAP_HEADER_LEN + 12] = (0x7FFFFFFF).to_bytes(4, "little")
+    capture.write_bytes(bytes(data))
+    with pytest.raises(CaptureFormatError):
+        read_all(str(capture))
+
+def varied_packets(count=400):
+    rng = random.Random(7)
+    packets = []
+    for i in range(count):
+        # Random payloads make byte patterns that look like record headers
+        payload = bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 300)))
+        pkt = ETHER / IP(src=f"10.1.0.{i % 200 + 1}", dst="10.2.0.1") / UDP(sport=1024 + i, dport=9999) / Raw(payload)
+        pkt.time = START + i * 0.001
+        packets.append(pkt)
+    return packets
+
+def test_record_boundaries_are_found_from_any_offset(tmp_path):
+    packets = varied_packets()
+    path = str(tmp_path / "varied.pcap")
+    wrpcap(path, packets)
+    offsets, size = record_offsets(packets)
+    with PcapReader(path) as reader:
+        for offset in range(PCAP_HEADER_LEN, size, 997):
+            expected = next((o for o in offsets if o >= offset), size)
+            assert reader.find_record_boundary(offset) == expected
+
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+def test_shard_ranges_cover_every_record_once(tmp_path, writer):
+    packets = varied_packets()
+    path = str(tmp_path / "varied.cap")
+    writer(path, packets)
+    whole, _ = read_all(path)
+    with PcapReader(path) as reader:
+        ranges = reader.shard_ranges(4)
+        assert len(ranges) == 4
+        assert ranges[0][0] == reader.data_start and ranges[-1][1] == reader.size
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+        shards = []
+        for start, end in ranges:
+            shards += list(reader.iter_batches(start=start, end=end))
+            assert reader.position == end
+    sharded = np.concatenate(shards)
+    assert sharded["offset"].tolist() == whole["offset"].tolist()
+    assert sharded["src_port"].tolist() == whole["src_port"].tolist()
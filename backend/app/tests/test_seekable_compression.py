@@ -0,0 +1,27 @@
+import os
+from utils.seekable_compression import MAGIC, compress_file, is_compressed_evidence, open_evidence
+
+def test_container_round_trip(tmp_path):
+    raw = tmp_path / "capture.pcap"
+    raw.write_bytes(os.urandom(200_000))
+    container = tmp_path / "capture.pcap.mfsz"
+    compress_file(str(raw), str(container), frame_size=65536)
+
+    assert is_compressed_evidence(str(container))
+    with open_evidence(str(container)) as f:
+        assert f.read() == raw.read_bytes()
+
+def test_raw_file_starting_with_magic_is_not_a_container(tmp_path):
+    raw = tmp_path / "memory.raw"
+    raw.write_bytes(MAGIC + os.urandom(5000))
+    assert not is_compressed_evidence(str(raw))
+    with open_evidence(str(raw)) as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+def test_truncated_container_is_not_a_container(tmp_path):
+    raw = tmp_path / "capture.pcap"
+    raw.write_bytes(os.urandom(100_000))
+    container = tmp_path / "capture.pcap.mfsz"
+    compress_file(str(raw), str(container), frame_size=65536)
+    container.write_bytes(container.read_bytes()[:-1])
+    assert not is_compressed_evidence(str(container))
@@ -0,0 +1,134 @@
+import json
+import numpy as np
+import pytest
+from services.sketches import (
+    CountMinSketch, HyperLogLog, SpaceSaving, load_sketches, merge_sketches, save_sketches, sketch_from_dict
+)
+
+def zipf_stream(size=50_000, seed=3):
+    """Skewed integer keys, as ports or talkers are in real traffic."""
+    return np.random.default_rng(seed).zipf(1.3, size) % 5000
+
+def true_counts(keys, weights=None):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return dict(zip(unique.tolist(), np.bincount(inverse, weights=weights).astype(np.int64).tolist()))
+
+def round_trip(sketch):
+    return sketch_from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+def assert_space_saving_bounds(sketch, truth, total):
+    """Counts overestimate by at most their error, errors by at most total / capacity."""
+    for key, count, error in zip(sketch.keys.tolist(), sketch.counts.tolist(), sketch.errors.tolist()):
+        assert count - error <= truth.get(key, 0) <= count
+        assert error <= total / sketch.capacity
+    # Every key heavier than total / capacity is tracked
+    tracked = set(sketch.keys.tolist())
+    assert all(key in tracked for key, count in truth.items() if count > total / sketch.capacity)
+
+def test_space_saving_error_bound():
+    keys = zipf_stream()
+    sketch = SpaceSaving(64, dtype="<u2")
+    for start in range(0, keys.size, 1000):
+        sketch.update(keys[start:start + 1000].astype(np.uint16))
+    assert sketch.keys.size == 64
+    assert_space_saving_bounds(sketch, true_counts(keys), keys.size)
+    assert list(sketch.counts) == sorted(sketch.counts, reverse=True)
+
+def test_space_saving_is_exact_below_capacity():
+    sketch = SpaceSaving(16, dtype="S16")
+    keys = np.array([b"a", b"b", b"a", b"c", b"a", b"b"], dtype="S16")
+    sketch.update(keys[:3], np.array([10, 1, 10]))
+    sketch.update(keys[3:], np.array([5, 10, 2]))
+    assert sketch.top(3) == [(b"a", 30), (b"c", 5), (b"b", 3)]
+    assert sketch.errors.tolist() == [0, 0, 0]
+
+def test_space_saving_merge_keeps_the_bound():
+    keys = zipf_stream(seed=4).astype(np.uint16)
+    merged = SpaceSaving(64, dtype="<u2")
+    for shard in np.array_split(keys, 5):
+        part = SpaceSaving(64, dtype="<u2")
+        for start in range(0, shard.size, 1000):
+            part.update(shard[start:start + 1000])
+        merged.merge(part)
+    assert_space_saving_bounds(merged, true_counts(keys), keys.size)
+
+@pytest.mark.parametrize("dtype, keys", [
+    ("S16", np.array([b"\x00" * 12 + b"\x0a\x00\x00\x01", b"\x20\x01" + b"\x00" * 14], dtype="S16")),
+    ("<u2", np.array([443, 53], dtype="<u2")),
+    (object, np.array(["example.com", "bücher.example"], dtype=object)),
+])
+def test_space_saving_round_trips_through_json(dtype, keys):
+    sketch = SpaceSaving(8, dtype=dtype)
+    sketch.update(keys, np.array([7, 3]))
+    restored = round_trip(sketch)
+    assert restored.capacity == 8
+    assert restored.keys.tolist() == sketch.keys.tolist()
+    assert restored.counts.tolist() == [7, 3] and restored.errors.tolist() == [0, 0]
+
+def test_count_min_overestimates_within_its_bound():
+    keys = zipf_stream()
+    weights = np.random.default_rng(5).integers(40, 1500, keys.size)
+    sketch = CountMinSketch(width=2048, depth=4)
+    for start in range(0, keys.size, 1000):
+        sketch.update(keys[start:start + 1000], weights[start:start + 1000])
+    truth = true_counts(keys, weights)
+    estimates = sketch.query(np.array(list(truth)))
+    exact = np.array(list(truth.values()))
+    assert (estimates >= exact).all()
+    # With probability 1 - e^-depth per key, the excess is at most e / width of the total
+    within = estimates - exact <= np.e / sketch.width * weights.sum()
+    assert within.mean() >= 0.95
+
+def test_count_min_merge_equals_one_sketch():
+    keys = zipf_stream(seed=6)
+    whole = CountMinSketch(width=1024)
+    whole.update(keys)
+    merged = CountMinSketch(width=1024)
+    for shard in np.array_split(keys, 3):
+        part = CountMinSketch(width=1024)
+        part.update(shard)
+        merged.merge(part)
+    assert (merged.table == whole.table).all()
+    restored = round_trip(merged)
+    assert (restored.table == whole.table).all()
+    with pytest.raises(ValueError):
+        merged.merge(CountMinSketch(width=512))
+
+@pytest.mark.parametrize("distinct", [100, 5_000, 200_000])
+def test_hyperloglog_estimate_is_within_its_error(distinct):
+    keys = np.arange(distinct, dtype=np.int64).astype("S16")
+    sketch = HyperLogLog(precision=12)
+    # Repeats do not count twice
+    sketch.update(keys)
+    sketch.update(keys[: distinct // 2])
+    standard_error = 1.04 / np.sqrt(1 << 12)
+    assert abs(sketch.count() - distinct) <= max(3 * standard_error * distinct, 2)
+
+def test_hyperloglog_merge_counts_the_union():
+    first = np.arange(0, 30_000).astype("S16")
+    second = np.arange(20_000, 50_000).astype("S16")
+    union = HyperLogLog()
+    union.update(np.concatenate([first, second]))
+    merged, other = HyperLogLog(), HyperLogLog()
+    merged.update(first)
+    other.update(second)
+    merged.merge(other)
+    assert (merged.registers == union.registers).all()
+    assert round_trip(merged).count() == union.count()
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(precision=10))
+
+def test_saved_sketch_sets_merge_without_changing_their_inputs(tmp_path):
+    groups = []
+    for i, keys in enumerate((np.array([b"a", b"b"], dtype="S16"), np.array([b"b", b"c"], dtype="S16"))):
+        talkers, distinct = SpaceSaving(4, dtype="S16"), HyperLogLog()
+        talkers.update(keys)
+        distinct.update(keys)
+        path = str(tmp_path / f"sketches{i}.json")
+        save_sketches(path, {"top_talkers": talkers, "distinct_ips": distinct})
+        groups.append(load_sketches(path))
+
+    merged = merge_sketches(groups)
+    assert merged["top_talkers"].top(3) == [(b"b", 2), (b"a", 1), (b"c", 1)]
+    assert merged["distinct_ips"].count() == 3
+    assert groups[0]["top_talkers"].top(3) == [(b"a", 1), (b"b", 1)]
@@ -0,0 +1,156 @@
+import ipaddress
+import os
+import random
+import numpy as np
+import pytest
+from api import network
+from core.config import settings
+from services.pcap_reader import pack_ip
+from services.topology_builder import EDGE_DTYPE, TopologyEdges
+from services.topology_levels import (
+    HIERARCHIES, HOST_LEVEL, SUBNET_PREFIXES, TopologyLevels, TopologyLevelsCache, topology_levels_path
+)
+from utils.analysis_storage import get_analysis_dir
+
+HOSTS = [
+    "10.1.1.1", "10.1.1.2", "10.1.2.1", "10.2.0.1", "192.168.0.9",
+    "2001:db8:0:1::1", "2001:db8:0:2::1", "2001:db9::1",
+]
+
+def topology(hosts, pairs):
+    """TopologyEdges over hosts (sorted like aggregate_edges) from (src, dst, bytes) rows."""
+    addresses = np.array(sorted(pack_ip(host) for host in hosts), dtype="S16")
+    index = {address: i for i, address in enumerate(addresses.tolist())}
+    edges = np.zeros(len(pairs), dtype=EDGE_DTYPE)
+    for i, (src, dst, size) in enumerate(pairs):
+        edges[i] = (index[pack_ip(src).rstrip(b"\0")], index[pack_ip(dst).rstrip(b"\0")], 6, 443, 2, 10, size, 0.0, 1.0)
+    return TopologyEdges(addresses, edges)
+
+def random_topology(seed, count=60):
+    rng = random.Random(seed)
+    hosts = sorted({
+        f"10.{rng.randint(0, 2)}.{rng.randint(0, 3)}.{rng.randint(1, 254)}" if rng.random() < 0.7
+        else f"2001:db8:{rng.randint(0, 1):x}:{rng.randint(0, 2):x}::{rng.randint(1, 0xffff):x}"
+        for _ in range(count)
+    })
+    pairs = [(rng.choice(hosts), rng.choice(hosts), rng.randint(1, 5000)) for _ in range(count * 3)]
+    return hosts, topology(hosts, pairs)
+
+def subnet_of(host, level):
+    v4_length, v6_length = SUBNET_PREFIXES[level]
+    address = ipaddress.ip_address(host)
+    return str(ipaddress.ip_network(f"{host}/{v4_length if address.version == 4 else v6_length}", strict=False))
+
+def brute_force_expand(hosts, pairs, group, depth):
+    """Edge bytes of an expanded subnet group, resolving both ends of every host edge."""
+    levels = HIERARCHIES["subnet"]
+    member = next(host for host in hosts if subnet_of(host, levels[depth]) == group)
+    path = [subnet_of(member, level) for level in levels[:depth + 1]]
+
+    def shown(host):
+        # The first group on the host's path that differs, else its child
+        for level, expanded in zip(levels, path):
+            if subnet_of(host, level) != expanded:
+                return subnet_of(host, level)
+        return subnet_of(host, levels[depth + 1]) if depth + 1 < len(levels) else host
+
+    totals = {}
+    for src, dst, size in pairs:
+        if group not in (subnet_of(src, levels[depth]), subnet_of(dst, levels[depth])):
+            continue
+        ends = (shown(src), shown(dst))
+        if ends[0] != ends[1]:
+            totals[ends] = totals.get(ends, 0) + size
+    return totals
+
+def edge_bytes(view):
+    return {(edge["source"], edge["target"]): edge["bytes"] for edge in view["edges"]}
+
+def test_subnet_levels_group_and_aggregate_hosts():
+    levels = TopologyLevels.build(topology(HOSTS, [
+        ("10.1.1.1", "10.1.1.2", 100),
+        ("10.1.1.1", "10.1.2.1", 200),
+        ("10.1.1.2", "10.2.0.1", 300),
+        ("10.1.1.2", "10.2.0.1", 50),
+        ("2001:db8:0:1::1", "2001:db8:0:2::1", 400),
+        ("192.168.0.9", "2001:db9::1", 500),
+    ]))
+    top = levels.top("subnet")
+    assert top["level"] == "network"
+    assert {node["id"]: node["size"] for node in top["nodes"]} == {
+        "10.1.0.0/16": 3, "10.2.0.0/16": 1, "192.168.0.0/16": 1, "2001:db8::/32": 2, "2001:db9::/32": 1
+    }
+    assert edge_bytes(top) == {("10.1.0.0/16", "10.2.0.0/16"): 350, ("192.168.0.0/16", "2001:db9::/32"): 500}
+    [edge] = [e for e in top["edges"] if e["source"] == "10.1.0.0/16"]
+    assert (edge["connections"], edge["flows"], edge["packets"]) == (2, 4, 20)
+
+    network = levels.expand("subnet", "10.1.0.0/16")
+    assert network["level"] == "subnet"
+    assert [node["id"] for node in network["nodes"]] == ["10.1.1.0/24", "10.1.2.0/24"]
+    assert edge_bytes(network) == {("10.1.1.0/24", "10.1.2.0/24"): 200, ("10.1.1.0/24", "10.2.0.0/16"): 350}
+
+    subnet = levels.expand("subnet", "10.1.1.0/24")
+    assert subnet["level"] == HOST_LEVEL
+    assert [(node["id"], node["bytes"], node["expandable"]) for node in subnet["nodes"]] == [
+        ("10.1.1.1", 300, False), ("10.1.1.2", 450, False)
+    ]
+    assert edge_bytes(subnet) == {
+        ("10.1.1.1", "10.1.1.2"): 100, ("10.1.1.1", "10.1.2.0/24"): 200, ("10.1.1.2", "10.2.0.0/16"): 350
+    }
+    with pytest.raises(KeyError):
+        levels.expand("subnet", "10.9.0.0/16")
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_expanded_edges_match_a_brute_force_resolution(seed):
+    hosts, edges = random_topology(seed)
+    levels = TopologyLevels.build(edges)
+    assert sorted(levels.node_ids) == sorted(str(ipaddress.ip_address(host)) for host in hosts)
+    pairs = [
+        (levels.node_ids[src], levels.node_ids[dst], size)
+        for src, dst, size in zip(edges.edges["src"].tolist(), edges.edges["dst"].tolist(), edges.edges["bytes"].tolist())
+    ]
+    for depth, level in enumerate(HIERARCHIES["subnet"]):
+        for group in levels.labels[level]:
+            assert edge_bytes(levels.expand("subnet", group)) == brute_force_expand(levels.node_ids, pairs, group, depth)
+
+def test_communities_partition_the_hosts(tmp_path):
+    hosts, edges = random_topology(3)
+    levels = TopologyLevels.build(edges)
+    top = levels.top("community")
+    assert sum(node["size"] for node in top["nodes"]) == len(hosts)
+    members = []
+    for node in top["nodes"]:
+        expanded = levels.expand("community", node["id"])
+        assert expanded["level"] == HOST_LEVEL and len(expanded["nodes"]) == node["size"]
+        members += [child["id"] for child in expanded["nodes"]]
+    assert sorted(members) == sorted(levels.node_ids)
+
+    path = str(tmp_path / "topology_levels.npz")
+    levels.save(path)
+    loaded = TopologyLevels.load(path)
+    for hierarchy in HIERARCHIES:
+        assert loaded.top(hierarchy) == levels.top(hierarchy)
+    assert loaded.expand("subnet", levels.labels["subnet"][0]) == levels.expand("subnet", levels.labels["subnet"][0])
+
+def test_endpoint_serves_levels_from_the_cache(client, analysis, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "ANALYSIS_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(network.network_service, "topology_levels", TopologyLevelsCache(size=1))
+    url = f"/api/v1/network/topology/{analysis.id}/levels"
+    assert client.get(url).json() == {"detail": "No topology levels stored for this analysis"}
+
+    path = topology_levels_path(get_analysis_dir(analysis.id))
+    TopologyLevels.build(topology(HOSTS, [("10.1.1.1", "10.2.0.1", 100)])).save(path)
+    loads = []
+    load = TopologyLevels.load
+    monkeypatch.setattr(TopologyLevels, "load", lambda path: loads.append(path) or load(path))
+    assert edge_bytes(client.get(url).json()) == {("10.1.0.0/16", "10.2.0.0/16"): 100}
+    assert client.get(url, params={"group": "10.1.0.0/16"}).json()["level"] == "subnet"
+    assert client.get(url, params={"group": "10.9.0.0/16"}).json() == {"detail": "Group not found"}
+    assert loads == [path]
+
+    # A rebuilt topology is picked up on the next request
+    TopologyLevels.build(topology(HOSTS, [("10.1.1.1", "10.2.0.1", 700)])).save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert edge_bytes(client.get(url).json()) == {("10.1.0.0/16", "10.2.0.0/16"): 700}
+    assert loads == [path, path]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from core.enums import AnalysisStatus
+from services import visualization
+from services.pcap_reader import PACKET_DTYPE, pack_ip
+from services.timeseries import TimeSeriesBuilder, TimeSeriesError, timeseries_dir
+from services.visualization import VisualizationService
+
+@pytest.fixture
+def analysis_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(visualization, "get_analysis_dir", lambda analysis_id, create=True: str(tmp_path))
+    return str(tmp_path)
+
+def test_series_of_followed_capture_in_progress(db, analysis, analysis_dir):
+    analysis.status = AnalysisStatus.IN_PROGRESS
+    db.commit()
+    packets = np.zeros(3, dtype=PACKET_DTYPE)
+    packets["ts"] = [1_700_000_000.0, 1_700_000_001.0, 1_700_000_002.0]
+    packets["length"] = 100
+    packets["ip_version"] = 4
+    packets["protocol"] = 6
+    packets["src_ip"] = pack_ip("10.0.0.1")
+    packets["dst_ip"] = pack_ip("10.0.0.2")
+    builder = TimeSeriesBuilder()
+    builder.add_batch(packets)
+    builder.write(timeseries_dir(analysis_dir))
+
+    data = VisualizationService(db).generate_timeseries_data(analysis.id, "bytes")
+    assert sum(data["values"]) == 300
+
+def test_series_not_written_yet(db, analysis, analysis_dir):
+    analysis.status = AnalysisStatus.IN_PROGRESS
+    db.commit()
+    with pytest.raises(TimeSeriesError):
+        VisualizationService(db).generate_timeseries_data(analysis.id, "bytes")
+
+def test_series_of_unknown_analysis(db):
+    assert VisualizationService(db).generate_timeseries_data(1, "bytes") is None
@@ -0,0 +1,23 @@
+import os
+import shutil
+import logging
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def get_analysis_dir(analysis_id: int, create: bool = True) -> str:
+    """Return the directory holding derived data files for an analysis."""
+    path = os.path.join(settings.ANALYSIS_DATA_DIR, str(analysis_id))
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+def remove_analysis_dir(analysis_id: int) -> None:
+    """Delete all derived data files of an analysis."""
+    path = get_analysis_dir(analysis_id, create=False)
+    try:
+        shutil.rmtree(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove analysis data {path}: {str(e)}")
@@ -0,0 +1,297 @@
+import io
+import os
+import zlib
+import shutil
+import struct
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Container layout:
+#   header  | frame 0 | frame 1 | ... | frame N-1 | index | footer
+# Every frame holds FRAME_SIZE bytes of the original file (the last one may be
+# shorter) compressed on its own, so any offset can be served by decompressing
+# a single frame. The index stores (offset, stored_length, flags) per frame.
+MAGIC = b"MFSZ"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")      # magic, version, codec, reserved, frame_size
+INDEX_ENTRY = struct.Struct("<QII")    # offset, stored_length, flags
+FOOTER = struct.Struct("<QQQ4s")       # index_offset, raw_size, frame_count, magic
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+FLAG_STORED = 1  # frame did not compress and is stored as-is
+
+class SeekableCompressionError(Exception):
+    """Raised when a compressed evidence container is malformed."""
+    pass
+
+def _compressor(codec: int, level: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise SeekableCompressionError("zstandard is required for this container")
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, level)
+
+def _decompressor(codec: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise SeekableCompressionError("zstandard is required to read this container")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+def default_codec() -> int:
+    """Prefer zstd when installed, otherwise fall back to zlib."""
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+class SeekableCompressedWriter(io.RawIOBase):
+    """Write a file as independently compressed fixed-size frames."""
+
+    def __init__(
+        self,
+        path: str,
+        frame_size: Optional[int] = None,
+        codec: Optional[int] = None,
+        level: Optional[int] = None
+    ):
+        self.frame_size = frame_size or settings.EVIDENCE_FRAME_SIZE
+        self.codec = default_codec() if codec is None else codec
+        level = settings.EVIDENCE_COMPRESSION_LEVEL if level is None else level
+        self._compress = _compressor(self.codec, level)
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.codec, 0, self.frame_size))
+        self._buffer = bytearray()
+        self._index: List[Tuple[int, int, int]] = []
+        self._raw_size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        while len(self._buffer) >= self.frame_size:
+            self._flush_frame(bytes(self._buffer[:self.frame_size]))
+            del self._buffer[:self.frame_size]
+        return len(data)
+
+    def _flush_frame(self, frame: bytes) -> None:
+        compressed = self._compress(frame)
+        flags = 0
+        if len(compressed) >= len(frame):
+            compressed, flags = frame, FLAG_STORED
+        self._index.append((self._file.tell(), len(compressed), flags))
+        self._file.write(compressed)
+        self._raw_size += len(frame)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._flush_frame(bytes(self._buffer))
+                self._buffer.clear()
+            index_offset = self._file.tell()
+            for entry in self._index:
+                self._file.write(INDEX_ENTRY.pack(*entry))
+            self._file.write(FOOTER.pack(index_offset, self._raw_size, len(self._index), MAGIC))
+        finally:
+            self._file.close()
+            super().close()
+
+class SeekableCompressedReader(io.RawIOBase):
+    """
+    File-like reader over a seekable compressed container.
+
+    Supports read/seek/tell like the original file. Decompressed frames are
+    kept in a small LRU cache so sequential and nearby random reads only
+    decompress each frame once.
+    """
+
+    def __init__(self, path: str, cache_frames: Optional[int] = None):
+        self.path = path
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._cache_frames = cache_frames or settings.EVIDENCE_CACHE_FRAMES
+        self._position = 0
+        try:
+            self._load_index()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _load_index(self) -> None:
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise SeekableCompressionError(f"Truncated container: {self.path}")
+        magic, version, codec, _, frame_size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise SeekableCompressionError(f"Not a compressed evidence container: {self.path}")
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, raw_size, frame_count, footer_magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if footer_magic != MAGIC:
+            raise SeekableCompressionError(f"Container footer is corrupt: {self.path}")
+        self._file.seek(index_offset)
+        index_bytes = self._file.read(frame_count * INDEX_ENTRY.size)
+        self._index = list(INDEX_ENTRY.iter_unpack(index_bytes))
+        self.frame_size = frame_size
+        self.size = raw_size
+        self._decompress = _decompressor(codec)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self._position = position
+        return position
+
+    def _frame(self, number: int) -> bytes:
+        with self._lock:
+            frame = self._cache.get(number)
+            if frame is not None:
+                self._cache.move_to_end(number)
+                return frame
+            offset, length, flags = self._index[number]
+            self._file.seek(offset)
+            data = self._file.read(length)
+            frame = data if flags & FLAG_STORED else self._decompress(data)
+            self._cache[number] = frame
+            if len(self._cache) > self._cache_frames:
+                self._cache.popitem(last=False)
+            return frame
+
+    def pread(self, offset: int, size: int) -> bytes:
+        """Read size bytes at offset without moving the file position."""
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b""
+        chunks = []
+        while offset < end:
+            number, start = divmod(offset, self.frame_size)
+            frame = self._frame(number)
+            chunk = frame[start:start + (end - offset)]
+            chunks.append(chunk)
+            offset += len(chunk)
+        return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._position
+        data = self.pread(self._position, size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            self._cache.clear()
+        super().close()
+
+def is_compressed_evidence(path: str) -> bool:
+    """
+    Check whether a stored file is a seekable compressed container.
+
+    Raw evidence may start with the magic by chance, so the header, the
+    footer and the index they describe must all agree with the file size.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size + FOOTER.size:
+                return False
+            magic, version, codec, _, frame_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or codec not in (CODEC_ZLIB, CODEC_ZSTD) or not frame_size:
+                return False
+            f.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, raw_size, frame_count, footer_magic = FOOTER.unpack(f.read(FOOTER.size))
+    except OSError:
+        return False
+    return (
+        footer_magic == MAGIC
+        and index_offset >= HEADER.size
+        and index_offset + frame_count * INDEX_ENTRY.size + FOOTER.size == size
+        and frame_count == -(-raw_size // frame_size)
+    )
+
+def open_evidence(path: str) -> BinaryIO:
+    """Open stored evidence for reading, transparently decompressing containers."""
+    if is_compressed_evidence(path):
+        return io.BufferedReader(SeekableCompressedReader(path), buffer_size=64 * 1024)
+    return open(path, "rb")
+
+def evidence_size(path: str) -> int:
+    """Return the original (uncompressed) size of stored evidence."""
+    if is_compressed_evidence(path):
+        with open(path, "rb") as f:
+            f.seek(-FOOTER.size, os.SEEK_END)
+            return FOOTER.unpack(f.read(FOOTER.size))[1]
+    return os.path.getsize(path)
+
+def compress_file(source_path: str, target_path: str, **kwargs) -> int:
+    """Compress a raw file into a seekable container and return the stored size."""
+    with open(source_path, "rb") as src, SeekableCompressedWriter(target_path, **kwargs) as dst:
+        shutil.copyfileobj(src, dst, length=1024 * 1024)
+    return os.path.getsize(target_path)
+
+@contextmanager
+def materialized_evidence(path: str) -> Iterator[str]:
+    """
+    Yield a path to the raw evidence bytes.
+
+    External tools (tshark, volatility) need a real file. Raw files are
+    passed through untouched; containers are expanded to a temporary file
+    that is removed afterwards.
+    """
+    if not is_compressed_evidence(path):
+        yield path
+        return
+
+    temp_file = tempfile.NamedTemporaryFile(prefix="evidence_", delete=False)
+    try:
+        with temp_file, open_evidence(path) as src:
+            shutil.copyfileobj(src, temp_file, length=1024 * 1024)
+        logger.debug(f"Materialized compressed evidence {path} to {temp_file.name}")
+        yield temp_file.name
+    finally:
+        try:
+            os.remove(temp_file.name)
+        except OSError as e:
+            logger.warning(f"Failed to remove temporary evidence {temp_file.name}: {str(e)}")
@@ -0,0 +1,43 @@
+import os
+import uuid
+import logging
+from core.config import settings
+from utils.seekable_compression import SeekableCompressedWriter
+
+logger = logging.getLogger(__name__)
+
+def build_evidence_path(filename: str) -> str:
+    """Return a unique path under UPLOAD_DIR for a sanitized filename."""
+    return os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
+
+def save_evidence(content: bytes, filename: str) -> str:
+    """
+    Persist uploaded evidence to local storage.
+
+    Args:
+        content: Raw file bytes
+        filename: Sanitized filename
+
+    Returns:
+        Path of the stored file
+    """
+    path = build_evidence_path(filename)
+    if settings.EVIDENCE_COMPRESSION and len(content) >= settings.EVIDENCE_COMPRESSION_MIN_SIZE:
+        # Large evidence is stored as a seekable compressed container;
+        # readers go through utils.seekable_compression.open_evidence.
+        with SeekableCompressedWriter(path) as f:
+            f.write(content)
+    else:
+        with open(path, "wb") as f:
+            f.write(content)
+    logger.debug(f"Stored evidence {filename} at {path}")
+    return path
+
+def delete_evidence(path: str) -> None:
+    """Remove a stored evidence file, ignoring files that are already gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to delete evidence file {path}: {str(e)}")
@@ -0,0 +1,44 @@
+import numpy as np
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+def splitmix64(values: np.ndarray) -> np.ndarray:
+    """Vectorized splitmix64 finalizer over a uint64 array."""
+    z = values.astype(np.uint64) + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+def packed_words(column: np.ndarray) -> np.ndarray:
+    """View a fixed-width bytes column (e.g. S16 addresses) as rows of uint64 words."""
+    width = column.dtype.itemsize
+    raw = np.ascontiguousarray(column).view(np.uint8).reshape(-1, width)
+    if width % 8:
+        raw = np.pad(raw, ((0, 0), (0, 8 - width % 8)))
+    return np.ascontiguousarray(raw).view("<u8")
+
+def hash_columns(*columns: np.ndarray, seed: int = 0) -> np.ndarray:
+    """
+    Hash rows made of several columns into uint64 values.
+
+    Integer columns are mixed in directly; fixed-width bytes columns are
+    mixed word by word.
+    """
+    n = len(columns[0])
+    h = np.full(n, np.uint64(seed), dtype=np.uint64)
+    for column in columns:
+        if column.dtype.kind in ("S", "V"):
+            for word in packed_words(column).T:
+                h = splitmix64(h ^ word)
+        else:
+            h = splitmix64(h ^ column.astype(np.uint64))
+    return h
+
+def hash_strings(values, seed: int = 0) -> np.ndarray:
+    """Hash a sequence of str values into uint64 values."""
+    encoded = np.array([v.encode("utf-8") for v in values] or [b""], dtype=bytes)
+    if not len(values):
+        return np.zeros(0, dtype=np.uint64)
+    return hash_columns(encoded, seed=seed)